@@ -0,0 +1,34 @@
+# Measures how long importing parts of mavlinkinterface takes in a fresh interpreter,
+# and which of the heavy dependencies each one loads.
+# Usage: python examples/importTimeBenchmark.py [runs]
+import subprocess
+import sys
+from statistics import median
+
+statements = [
+    'import mavlinkinterface',
+    'from mavlinkinterface import flightModes',
+    'from mavlinkinterface import mavlinkInterface',
+    'from mavlinkinterface import mavlinkInterface, mission',
+]
+heavyModules = ['pymavlink.mavutil', 'pymavlink.mavextra', 'pymavlink.mavwp', 'numpy', 'brping']
+
+# Each run prints the import time in seconds, followed by the heavy modules that were loaded
+script = '''
+import sys, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+print(','.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+for statement in statements:
+    times = []
+    for i in range(runs):
+        output = subprocess.run([sys.executable, '-c', script.format(statement=statement, heavy=heavyModules)],
+                                check=True, capture_output=True, text=True).stdout.splitlines()
+        times.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else ''
+    print('{:56} {:8.1f} ms   loads: {}'.format(statement, 1000 * median(times), loaded or 'nothing heavy'))
@@ -0,0 +1,109 @@
+# A stand-in for a Ping1D sonar, for testing the sonar commands without the sensor.
+# It answers requests for distance_simple and profile messages, and streams them after continuous_start.
+#
+# Usage: python examples/ping1dEmulator.py [port]
+# Then set the sonar address in ~/.mavlinkInterface.ini to 127.0.0.1 and the port to match
+import socket
+import struct
+import threading
+from math import exp, sin
+from time import monotonic, sleep
+
+PING1D_DISTANCE_SIMPLE = 1211
+PING1D_PROFILE = 1300
+PING1D_CONTINUOUS_START = 1400
+PING1D_CONTINUOUS_STOP = 1401
+
+HEADER = struct.Struct('<2sHHBB')   # 'BR', payload length, message id, source, destination
+
+
+def packMessage(messageId: int, payload: bytes) -> bytes:
+    '''Frames a payload as a Ping protocol message'''
+    data = HEADER.pack(b'BR', len(payload), messageId, 1, 0) + payload
+    return data + struct.pack('<H', sum(data) & 0xffff)
+
+
+class ping1dEmulator(object):
+    '''
+    Emulates a Ping1D on a UDP port. The distance moves slowly between 1 and 9 meters,
+    and the profile has a single echo at that distance.
+    '''
+
+    def __init__(self, port: int = 9090, rate: float = 10, samples: int = 200, host: str = '127.0.0.1'):
+        '''
+        :param port: the UDP port to listen on
+        :param rate: messages per second sent while streaming
+        :param samples: the number of samples in each profile
+        '''
+        self.rate = rate
+        self.samples = samples
+        self.pingNumber = 0
+        self.streaming = {}     # message id -> client address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.1)
+        self.stopEvent = threading.Event()
+        self.startTime = monotonic()
+
+    def start(self) -> 'ping1dEmulator':
+        threading.Thread(target=self.__receive, daemon=True).start()
+        threading.Thread(target=self.__stream, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+
+    @property
+    def distance(self) -> int:
+        '''The current distance in millimeters'''
+        return int(5000 + 4000 * sin(0.2 * (monotonic() - self.startTime)))
+
+    def message(self, messageId: int) -> bytes:
+        self.pingNumber += 1
+        if messageId == PING1D_DISTANCE_SIMPLE:
+            return packMessage(messageId, struct.pack('<IB', self.distance, 100))
+        if messageId == PING1D_PROFILE:
+            scanLength = 10000
+            echo = self.distance * self.samples / scanLength
+            profile = bytes(min(255, int(20 + 235 * exp(-((i - echo) / 3) ** 2))) for i in range(self.samples))
+            return packMessage(messageId, struct.pack('<IHHIIIIH', self.distance, 100, 100, self.pingNumber,
+                                                      0, scanLength, 3, self.samples) + profile)
+        return None
+
+    def __receive(self) -> None:
+        while not self.stopEvent.is_set():
+            try:
+                data, client = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            if len(data) < HEADER.size + 2 or data[:2] != b'BR':
+                continue
+            start, length, messageId, src, dst = HEADER.unpack_from(data)
+            payload = data[HEADER.size:HEADER.size + length]
+
+            if messageId == PING1D_CONTINUOUS_START:
+                self.streaming[struct.unpack('<H', payload)[0]] = client
+            elif messageId == PING1D_CONTINUOUS_STOP:
+                self.streaming.pop(struct.unpack('<H', payload)[0], None)
+            elif length == 0:
+                # A request for a message
+                reply = self.message(messageId)
+                if reply is not None:
+                    self.sock.sendto(reply, client)
+
+    def __stream(self) -> None:
+        while not self.stopEvent.wait(1 / self.rate):
+            for messageId, client in list(self.streaming.items()):
+                self.sock.sendto(self.message(messageId), client)
+
+
+if __name__ == '__main__':
+    import sys
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9090
+    ping1dEmulator(port).start()
+    print('Emulating a Ping1D on udp port ' + str(port) + ', press Ctrl+C to stop')
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        pass
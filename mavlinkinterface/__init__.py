@@ -1,17 +1,32 @@
-
-# Import main function
-from mavlinkinterface.main import mavlinkInterface
-
-# Import Mission function
-from mavlinkinterface.mission import mission
+from importlib import import_module     # For importing the interface on first use
 
 # Import enums
 from mavlinkinterface.enum.flightModes import flightModes
 from mavlinkinterface.enum.queueModes import queueModes
 
+# The interface and missions depend on pymavlink, which takes most of the import time of this package.
+# They are imported the first time they are accessed, so scripts that only need the enums (or that
+# import the package without creating an interface) do not pay for it.
+_lazyImports = {
+    "mavlinkInterface": "mavlinkinterface.main",
+    "mission": "mavlinkinterface.mission"
+}
+
 __all__ = [
     "mavlinkInterface",
     "flightModes",
     "queueModes",
     "mission"
 ]
+
+
+def __getattr__(name: str):
+    if name in _lazyImports:
+        value = getattr(import_module(_lazyImports[name]), name)
+        globals()[name] = value     # Later lookups skip this function
+        return value
+    raise AttributeError("module 'mavlinkinterface' has no attribute '" + name + "'")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,137 @@
+from pymavlink import mavutil           # For command and result enumerations
+from threading import Event, Lock       # For waiting on acknowledgements
+
+from mavlinkinterface.logger import getLogger
+
+
+class pendingCommand(object):
+    '''An outstanding command, completed by the first incoming message its match function accepts'''
+
+    def __init__(self, match):
+        '''
+        :param match: function taking a message and returning a MAV_RESULT, or None if the message does not apply
+        '''
+        self.match = match
+        self.result = None
+        self.done = Event()
+
+    def check(self, msg) -> None:
+        if self.done.is_set():
+            return
+        result = self.match(msg)
+        if result is not None:
+            self.result = result
+            self.done.set()
+
+
+class commandAckTracker(object):
+    '''
+    Matches incoming COMMAND_ACK and HEARTBEAT messages to outstanding commands,
+    so that a command can wait for the vehicle to confirm it instead of sleeping for a fixed time.
+
+    handleMessage must be called with every COMMAND_ACK and HEARTBEAT message received.
+    '''
+
+    def __init__(self, ml, timeout: float = 1, retries: int = 3):
+        '''
+        :param ml: the mavlink connection to send commands through
+        :param timeout: default seconds to wait for an acknowledgement before resending
+        :param retries: default number of times to resend an unacknowledged command
+        '''
+        self.__ml = ml
+        self.__log = getLogger('Ack')
+        self.__pending = []
+        self.__lock = Lock()
+        self.timeout = timeout
+        self.retries = retries
+
+    def handleMessage(self, msg) -> None:
+        '''Checks an incoming message against all outstanding commands'''
+        with self.__lock:
+            pending = tuple(self.__pending)
+        for p in pending:
+            p.check(msg)
+
+    def commandLong(self, command: int, *params: float, timeout: float = None, retries: int = None) -> int:
+        '''
+        Sends a COMMAND_LONG and waits for the matching COMMAND_ACK, resending it if no acknowledgement arrives.
+        Returns the MAV_RESULT from the acknowledgement, or None if the command was never acknowledged.
+
+        :param command: the MAV_CMD to send
+        :param params: up to 7 command parameters, unused parameters are sent as 0
+        :param timeout: seconds to wait for each attempt, defaults to self.timeout
+        :param retries: number of times to resend, defaults to self.retries
+        '''
+        params = list(params) + [0] * (7 - len(params))
+
+        def send(attempt):
+            self.__ml.mav.command_long_send(
+                self.__ml.target_system,
+                self.__ml.target_component,
+                command,
+                attempt,    # Confirmation, incremented on every resend
+                *params)
+
+        def match(msg):
+            if (msg.get_type() == 'COMMAND_ACK' and msg.command == command
+                    and msg.result != mavutil.mavlink.MAV_RESULT_IN_PROGRESS):
+                return msg.result
+            return None
+
+        return self.__await('command ' + str(command), send, match, timeout, retries)
+
+    def setMode(self, mode: str, timeout: float = None, retries: int = None) -> int:
+        '''
+        Sets the flight mode and waits until the vehicle either rejects the change,
+        or reports the new mode in its HEARTBEAT.
+        Returns the MAV_RESULT, or None if the vehicle never confirmed the change.
+
+        :param mode: the name of the flight mode, as used by pymavlink
+        '''
+        modeMap = self.__ml.mode_mapping()
+        if modeMap is None or mode not in modeMap:
+            self.__log.error('Unknown flight mode: ' + str(mode))
+            return mavutil.mavlink.MAV_RESULT_DENIED
+        customMode = modeMap[mode]
+
+        def send(attempt):
+            self.__ml.set_mode(mode)
+
+        def match(msg):
+            if msg.get_type() == 'HEARTBEAT':
+                if msg.get_srcSystem() == self.__ml.target_system and msg.custom_mode == customMode:
+                    return mavutil.mavlink.MAV_RESULT_ACCEPTED
+            elif (msg.get_type() == 'COMMAND_ACK' and msg.command == mavutil.mavlink.MAV_CMD_DO_SET_MODE
+                    and msg.result not in (mavutil.mavlink.MAV_RESULT_ACCEPTED,
+                                           mavutil.mavlink.MAV_RESULT_IN_PROGRESS)):
+                return msg.result
+            return None
+
+        return self.__await('set mode ' + mode, send, match, timeout, retries)
+
+    def __await(self, name: str, send, match, timeout: float, retries: int) -> int:
+        '''Sends a command with send(attempt) until match accepts a reply or all retries have timed out'''
+        if timeout is None:
+            timeout = self.timeout
+        if retries is None:
+            retries = self.retries
+
+        # Register before sending so a fast reply cannot be missed
+        p = pendingCommand(match)
+        with self.__lock:
+            self.__pending.append(p)
+
+        try:
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    self.__log.warn('No acknowledgement for ' + name + ', resending (attempt ' + str(attempt + 1) + ')')
+                send(attempt)
+                if p.done.wait(timeout=timeout):
+                    self.__log.trace(name + ' acknowledged with result ' + str(p.result))
+                    return p.result
+
+            self.__log.error(name + ' was not acknowledged after ' + str(retries + 1) + ' attempts')
+            return None
+        finally:
+            with self.__lock:
+                self.__pending.remove(p)
@@ -3,7 +3,7 @@ from mavlinkinterface.commands.active.flightModes import setFlightMode
 from mavlinkinterface.commands.active.arm_disarm import arm, disarm
 from mavlinkinterface.commands.active.gripper import gripperClose, gripperOpen
 from mavlinkinterface.commands.active.lights import lights
-from mavlinkinterface.commands.active.movement import move, move3d, dive, diveTime, yaw
+from mavlinkinterface.commands.active.movement import move, move3d, dive, diveBasic, diveTime, yaw
 from mavlinkinterface.commands.active.movement import yawBeta, surface, wait, yawBasic
 # from mavlinkinterface.commands.active.beta_commands import yaw2
 
@@ -16,6 +16,7 @@ __all__ = [
     "yaw",
     "yawBeta",
     "dive",
+    "diveBasic",
     "diveTime",
     "surface",
     "wait",
@@ -2,10 +2,18 @@ from pymavlink import mavutil
 from mavlinkinterface.logger import getLogger
 
 
-def arm(ml, sem):
+def arm(ml, sem, acks=None):
+    '''
+    Returns the MAV_RESULT of the command when an ack tracker is given (None if never acknowledged)
+
+    :param acks: <optional> a commandAckTracker used to wait for the vehicle to acknowledge the command
+    '''
     try:
         log = getLogger("Status")
         log.info("Sending arming signal")
+        if acks is not None:
+            return acks.commandLong(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                    1)  # param1: 1 = arm
         ml.mav.command_long_send(
             ml.target_system,
             ml.target_component,
@@ -22,10 +30,18 @@ def arm(ml, sem):
         sem.release()
 
 
-def disarm(ml, sem):
+def disarm(ml, sem, acks=None):
+    '''
+    Returns the MAV_RESULT of the command when an ack tracker is given (None if never acknowledged)
+
+    :param acks: <optional> a commandAckTracker used to wait for the vehicle to acknowledge the command
+    '''
     try:
         log = getLogger("Status")
         log.info("Sending disarming signal")
+        if acks is not None:
+            return acks.commandLong(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                    0)  # param1: 0 = disarm
         ml.mav.command_long_send(
             ml.target_system,
             ml.target_component,
@@ -1,7 +1,12 @@
 from mavlinkinterface.logger import getLogger
 
 
-def setFlightMode(ml, sem, mode):
+def setFlightMode(ml, sem, mode, acks=None):
+    '''
+    Returns the MAV_RESULT of the mode change when an ack tracker is given (None if never confirmed)
+
+    :param acks: <optional> a commandAckTracker used to wait for the vehicle to report the new mode
+    '''
     # set flight mode
     try:
         # mode = "Depth Hold"
@@ -21,6 +26,8 @@ def setFlightMode(ml, sem, mode):
         
         log = getLogger("Movement")
         log.info("Setting Flight Mode to " + str(mode))
+        if acks is not None:
+            return acks.setMode(mode)
         ml.set_mode(mode)
 
     finally:
@@ -11,12 +11,12 @@ def gripperOpen(mcParams, sem, time):
 
         log.trace('opening gripper for ' + str(time) + ' seconds')
 
-        # use a bitwise or to avoid altering other buttons
-        mcParams['b'] = mcParams['b'] | 1 << 10
+        # only alter this button, other threads may be changing other buttons
+        mcParams.setButtons(1 << 10)
         sleep(time)
 
     finally:
-        mcParams['b'] = mcParams['b'] & (~(1 << 10))
+        mcParams.clearButtons(1 << 10)
 
         sem.release()
 
@@ -30,11 +30,11 @@ def gripperClose(mcParams, sem, time):
 
         log.trace('opening gripper for ' + str(time) + ' seconds')
 
-        # use a bitwise or to avoid altering other buttons
-        mcParams['b'] = mcParams['b'] | 1 << 9
+        # only alter this button, other threads may be changing other buttons
+        mcParams.setButtons(1 << 9)
         sleep(time)
 
     finally:
-        mcParams['b'] = mcParams['b'] & (~(1 << 9))
+        mcParams.clearButtons(1 << 9)
 
         sem.release()
@@ -1,26 +1,49 @@
 # External Imports
 from time import sleep  # delay needed due to adjustment method
+from pymavlink import mavutil   # For the set servo command
 # Internal Imports
 from mavlinkinterface.logger import getLogger   # For Logging
 
 
 class lights(object):
+    '''
+    Controls the brightness of the lights, using one of two backends (set in the 'lights' config section):
+
+    - servo: sets the absolute PWM of the lights output in a single MAV_CMD_DO_SET_SERVO command
+    - buttons: steps the brightness up or down by pressing the lights buttons through manual control
+
+    If the vehicle does not accept the servo command, the buttons backend is used instead.
+    '''
 
     steps = 8   # number of brightness levels the light has
 
     def __init__(self, mli):
-        for i in range(0, self.steps):
-            self.__down(mli)
-            sleep(0.04)
-        self.level = 0
         self.log = getLogger("Lights")
+        self.backend = mli.config.get('lights', 'backend').lower()
+        self.channel = mli.config.get('lights', 'channel')
+        self.pwmMin = mli.config.get('lights', 'pwmMin')
+        self.pwmMax = mli.config.get('lights', 'pwmMax')
+        self.brightness = 0
+
+        # Start with the lights off
+        if not (self.backend == 'servo' and self.__setServo(mli, 0)):
+            for i in range(0, self.steps):
+                self.__down(mli)
+                sleep(0.04)
+        self.level = 0
 
     def set(self, mli, sem, brightness):
         if brightness > 100 or brightness < 0:
             self.log.warn('Brightness must be from 0 to 100')
+            brightness = max(0, min(100, brightness))
 
         self.log.info("Setting Lights to " + str(brightness) + "% brightness")
         try:
+            if self.backend == 'servo' and self.__setServo(mli, brightness):
+                self.brightness = brightness
+                self.level = round(0.09 * brightness)
+                return
+
             desiredLevel = round(0.09 * brightness)
             self.log.trace("current lighting level = " + str(self.level))
             self.log.trace("desired lighting level = " + str(brightness))
@@ -34,33 +57,58 @@ class lights(object):
                 self.__down(mli)
                 self.level -= 1
                 sleep(0.05)
+            self.brightness = brightness
         finally:
             sem.release()
 
+    def __setServo(self, mli, brightness) -> bool:
+        '''
+        Sets the lights output directly to the PWM for the given brightness.
+        Returns true if the vehicle accepted the command. Otherwise switches to the buttons backend and returns false.
+        '''
+        pwm = round(self.pwmMin + (self.pwmMax - self.pwmMin) * brightness / 100)
+        self.log.trace('Setting lights channel ' + str(self.channel) + ' to ' + str(pwm) + 'us')
+        result = mli.commandAcks.commandLong(mavutil.mavlink.MAV_CMD_DO_SET_SERVO,
+                                             self.channel,  # param1: servo instance number
+                                             pwm,           # param2: pulse width in microseconds
+                                             retries=1)
+        if result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+            return True
+
+        self.log.warn('Set servo command was not accepted (result=' + str(result) + '), using lights buttons instead')
+        self.backend = 'buttons'
+        return False
+
     def __up(self, mli):
 
-        # Because adjusting the lights requires rapidle toggling manual control,
-        # and an 'unpressed' signal is always being sent, only the 'pressed' signal is sent here
+        self.__press(mli, 1 << 14)
+
+    def __down(self, mli):
+
+        self.__press(mli, 1 << 13)
+
+    def __press(self, mli, mask):
+        '''Sends a single press and release of the given buttons'''
+
+        # Adjusting the lights requires rapidly toggling a button. The regular manual control
+        # broadcast skips unchanged frames, so both the 'pressed' and 'unpressed' frames are sent here
+        frame = mli.manualControlParams.snapshot()
         mli.mavlinkConnection.mav.manual_control_send(
             mli.mavlinkConnection.target_system,
-            mli.manualControlParams['x'],  # X-Axis thrust
-            mli.manualControlParams['y'],  # Y-Axis thrust
-            mli.manualControlParams['z'],  # Z-Axis thrust
-            mli.manualControlParams['r'],  # R-Axis thrust
-            (mli.manualControlParams['b'] | 1 << 14)
+            frame.x,    # X-Axis thrust
+            frame.y,    # Y-Axis thrust
+            frame.z,    # Z-Axis thrust
+            frame.r,    # R-Axis thrust
+            frame.b | mask
         )
         sleep(0.05)
 
-    def __down(self, mli):
-
-        # Because adjusting the lights requires rapidle toggling manual control,
-        # and an 'unpressed' signal is always being sent, only the 'pressed' signal is sent here
+        frame = mli.manualControlParams.snapshot()
         mli.mavlinkConnection.mav.manual_control_send(
             mli.mavlinkConnection.target_system,
-            mli.manualControlParams['x'],  # X-Axis thrust
-            mli.manualControlParams['y'],  # Y-Axis thrust
-            mli.manualControlParams['z'],  # Z-Axis thrust
-            mli.manualControlParams['r'],  # R-Axis thrust
-            (mli.manualControlParams['b'] | 1 << 13)
+            frame.x,    # X-Axis thrust
+            frame.y,    # Y-Axis thrust
+            frame.z,    # Z-Axis thrust
+            frame.r,    # R-Axis thrust
+            frame.b
         )
-        sleep(0.05)
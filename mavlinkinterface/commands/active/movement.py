@@ -1,5 +1,5 @@
 from pymavlink import mavutil           # for everything
-from math import pi, sin, cos           # for movement direction
+from math import pi, sin, cos, degrees  # for movement direction and heading
 
 from mavlinkinterface.logger import getLogger
 
@@ -14,9 +14,7 @@ def move3d(mcParams, sem, kill, throttleX, throttleY, throttleZ, time):
                  + " for " + str(time) + " seconds")
 
         # Set the movement parameters
-        mcParams['x'] = 10 * throttleX
-        mcParams['y'] = 10 * throttleY
-        mcParams['z'] = 5 * throttleZ + 500
+        mcParams.update(x=10 * throttleX, y=10 * throttleY, z=5 * throttleZ + 500)
 
         # Wait
         if kill.wait(timeout=time):
@@ -29,9 +27,7 @@ def move3d(mcParams, sem, kill, throttleX, throttleY, throttleZ, time):
 
     finally:
         # Return movement params to normal (but only those that were modified)
-        mcParams['x'] = 0
-        mcParams['y'] = 0
-        mcParams['z'] = 500
+        mcParams.reset('x', 'y', 'z')
 
         sem.release()
         log.trace('move3d ended')
@@ -59,8 +55,7 @@ def move(mcParams, sem, kill, direction, time, throttle=50):
         y = round(y * scaler)
 
         # Set movement parameters
-        mcParams['x'] = x
-        mcParams['y'] = y
+        mcParams.update(x=x, y=y)
 
         # wait
         if kill.wait(timeout=time):
@@ -72,8 +67,7 @@ def move(mcParams, sem, kill, direction, time, throttle=50):
 
     finally:
         # Reset movement parameters
-        mcParams['x'] = 0
-        mcParams['y'] = 0
+        mcParams.reset('x', 'y')
 
         sem.release()
         log.trace('move ended')
@@ -89,7 +83,7 @@ def diveTime(mcParams, sem, kill, time, throttle):
         log.info("Diving at " + str(throttle) + "% throttle for " + str(time) + " seconds")
 
         # set movement parameters
-        mcParams['z'] = (throttle * 5) + 500
+        mcParams.update(z=(throttle * 5) + 500)
 
         # wait
         if kill.wait(timeout=time):
@@ -100,7 +94,7 @@ def diveTime(mcParams, sem, kill, time, throttle):
 
     finally:
         # reset movement parameters
-        mcParams['z'] = 500
+        mcParams.reset('z')
 
         sem.release()
         log.trace('diveTime ended')
@@ -108,6 +102,51 @@ def diveTime(mcParams, sem, kill, time, throttle):
 
 def dive(mli, kill, depth, throttle=50, absolute=False):
     '''
+    Dives using mli.depthController, which adjusts the thrust on every pressure reading
+    Returns true if the drone settled at the target depth
+
+    :param depth: The change in depth, negative being down
+    :param throttle: Maximum percent of thruster power to use
+    '''
+    try:
+        log = getLogger("Movement")
+        log.info("Diving to depth=" + str(depth)
+                 + " at throttle=" + str(throttle)
+                 + "% power, absolute=" + str(absolute))
+
+        # set target depth
+        if absolute:
+            # In absolute mode, just go to a depth
+            targetDepth = depth
+        else:   # relative
+            # In relative mode, go up/down by a depth
+            targetDepth = depth + mli.getDepth()
+
+        if targetDepth > 0:
+            log.error("Cannot Rise above the Surface, aborting")
+            raise ValueError("Cannot Rise above the Surface, aborting command")
+
+        mli.depthController.start(targetDepth, maxThrottle=throttle, kill=kill)
+        settled = mli.depthController.wait()
+
+        if kill.is_set():
+            log.trace("Function dive with depth=" + str(depth)
+                      + ", throttle=" + str(throttle)
+                      + ", absolute=" + str(absolute)
+                      + " was prematurely halted")
+        return settled
+    finally:
+        # stop the controller and reset movement parameters
+        mli.depthController.stop()
+
+        mli.sem.release()
+        log.trace('Dive function ended')
+
+
+def diveBasic(mli, kill, depth, throttle=50, absolute=False):
+    '''
+    Dives using a fixed throttle until the depth is within a threshold of the target
+
     :param depth: The change in depth, negative being down
     :param throttle: Percent of thruster power to use
     '''
@@ -160,10 +199,10 @@ def dive(mli, kill, depth, throttle=50, absolute=False):
         # set movement parameters
         if currentDepth > targetDepth + acceptThreshold:    # Need to descend
             descend = True
-            mli.manualControlParams['z'] = 500 - (throttle * 5)
+            mli.manualControlParams.update(z=500 - (throttle * 5))
         elif currentDepth < targetDepth - acceptThreshold:  # Need to ascend
             descend = False
-            mli.manualControlParams['z'] = 500 + (throttle * 5)
+            mli.manualControlParams.update(z=500 + (throttle * 5))
         else:
             log.trace('Already at desired depth')
             return
@@ -202,37 +241,53 @@ def dive(mli, kill, depth, throttle=50, absolute=False):
                       + " was prematurely halted")
     finally:
         # reset movement parameters
-        mli.manualControlParams['z'] = 500
+        mli.manualControlParams.reset('z')
 
         mli.sem.release()
         log.trace('Dive function ended')
 
 
-def surface(mli, kill):  # TODO
+def surface(mli, kill):
     log = getLogger("Movement")
     log.info("Rising to Surface")
-    dive(mli, kill, 0, throttle=100, absolute=True)
+    return dive(mli, kill, 0, throttle=100, absolute=True)
 
 
-def yawBeta(ml, sem, kill, angle, rate=20, direction=1, relative=1):
+def yawBeta(ml, sem, kill, angle, rate=20, direction=1, relative=1, acks=None):
+    '''
+    Returns the MAV_RESULT of the command when an ack tracker is given (None if never acknowledged)
+
+    :param acks: <optional> a commandAckTracker used to wait for the vehicle to acknowledge the command
+    '''
     try:
         log = getLogger("Movement")
         log.info("Yawing " + ("clockwise by " if (direction == 1) else "Counterclockwise by ")
                  + str(angle) + " degrees at " + str(rate) + " deg/s in "
                  + ("relative" if (relative == 1) else "Absolute") + " mode.")
 
-        ml.mav.command_long_send(
-            ml.target_system,
-            ml.target_component,
-            mavutil.mavlink.MAV_CMD_CONDITION_YAW,
-            0,          # Confirmation
-            angle,      # param 1: target angle (deg)
-            rate,       # param 2: angular speed (deg/s)
-            direction,  # param 3: direction (-1=ccw, 1=cw)
-            relative,   # param 4: 0 = absolute, 1 = relative
-            0,          # param 5: Empty
-            0,          # param 6: Empty
-            0)          # param 7: Empty
+        result = None
+        if acks is not None:
+            result = acks.commandLong(mavutil.mavlink.MAV_CMD_CONDITION_YAW,
+                                      angle,        # param 1: target angle (deg)
+                                      rate,         # param 2: angular speed (deg/s)
+                                      direction,    # param 3: direction (-1=ccw, 1=cw)
+                                      relative)     # param 4: 0 = absolute, 1 = relative
+            if result != mavutil.mavlink.MAV_RESULT_ACCEPTED:
+                log.warn("yawBeta was not accepted by the vehicle, result=" + str(result))
+                return result
+        else:
+            ml.mav.command_long_send(
+                ml.target_system,
+                ml.target_component,
+                mavutil.mavlink.MAV_CMD_CONDITION_YAW,
+                0,          # Confirmation
+                angle,      # param 1: target angle (deg)
+                rate,       # param 2: angular speed (deg/s)
+                direction,  # param 3: direction (-1=ccw, 1=cw)
+                relative,   # param 4: 0 = absolute, 1 = relative
+                0,          # param 5: Empty
+                0,          # param 6: Empty
+                0)          # param 7: Empty
 
         if kill.wait(timeout=((angle / rate) + .5)):     # Check if killEvent has been set
             log.trace("Function yawBeta with angle=" + str(angle)
@@ -240,7 +295,7 @@ def yawBeta(ml, sem, kill, angle, rate=20, direction=1, relative=1):
                       + ", direction=" + str(direction)
                       + ", relative=" + str(relative)
                       + " was prematurely halted")
-            return  # Stop executing function
+        return result
 
     finally:
         sem.release()
@@ -251,7 +306,7 @@ def yawBasic(mcParams, sem, kill, angle, absolute=False):
         log = getLogger("Movement")
         log.info("Yawing by " + str(angle) + " degrees, absolute: " + str(absolute))
 
-        mcParams['r'] = int(angle * (50 / 9))
+        mcParams.update(r=int(angle * (50 / 9)))
 
         if kill.wait(timeout=(abs(int(angle * (50 / 9))) / 200)):   # Check if killEvent has been set
             log.trace("Function yaw with angle=" + str(angle)
@@ -260,7 +315,7 @@ def yawBasic(mcParams, sem, kill, angle, absolute=False):
 
     finally:
         # reset movement parameters
-        mcParams['r'] = 0
+        mcParams.reset('r')
 
         sem.release()
         log.trace('yawTime ended')
@@ -278,10 +333,11 @@ def wait(ml, sem, kill, time):
         sem.release()
 
 
-def yaw(mli, kill, angle, absolute=False):   # TODO add rotational momentum to calculation
+def yaw(mli, kill, angle, absolute=False):
     '''
-    Rotates the drone by *angle* degrees
+    Rotates the drone by *angle* degrees using mli.headingController, which adjusts the thrust on every ATTITUDE message
     Note: This will never yaw by more than 180 degrees
+    Returns true if the drone settled at the target heading
 
     :param angle: The change in heading (in degrees), with negative being counterclockwise
     '''
@@ -289,62 +345,27 @@ def yaw(mli, kill, angle, absolute=False):   # TODO add rotational momentum to c
         log = getLogger("Movement")
         log.info("Yawing by " + str(angle) + " absolute=" + str(absolute))
 
-        currentHeading = mli.getHeading()
         if absolute:
             # In absolute mode, just face toward the input angle
             targetHeading = angle % 360
         else:   # relative
             # In relative mode, yaw by the input angle
-            targetHeading = (angle + currentHeading) % 360
+            targetHeading = (angle + degrees(mli.messages['ATTITUDE']['message'].yaw)) % 360
 
-        log.trace('yaw: current: ' + str(currentHeading))
         log.trace('yaw: target: ' + str(targetHeading))
 
-        if (targetHeading - currentHeading) % 360 <= 180:  # Clockwise
+        mli.headingController.start(targetHeading, kill=kill)
+        settled = mli.headingController.wait()
 
-            mli.manualControlParams['r'] = 500
-            while not kill.wait(timeout=.25):
-                # Until within 30 degrees of target, yaw at 50%
-                if (targetHeading - mli.getHeading()) % 360 <= 30:
-                    break
-
-            mli.manualControlParams['r'] = 250
-            while not kill.wait(timeout=.25):
-                # Until within 10 degrees of target, yaw at 25%
-                if ((targetHeading - mli.getHeading()) % 360 <= 5
-                        or (targetHeading - mli.getHeading()) % 360 > 330):
-                    break
-
-            mli.manualControlParams['r'] = -250
-            while not kill.wait(timeout=.1):
-                # Cancel momentum
-                if mli.messages['ATTITUDE']['message'].yawspeed < 0.01:
-                    break
-
-        elif (targetHeading - currentHeading) % 360 > 180:  # Counterclockwise
-
-            mli.manualControlParams['r'] = -500
-            while not kill.wait(timeout=.25):
-                # Until within 30 degrees of target, yaw at 50%
-                if (targetHeading - mli.getHeading()) % 360 > 330:
-                    break
-
-            mli.manualControlParams['r'] = -250
-            while not kill.wait(timeout=.25):
-                # Until within 10 degrees of target, yaw at 25%
-                if ((targetHeading - mli.getHeading()) % 360 > 355
-                        or (targetHeading - mli.getHeading()) % 360 < 30):
-                    break
-
-            mli.manualControlParams['r'] = 250
-            while not kill.wait(timeout=.1):
-                # Cancel momentum
-                if mli.messages['ATTITUDE']['message'].yawspeed > -0.01:
-                    break
+        if kill.is_set():
+            log.trace("Function yaw with angle=" + str(angle)
+                      + ", absolute=" + str(absolute)
+                      + " was prematurely halted")
+        return settled
 
     finally:
-        # reset yaw control to zero
-        mli.manualControlParams['r'] = 0
+        # stop the controller and reset yaw control to zero
+        mli.headingController.stop()
 
         mli.sem.release()
         log.trace('yaw command ended')
@@ -1,7 +1,9 @@
 from mavlinkinterface.commands.passive.sonar import sonar
+from mavlinkinterface.commands.passive.sonarArray import sonarArray
 from mavlinkinterface.commands.passive.gps import gps
 
 __all__ = [
     'sonar',
+    'sonarArray',
     'gps'
 ]
@@ -1,20 +1,36 @@
 import json
 from datetime import datetime
 from mavlinkinterface.logger import getLogger
+from mavlinkinterface.sensorData import gpsFromMessage
+from mavlinkinterface.commands.passive.gpsTrack import gpsTrack
 
 
 class gps(object):
     def __init__(self, mli):
         self.mli = mli
         self.log = getLogger('gps')
-        pass
 
-    def getCoordinates(self) -> str:
-        '''Returns the current coordinates of the drone, throws an exception if no lock is available'''
+        # Keep a track of recent fixes, fed as GPS messages arrive
+        self.track = gpsTrack(capacity=mli.config.get('gps', 'trackLength'),
+                              source=mli.config.get('gps', 'trackSource'),
+                              minFixType=mli.config.get('gps', 'minFixType'),
+                              maxHdop=mli.config.get('gps', 'maxHdop'),
+                              maxAge=mli.config.get('gps', 'maxAge'))
+        mli.addMessageListener('GPS_RAW_INT', self.track.handleMessage)
+        mli.addMessageListener('GLOBAL_POSITION_INT', self.track.handleMessage)
+
+    def getCoordinates(self):
+        '''
+        Returns the current coordinates of the drone, throws an exception if no lock is available.
+        Returns a JSON-formatted string, or a gpsData named tuple when the interface return mode is native.
+        '''
         self.log.trace('getCoordinates called')
         if ((datetime.now() - self.mli.messages['GPS_RAW_INT']['time']).total_seconds() < 1
                 and (self.mli.messages['GPS_RAW_INT']['message'].fix_type >= 2)):
 
+            if self.mli.returnMode == 'native':
+                return gpsFromMessage(self.mli.messages['GPS_RAW_INT']['message'])
+
             returnObj = {}
             returnObj['lat'] = self.mli.messages['GPS_RAW_INT']['message'].lat * 1e-7
             returnObj['lon'] = self.mli.messages['GPS_RAW_INT']['message'].lon * 1e-7
@@ -22,3 +38,21 @@ class gps(object):
             return json.dumps(returnObj)
         else:
             raise ConnectionError("Could not get GPS Data")
+
+    def getLastKnownPosition(self):
+        '''
+        Returns the last position that met the GPS quality rules in the config, however old, with its fix type,
+        satellites, HDOP, age and whether it is stale. Throws a ConnectionError if there has never been one.
+        Returns a JSON-formatted string, or a knownPosition named tuple when the interface return mode is native.
+        '''
+        self.log.trace('getLastKnownPosition called')
+        position = self.track.lastKnownGood()
+        if position is None:
+            raise ConnectionError("No good GPS fix has been received")
+        if self.mli.returnMode == 'native':
+            return position
+
+        returnObj = position._asdict()
+        del returnObj['time']   # Monotonic, only meaningful within this process
+        self.log.trace('getLastKnownPosition about to return ' + json.dumps(returnObj))
+        return json.dumps(returnObj)
@@ -0,0 +1,223 @@
+# External
+from collections import namedtuple  # For positions and track points
+from threading import Lock          # For reading the track while the refresh thread writes to it
+from time import monotonic          # For timestamping fixes
+# Internal
+from mavlinkinterface.logger import getLogger   # For logging
+
+EARTH_RADIUS = 6371008.8    # Mean radius, meters
+
+# The last position that met the quality rules of the track.
+# time: monotonic time it arrived, lat/lon: decimal degrees, fixType: GPS_FIX_TYPE, hdop: horizontal dilution
+# of precision (None if unknown), age: seconds since it arrived, stale: true if age is over the track's maxAge
+knownPosition = namedtuple('knownPosition', ['time', 'lat', 'lon', 'fixType', 'satellites', 'hdop', 'age', 'stale'])
+
+# The closest point on the track to a query point.
+# lat/lon: decimal degrees, distance: meters from the query point, alongTrack: meters along the track from its
+# first fix, index: the index (in fixes()) of the fix starting the closest segment
+trackPoint = namedtuple('trackPoint', ['lat', 'lon', 'distance', 'alongTrack', 'index'])
+
+
+def fixDtype():
+    '''The numpy dtype of one fix in a track'''
+    import numpy as np
+    return np.dtype([('time', '<f8'),
+                     ('lat', '<f8'),
+                     ('lon', '<f8'),
+                     ('fixType', 'u1'),
+                     ('satellites', 'u1'),
+                     ('hdop', '<f4'),
+                     ('good', '?')])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''
+    Returns the great circle distance in meters between points given in decimal degrees.
+    Each argument may be a number or a numpy array, and arrays are compared element by element
+    (e.g. every fix in a track against one waypoint, or every vehicle against every waypoint).
+    '''
+    import numpy as np
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+class gpsTrack(object):
+    '''
+    The most recent GPS fixes, kept in numpy arrays for distance, speed and path calculations over the whole track.
+
+    Positions are taken from one message type (GPS_RAW_INT, the receiver's own fix, or GLOBAL_POSITION_INT,
+    the autopilot's fused estimate). Fix quality always comes from the latest GPS_RAW_INT. Each fix is marked
+    good if it meets minFixType and maxHdop. Fixes with no position (0, 0) are not kept.
+
+    The arrays are allocated (and numpy imported) when the first fix arrives, so the track costs nothing
+    at startup or on drones without GPS.
+    '''
+
+    def __init__(self, capacity: int = 3600, source: str = 'GPS_RAW_INT', minFixType: int = 3,
+                 maxHdop: float = 5, maxAge: float = 2):
+        '''
+        :param capacity: the number of fixes kept, older fixes are overwritten
+        :param source: the message to take positions from, GPS_RAW_INT or GLOBAL_POSITION_INT
+        :param minFixType: the lowest GPS_FIX_TYPE counted as good (2: 2D, 3: 3D)
+        :param maxHdop: the highest horizontal dilution of precision counted as good
+        :param maxAge: seconds after which the last known good position is marked stale
+        '''
+        if source not in ('GPS_RAW_INT', 'GLOBAL_POSITION_INT'):
+            raise ValueError('GPS track source must be GPS_RAW_INT or GLOBAL_POSITION_INT, not ' + str(source))
+        self.log = getLogger('gps')
+        self.capacity = capacity
+        self.source = source
+        self.minFixType = minFixType
+        self.maxHdop = maxHdop
+        self.maxAge = maxAge
+
+        self.__lock = Lock()
+        self.__np = None
+        self.__rows = None          # Allocated with the first fix
+        self.__count = 0            # Fixes kept in total
+        self.__quality = (0, 0, None)   # fixType, satellites, hdop of the latest GPS_RAW_INT
+        self.__lastGood = None
+
+    def __len__(self) -> int:
+        return min(self.__count, self.capacity)
+
+    def handleMessage(self, msg) -> None:
+        '''Adds a fix from a GPS_RAW_INT or GLOBAL_POSITION_INT message. Called on the message refresh thread'''
+        msgType = msg.get_type()
+        if msgType == 'GPS_RAW_INT':
+            hdop = None if msg.eph == 65535 else msg.eph / 100
+            self.__quality = (msg.fix_type, msg.satellites_visible, hdop)
+        if msgType != self.source or (msg.lat == 0 and msg.lon == 0):
+            return
+
+        now = monotonic()
+        lat, lon = msg.lat * 1e-7, msg.lon * 1e-7
+        fixType, satellites, hdop = self.__quality
+        good = fixType >= self.minFixType and (hdop is None or hdop <= self.maxHdop)
+
+        with self.__lock:
+            if self.__rows is None:
+                self.__allocate()
+            row = self.__rows[self.__count % self.capacity]
+            row['time'] = now
+            row['lat'] = lat
+            row['lon'] = lon
+            row['fixType'] = fixType
+            row['satellites'] = satellites
+            row['hdop'] = self.__np.nan if hdop is None else hdop
+            row['good'] = good
+            self.__count += 1
+            if good:
+                self.__lastGood = (now, lat, lon, fixType, satellites, hdop)
+
+    def __allocate(self) -> None:
+        import numpy as np  # Only needed once there is a track
+        self.__np = np
+        self.__rows = np.zeros(self.capacity, dtype=fixDtype())
+        self.log.trace('GPS track allocated for ' + str(self.capacity) + ' fixes')
+
+    def lastKnownGood(self) -> knownPosition:
+        '''Returns the last position that met the quality rules, or None if there has not been one'''
+        lastGood = self.__lastGood
+        if lastGood is None:
+            return None
+        age = monotonic() - lastGood[0]
+        return knownPosition(*lastGood, age=age, stale=age > self.maxAge)
+
+    def fixes(self, count: int = None, goodOnly: bool = False):
+        '''
+        Returns a copy of the most recent fixes, oldest first, as a numpy structured array
+        with the fields time, lat, lon, fixType, satellites, hdop (nan if unknown) and good
+
+        :param count: <optional> the number of fixes to return. Returns every fix kept if not given.
+        :param goodOnly: only return the fixes that met the quality rules
+        '''
+        with self.__lock:
+            if self.__rows is None:
+                return self.__numpy().zeros(0, dtype=fixDtype())
+            held = min(self.__count, self.capacity)
+            count = held if count is None else min(count, held)
+            rows = self.__rows.take(self.__np.arange(self.__count - count, self.__count) % self.capacity)
+        return rows[rows['good']] if goodOnly else rows
+
+    def distancesTo(self, lat: float, lon: float, fixes=None):
+        '''
+        Returns the distance in meters from each fix to a point (e.g. a waypoint), as a numpy array
+
+        :param fixes: <optional> the fixes to measure from, as returned by fixes(). Defaults to every good fix.
+        '''
+        fixes = self.fixes(goodOnly=True) if fixes is None else fixes
+        return haversine(fixes['lat'], fixes['lon'], lat, lon)
+
+    def cumulativeDistance(self, fixes=None):
+        '''
+        Returns the distance in meters travelled along the track up to each fix, starting at 0
+
+        :param fixes: <optional> the fixes to measure, as returned by fixes(). Defaults to every good fix.
+        '''
+        np = self.__numpy()
+        fixes = self.fixes(goodOnly=True) if fixes is None else fixes
+        steps = haversine(fixes['lat'][:-1], fixes['lon'][:-1], fixes['lat'][1:], fixes['lon'][1:])
+        return np.concatenate(([0.0], np.cumsum(steps)))[:len(fixes)]
+
+    def pathLength(self, fixes=None) -> float:
+        '''
+        Returns the total distance in meters travelled along the track
+
+        :param fixes: <optional> the fixes to measure, as returned by fixes(). Defaults to every good fix.
+        '''
+        distance = self.cumulativeDistance(fixes)
+        return float(distance[-1]) if len(distance) else 0.0
+
+    def speedOverGround(self, fixes=None):
+        '''
+        Returns the speed in m/s between each fix and the one before it, as a numpy array one shorter than fixes
+
+        :param fixes: <optional> the fixes to measure, as returned by fixes(). Defaults to every good fix.
+        '''
+        np = self.__numpy()
+        fixes = self.fixes(goodOnly=True) if fixes is None else fixes
+        steps = haversine(fixes['lat'][:-1], fixes['lon'][:-1], fixes['lat'][1:], fixes['lon'][1:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return steps / np.diff(fixes['time'])
+
+    def nearestPoint(self, lat: float, lon: float, fixes=None) -> trackPoint:
+        '''
+        Returns the closest point on the track (between fixes, not just at them) to the given point,
+        or None if the track is empty
+
+        :param fixes: <optional> the fixes making up the track, as returned by fixes(). Defaults to every good fix.
+        '''
+        np = self.__numpy()
+        fixes = self.fixes(goodOnly=True) if fixes is None else fixes
+        if len(fixes) == 0:
+            return None
+
+        # Flatten the track onto a plane around the query point, accurate over the few km of a dive
+        scale = np.radians(1) * EARTH_RADIUS
+        x = (fixes['lon'] - lon) * scale * np.cos(np.radians(lat))
+        y = (fixes['lat'] - lat) * scale
+        if len(fixes) == 1:
+            return trackPoint(float(fixes['lat'][0]), float(fixes['lon'][0]),
+                              float(haversine(fixes['lat'][0], fixes['lon'][0], lat, lon)), 0.0, 0)
+
+        # Project the query point (the origin) onto every segment at once
+        dx, dy = np.diff(x), np.diff(y)
+        lengthSquared = dx ** 2 + dy ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(lengthSquared > 0, -(x[:-1] * dx + y[:-1] * dy) / lengthSquared, 0), 0, 1)
+        index = int(np.argmin((x[:-1] + t * dx) ** 2 + (y[:-1] + t * dy) ** 2))
+
+        share = float(t[index])
+        pointLat = float(fixes['lat'][index] + share * (fixes['lat'][index + 1] - fixes['lat'][index]))
+        pointLon = float(fixes['lon'][index] + share * (fixes['lon'][index + 1] - fixes['lon'][index]))
+        along = self.cumulativeDistance(fixes)
+        alongTrack = float(along[index] + share * (along[index + 1] - along[index]))
+        return trackPoint(pointLat, pointLon, float(haversine(pointLat, pointLon, lat, lon)), alongTrack, index)
+
+    def __numpy(self):
+        if self.__np is None:
+            import numpy as np
+            return np
+        return self.__np
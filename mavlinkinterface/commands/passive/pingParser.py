@@ -0,0 +1,90 @@
+import struct   # For decoding messages in bulk
+
+HEADER = struct.Struct('<2sHHBB')   # 'BR', payload length, message id, source device, destination device
+CHECKSUM = struct.Struct('<H')      # Sum of every byte before it
+
+# Big enough for any Ping protocol message, including the longest profiles
+BUFFER_SIZE = HEADER.size + 0xffff + CHECKSUM.size
+
+
+class pingDatagramParser(object):
+    '''
+    Parses Ping protocol messages straight out of a preallocated receive buffer.
+
+    Each datagram is received into the same buffer with recv_into, and every message in it is decoded with
+    one struct call for the header and one for the payload, instead of feeding the parser a byte at a time.
+    '''
+
+    def __init__(self, payloadDict: dict):
+        '''
+        :param payloadDict: the message definitions, brping.pingmessage.payload_dict
+        '''
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.errors = 0     # Messages dropped for a bad checksum or length
+
+        # Compile the payload formats once. Messages whose field list is longer than their format
+        # end in a variable length array (e.g. the profile data), which is returned as a memoryview
+        self.__formats = {}
+        for messageId, definition in payloadDict.items():
+            fixed = struct.Struct('<' + definition['format'])
+            fixedFields = len(fixed.unpack(bytes(fixed.size)))
+            names = definition['field_names']
+            self.__formats[messageId] = (fixed, names[:fixedFields], names[fixedFields:])
+
+    def receive(self, sock) -> list:
+        '''
+        Receives one datagram from the socket into the buffer, and returns every message in it.
+        See parse for details of the return value.
+        '''
+        length = sock.recv_into(self.buffer)
+        return self.parse(length)
+
+    def parse(self, length: int) -> list:
+        '''
+        Returns a list of (messageId, fields) for each valid message in the first length bytes of the buffer,
+        where fields is a dictionary of the message's fields.
+
+        A variable length array at the end of a message is returned as a memoryview of the buffer, which is
+        only valid until the next datagram is received. Copy it (e.g. with bytes()) to keep it.
+        '''
+        messages = []
+        offset = 0
+        while offset + HEADER.size + CHECKSUM.size <= length:
+            start, payloadLength, messageId, src, dst = HEADER.unpack_from(self.buffer, offset)
+            if start != b'BR':
+                # Skip to the next possible message start
+                offset = self.buffer.find(b'BR', offset + 1, length)
+                if offset < 0:
+                    break
+                continue
+
+            end = offset + HEADER.size + payloadLength
+            if end + CHECKSUM.size > length:
+                self.errors += 1
+                break   # Truncated
+
+            if sum(self.view[offset:end]) & 0xffff != CHECKSUM.unpack_from(self.buffer, end)[0]:
+                self.errors += 1
+                offset += 1
+                continue
+
+            if messageId in self.__formats:
+                fields = self.__decode(messageId, offset + HEADER.size, end)
+                if fields is not None:
+                    messages.append((messageId, fields))
+            offset = end + CHECKSUM.size
+
+        return messages
+
+    def __decode(self, messageId: int, start: int, end: int) -> dict:
+        '''Decodes the payload between start and end, or returns None if it is too short for the message'''
+        fixed, names, arrayNames = self.__formats[messageId]
+        if end - start < fixed.size:
+            self.errors += 1
+            return None
+
+        fields = dict(zip(names, fixed.unpack_from(self.buffer, start)))
+        if arrayNames:
+            fields[arrayNames[0]] = self.view[start + fixed.size:end]
+        return fields
@@ -1,77 +1,257 @@
 # External
 import socket                   # For communicating via udp
 import json                     # For formatting output
-from brping import pingmessage  # For communication with the sensor
+from collections import deque, namedtuple      # For the reading history
+from threading import Condition     # For waiting on replies
+from time import monotonic      # For timestamping readings
 # Internal
 from mavlinkinterface.logger import getLogger   # For logging
 
 
+# Message ids, kept here so brping is only imported once a sonar is created
+PING1D_DISTANCE_SIMPLE = 1211
+PING1D_PROFILE = 1300
+PING1D_CONTINUOUS_START = 1400
+PING1D_CONTINUOUS_STOP = 1401
+
+# A message received from the sensor.
+# time: monotonic time it arrived, message: the message id, data: dict of the message's fields
+sonarReading = namedtuple('sonarReading', ['time', 'message', 'data'])
+
+
 # Repurposed from code found here:
 # https://discuss.bluerobotics.com/t/4397/13
 class sonar(object):
-    def __init__(self):
+    '''
+    A Ping1D sonar sensor, connected over UDP.
+
+    Every message the sensor sends is read (by the I/O thread of the sonarArray the sonar belongs to) into a
+    store of the latest reading of each message type, and a history of recent readings. Messages can be
+    requested one at a time with getMessageData, or the sensor can be told to send them continuously with
+    startStreaming, after which getLatest returns the newest reading without waiting on the network.
+    '''
 
+    def __init__(self, address: tuple = ("192.168.2.2", 9090), historyLength: int = 100):
+        '''
+        :param address: the (host, port) of the sensor
+        :param historyLength: the number of readings kept in history
+        '''
         self.disabled = False
         self.log = getLogger('sonar')
         self.log.trace('Sonar sensor initialization started')
         # set address
-        self.address = ("192.168.2.2", 9090)
+        self.address = address
 
-        # Configure Socket
+        # Configure Socket, read when the I/O thread sees data waiting
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.__sock.settimeout(1.0)
+        self.__sock.setblocking(False)
+
+        # pingmessage is used to build requests
+        from brping import pingmessage  # For communication with the sensor
+        self.__pingmessage = pingmessage
+
+        # Readings store
+        self.history = deque(maxlen=historyLength)
+        self.__latest = {}      # message id -> sonarReading
+        self.__arrived = Condition()
+        self.streaming = set()  # ids of the messages being sent continuously
+        self.profiles = None    # profileWaterfall, once captureProfiles is called
 
-        # create pingmessage parser
-        self.__parser = pingmessage.PingParser()
         self.log.trace('Sonar sensor initialization completed')
         self.log.trace('Note that this does not guarantee a working sonar sensor is attached')
 
+    def fileno(self) -> int:
+        '''The socket's file descriptor, so the sonar can be registered with a selector'''
+        return self.__sock.fileno()
+
+    def close(self) -> None:
+        '''Stops any streaming, finishes any profile recording, and closes the socket'''
+        self.stopStreaming()
+        self.__sock.close()
+        if self.profiles is not None:
+            self.profiles.close()
+
+    def __send(self, messageId, **fields):
+        '''
+        Sends a message with the given fields to the sensor
+
+        :param messageId: the id of the message to send
+        '''
+        msg = self.__pingmessage.PingMessage(messageId)
+        for name, value in fields.items():
+            setattr(msg, name, value)
+        msg.pack_msg_data()
+        self.__sock.sendto(msg.msg_data, self.address)
+
     def __request(self, id):
         '''
         Request new messages of a specific ID
 
         :param id: The ID to refrest messages with
         '''
-        msg = pingmessage.PingMessage()
+        msg = self.__pingmessage.PingMessage()
         msg.request_id = id
         msg.pack_msg_data()
         self.__sock.sendto(msg.msg_data, self.address)
         self.log.trace('Request sent for message of id: ' + str(id))
 
-    # parse data to create ping messages
-    def __parse(self, data):
+    def readAvailable(self, parser) -> None:
         '''
-        Parses the given data
+        Reads and stores every datagram waiting on the socket. Called by the I/O thread when the socket is readable
 
-        :param data: the data to parse
+        :param parser: the pingDatagramParser to receive with
         '''
-        for b in bytearray(data):
-            if self.__parser.parse_byte(b) == self.__parser.NEW_MESSAGE:
-                return self.__parser.rx_msg
-        return {}   # If message is empty
+        while True:
+            try:
+                messages = parser.receive(self.__sock)
+            except (BlockingIOError, ConnectionRefusedError):
+                return  # Nothing left to read (or the sensor is not there)
+            if self.disabled:
+                continue    # Simulating a failed sensor
+
+            now = monotonic()
+            for messageId, fields in messages:
+                if messageId == PING1D_PROFILE and self.profiles is not None:
+                    # Copied straight into the waterfall, the reading keeps a view of its row
+                    fields['profile_data'] = self.profiles.add(now, fields)
+                for name, value in fields.items():
+                    if isinstance(value, memoryview):
+                        fields[name] = bytes(value)     # The buffer is reused for the next datagram
+                self.__store(sonarReading(now, messageId, fields))
+
+    def __store(self, reading: sonarReading) -> None:
+        '''Makes a reading the latest of its message type, and wakes anything waiting for it'''
+        with self.__arrived:
+            self.__latest[reading.message] = reading
+            self.history.append(reading)
+            self.__arrived.notify_all()
 
-    def getMessage(self, message=pingmessage.PING1D_DISTANCE_SIMPLE):
+    def startStreaming(self, messages: tuple = (PING1D_DISTANCE_SIMPLE,)) -> None:
         '''
-        Requests and retrieves the given message from the sonar sensor
-        For a list of messages and what they return, check here:
-        https://docs.bluerobotics.com/ping-protocol/pingmessage-ping1d/
+        Tells the sensor to send the given messages continuously
+
+        :param messages: the ids of the messages to stream, e.g. PING1D_DISTANCE_SIMPLE and PING1D_PROFILE
         '''
-        self.log.trace('Getting sonar message of id: ' + str(message))
-        self.__request(message)
-        try:
-            if self.disabled:
-                raise socket.timeout
-            data, addr = self.__sock.recvfrom(1024)
-        except socket.timeout:  # If unable to retrieve the requested data within 1 sec
-            self.log.error('A Timeout occurred when retrieving a sonar message of id ' + str(message))
-            raise TimeoutError('A Timeout occurred when retrieving a sonar message of id ' + str(message))
+        for message in messages:
+            self.log.info('Starting continuous output of sonar message ' + str(message))
+            self.__send(PING1D_CONTINUOUS_START, id=message)
+            self.streaming.add(message)
 
-        parsedData = self.__parse(data)
+    def stopStreaming(self, messages: tuple = None) -> None:
+        '''
+        Tells the sensor to stop sending the given messages continuously
 
-        # Convert specialized object to dictionary
+        :param messages: <optional> the ids of the messages to stop. Stops all streamed messages if not given.
+        '''
+        for message in tuple(self.streaming if messages is None else messages):
+            self.log.info('Stopping continuous output of sonar message ' + str(message))
+            self.__send(PING1D_CONTINUOUS_STOP, id=message)
+            self.streaming.discard(message)
+
+    def captureProfiles(self, capacity: int = 256, width: int = 200, recordPath: str = None,
+                        recordRows: int = 36000, stream: bool = True):
+        '''
+        Starts keeping every profile the sensor sends in a waterfall of numpy arrays, and returns it.
+        See profileWaterfall for the parameters.
+
+        :param stream: tell the sensor to send profiles continuously
+        '''
+        from mavlinkinterface.commands.passive.sonarProfiles import profileWaterfall
+        if self.profiles is not None:
+            self.profiles.close()
+        self.profiles = profileWaterfall(capacity, width, recordPath, recordRows)
+        if stream:
+            self.startStreaming((PING1D_PROFILE,))
+        return self.profiles
+
+    def getProfile(self, maxAge: float = None, wait: float = 0):
+        '''
+        Returns the newest profile as a sonarProfile, with the samples as a numpy uint8 array.
+        Requests one from the sensor if profiles are not being streamed.
+        Raises a TimeoutError if there is no profile, or it is older than maxAge.
+
+        :param maxAge: <optional> the oldest streamed profile, in seconds, to accept
+        :param wait: <optional> seconds to wait for the first streamed profile
+        '''
+        if self.profiles is None:
+            self.captureProfiles(stream=False)
+        if PING1D_PROFILE not in self.streaming:
+            self.getMessageData(PING1D_PROFILE)
+            return self.profiles.latest()
+
+        with self.__arrived:
+            if wait > 0:
+                self.__arrived.wait_for(lambda: len(self.profiles) > 0, wait)
+        profile = self.profiles.latest()
+        if profile is None:
+            raise TimeoutError('No sonar profile has been received')
+        if maxAge is not None and monotonic() - profile.time > maxAge:
+            raise TimeoutError('The latest sonar profile is ' + str(round(monotonic() - profile.time, 2)) + ' seconds old')
+        return profile
+
+    def getLatest(self, message=PING1D_DISTANCE_SIMPLE, maxAge: float = None, wait: float = 0) -> sonarReading:
+        '''
+        Returns the newest reading of the given message without requesting a new one.
+        Raises a TimeoutError if there is no reading, or it is older than maxAge.
+
+        :param maxAge: <optional> the oldest reading, in seconds, to accept
+        :param wait: <optional> seconds to wait for a reading if none has arrived since the sensor was created
+        '''
+        with self.__arrived:
+            if wait > 0:
+                self.__arrived.wait_for(lambda: message in self.__latest, wait)
+            reading = self.__latest.get(message)
+
+        if reading is None:
+            raise TimeoutError('No sonar message of id ' + str(message) + ' has been received')
+        if maxAge is not None and monotonic() - reading.time > maxAge:
+            raise TimeoutError('The latest sonar message of id ' + str(message) + ' is '
+                               + str(round(monotonic() - reading.time, 2)) + ' seconds old')
+        return reading
+
+    def getNearest(self, time: float, message=PING1D_DISTANCE_SIMPLE, tolerance: float = None) -> sonarReading:
+        '''
+        Returns the reading in history closest in time to the given time, or None if there is none within tolerance
+
+        :param time: the monotonic time to look for
+        :param tolerance: <optional> the furthest in seconds a reading may be from the given time
+        '''
+        with self.__arrived:
+            nearest = min((r for r in self.history if r.message == message),
+                          key=lambda r: abs(r.time - time), default=None)
+        if nearest is None or (tolerance is not None and abs(nearest.time - time) > tolerance):
+            return None
+        return nearest
+
+    def getMessage(self, message=PING1D_DISTANCE_SIMPLE):
+        '''
+        Requests and retrieves the given message from the sonar sensor, as a JSON-formatted string of string values,
+        except for arrays (e.g. profile data), which are lists of numbers.
+        For a list of messages and what they return, check here:
+        https://docs.bluerobotics.com/ping-protocol/pingmessage-ping1d/
+        '''
         returnDict = {}
-        for field in pingmessage.payload_dict[parsedData.message_id]['field_names']:
-            returnDict[field] = str(getattr(parsedData, field))
+        for field, value in self.getMessageData(message).items():
+            returnDict[field] = [int(v) for v in value] if hasattr(value, '__len__') and not isinstance(value, str) else str(value)
         returnJson = json.dumps(returnDict)
         self.log.trace('getMessage preparing to return ' + returnJson)
         return returnJson
+
+    def getMessageData(self, message=PING1D_DISTANCE_SIMPLE, timeout: float = 1) -> dict:
+        '''
+        Requests and retrieves the given message from the sonar sensor, as a dictionary of the message's fields
+        with their values as sent by the sensor
+
+        :param timeout: seconds to wait for the reply
+        '''
+        self.log.trace('Getting sonar message of id: ' + str(message))
+        with self.__arrived:
+            previous = self.__latest.get(message)
+        self.__request(message)
+
+        # Wait for the reader to receive a newer reading than the one before the request
+        with self.__arrived:
+            if not self.__arrived.wait_for(lambda: self.__latest.get(message) is not previous, timeout):
+                self.log.error('A Timeout occurred when retrieving a sonar message of id ' + str(message))
+                raise TimeoutError('A Timeout occurred when retrieving a sonar message of id ' + str(message))
+            return self.__latest[message].data
@@ -0,0 +1,104 @@
+# External
+import selectors                # For waiting on every sonar socket at once
+from collections import namedtuple  # For aligned readings
+from threading import Thread, Event     # For the I/O thread
+# Internal
+from mavlinkinterface.logger import getLogger   # For logging
+from mavlinkinterface.commands.passive.sonar import sonar, PING1D_DISTANCE_SIMPLE
+from mavlinkinterface.commands.passive.pingParser import pingDatagramParser    # For decoding messages
+
+# Readings from every sonar, taken as close as possible to the same time.
+# time: the monotonic time the readings were aligned to
+# readings: one sonarReading per sonar, in order, or None for a sonar with no reading close enough
+alignedReadings = namedtuple('alignedReadings', ['time', 'readings'])
+
+
+class sonarArray(object):
+    '''
+    Any number of Ping1D sonars, all read by a single I/O thread that waits on every sonar's socket
+    with a selector, so adding a sonar does not add a thread.
+
+    The sonars are available by index (sonars[0]), and getAligned returns a reading from each of them
+    matched up by time.
+    '''
+
+    def __init__(self, addresses: list, historyLength: int = 100):
+        '''
+        :param addresses: the (host, port) of each sonar
+        :param historyLength: the number of readings each sonar keeps in history
+        '''
+        self.log = getLogger('sonar')
+        from brping import pingmessage  # For the message definitions
+        self.__parser = pingDatagramParser(pingmessage.payload_dict)  # Only used by the I/O thread
+        self.__selector = selectors.DefaultSelector()
+
+        self.devices = []
+        for address in addresses:
+            device = sonar(address, historyLength)
+            self.__selector.register(device, selectors.EVENT_READ)
+            self.devices.append(device)
+        self.log.trace('Sonar array created with ' + str(len(self.devices)) + ' sonar(s)')
+
+        self.__stop = Event()
+        self.__thread = Thread(target=self.__run)
+        self.__thread.daemon = True     # Kill on program end
+        self.__thread.start()
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def __getitem__(self, index: int) -> sonar:
+        return self.devices[index]
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __run(self) -> None:
+        '''Reads from each sonar as data arrives on its socket, until close is called'''
+        while not self.__stop.is_set():
+            for key, events in self.__selector.select(timeout=0.5):
+                try:
+                    key.fileobj.readAvailable(self.__parser)
+                except Exception:
+                    self.log.exception('Failed to read from sonar at ' + str(key.fileobj.address))
+
+    def close(self) -> None:
+        '''Stops streaming on every sonar, and stops the I/O thread'''
+        self.__stop.set()
+        self.__thread.join()
+        for device in self.devices:
+            self.__selector.unregister(device)
+            device.close()
+        self.__selector.close()
+
+    def startStreaming(self, messages: tuple = (PING1D_DISTANCE_SIMPLE,)) -> None:
+        '''Tells every sonar to send the given messages continuously, see sonar.startStreaming'''
+        for device in self.devices:
+            device.startStreaming(messages)
+
+    def stopStreaming(self, messages: tuple = None) -> None:
+        '''Tells every sonar to stop sending the given messages continuously, see sonar.stopStreaming'''
+        for device in self.devices:
+            device.stopStreaming(messages)
+
+    def getAligned(self, message=PING1D_DISTANCE_SIMPLE, time: float = None, tolerance: float = 0.1) -> alignedReadings:
+        '''
+        Returns the reading from each sonar closest to the same moment
+
+        :param message: the id of the message to align
+        :param time: <optional> the monotonic time to align to. Defaults to the time of the newest reading from any sonar
+        :param tolerance: the furthest in seconds a sonar's reading may be from that time.
+                          Sonars with no reading that close are None in the result.
+        '''
+        if time is None:
+            latest = []
+            for device in self.devices:
+                try:
+                    latest.append(device.getLatest(message).time)
+                except TimeoutError:
+                    pass    # Nothing from this sonar yet
+            if not latest:
+                return alignedReadings(None, tuple(None for device in self.devices))
+            time = max(latest)
+
+        return alignedReadings(time, tuple(device.getNearest(time, message, tolerance) for device in self.devices))
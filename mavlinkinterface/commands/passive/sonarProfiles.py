@@ -0,0 +1,147 @@
+# External
+from collections import namedtuple  # For profile readings
+from threading import Lock          # For reading the ring while the I/O thread writes to it
+# Internal
+from mavlinkinterface.logger import getLogger   # For logging
+
+# One ping of a Ping1D profile.
+# time: monotonic time it arrived, pingNumber: the sensor's ping counter,
+# scanStart, scanLength, distance: meters, confidence: percent,
+# samples: numpy uint8 array of echo strength, spread evenly from scanStart to scanStart + scanLength
+sonarProfile = namedtuple('sonarProfile', ['time', 'pingNumber', 'scanStart', 'scanLength',
+                                           'distance', 'confidence', 'samples'])
+
+
+def profileDtype(width: int):
+    '''
+    The numpy dtype of one recorded profile. Distances are millimeters, as sent by the sensor.
+
+    :param width: the number of samples kept from each profile
+    '''
+    import numpy as np
+    return np.dtype([('time', '<f8'),
+                     ('pingNumber', '<u4'),
+                     ('scanStart', '<u4'),
+                     ('scanLength', '<u4'),
+                     ('distance', '<u4'),
+                     ('confidence', '<u2'),
+                     ('sampleCount', '<u2'),
+                     ('samples', 'u1', (width,))])
+
+
+class profileWaterfall(object):
+    '''
+    A fixed number of the most recent sonar profiles, kept in one preallocated array (a waterfall),
+    with one row per ping. Profiles are copied straight from the receive buffer into the next row,
+    so capturing a profile does not allocate anything.
+
+    Profiles longer than width are cut short. Rows are numpy structured arrays of profileDtype,
+    so for example waterfall.recent()['samples'] is a 2-D array of echo strength by ping and sample.
+
+    Optionally, every profile is also written to a .npy file (memory-mapped, so it is written as it goes)
+    of a fixed number of rows, which can be read back with numpy.load(path, mmap_mode='r').
+    Recording stops once the file is full. Rows past recorded are left as zeros.
+    '''
+
+    def __init__(self, capacity: int = 256, width: int = 200, recordPath: str = None, recordRows: int = 36000):
+        '''
+        :param capacity: the number of profiles kept in memory
+        :param width: the most samples kept from each profile
+        :param recordPath: <optional> the path of a .npy file to record every profile to
+        :param recordRows: the most profiles the recording can hold (36000 is an hour at 10 pings per second)
+        '''
+        import numpy as np  # Only needed once profiles are captured
+        self.__np = np
+        self.log = getLogger('sonar')
+        self.capacity = capacity
+        self.width = width
+        self.dtype = profileDtype(width)
+
+        self.__lock = Lock()
+        self.__rows = np.zeros(capacity, dtype=self.dtype)
+        self.__count = 0            # Profiles captured in total
+        self.truncated = 0          # Profiles longer than width
+
+        self.recordPath = recordPath
+        self.recorded = 0
+        self.__recording = None
+        if recordPath is not None:
+            self.__recording = np.lib.format.open_memmap(recordPath, mode='w+', dtype=self.dtype, shape=(recordRows,))
+            self.log.info('Recording sonar profiles to ' + recordPath)
+
+    def __len__(self) -> int:
+        return min(self.__count, self.capacity)
+
+    def add(self, time: float, fields: dict):
+        '''
+        Copies a profile message into the next row, and records it if recording.
+        Returns the row's samples as a read-only array, which is overwritten once capacity more profiles arrive.
+        Called by the I/O thread.
+
+        :param time: the monotonic time the profile arrived
+        :param fields: the decoded fields of the profile message, with profile_data a buffer of the samples
+        '''
+        data = fields['profile_data']
+        sampleCount = min(len(data), self.width)
+        if len(data) > self.width:
+            self.truncated += 1
+
+        with self.__lock:
+            row = self.__rows[self.__count % self.capacity]
+            row['time'] = time
+            row['pingNumber'] = fields['ping_number']
+            row['scanStart'] = fields['scan_start']
+            row['scanLength'] = fields['scan_length']
+            row['distance'] = fields['distance']
+            row['confidence'] = fields['confidence']
+            row['sampleCount'] = sampleCount
+            samples = row['samples']
+            samples[:sampleCount] = self.__np.frombuffer(data, dtype=self.__np.uint8, count=sampleCount)
+            samples[sampleCount:] = 0
+            self.__count += 1
+
+            if self.__recording is not None and self.recorded < len(self.__recording):
+                self.__recording[self.recorded] = row
+                self.recorded += 1
+                if self.recorded == len(self.__recording):
+                    self.log.warning('Sonar profile recording ' + self.recordPath + ' is full, recording stopped')
+
+        view = samples[:sampleCount]
+        view.flags.writeable = False
+        return view
+
+    def latest(self) -> sonarProfile:
+        '''Returns a copy of the newest profile, or None if none have arrived'''
+        with self.__lock:
+            if self.__count == 0:
+                return None
+            row = self.__rows[(self.__count - 1) % self.capacity].copy()
+
+        sampleCount = int(row['sampleCount'])
+        return sonarProfile(time=float(row['time']),
+                            pingNumber=int(row['pingNumber']),
+                            scanStart=int(row['scanStart']) / 1000,
+                            scanLength=int(row['scanLength']) / 1000,
+                            distance=int(row['distance']) / 1000,
+                            confidence=int(row['confidence']),
+                            samples=row['samples'][:sampleCount])
+
+    def recent(self, count: int = None):
+        '''
+        Returns a copy of the most recent profiles, oldest first, as a structured array of profileDtype
+
+        :param count: <optional> the number of profiles to return. Returns every profile held if not given.
+        '''
+        with self.__lock:
+            held = min(self.__count, self.capacity)
+            count = held if count is None else min(count, held)
+            first = self.__count - count
+            return self.__rows.take(self.__np.arange(first, self.__count) % self.capacity)
+
+    def close(self) -> None:
+        '''Finishes writing the recording, if any'''
+        with self.__lock:
+            if self.__recording is not None:
+                self.__recording.flush()
+                self.__recording = None
+                self.log.info(str(self.recorded) + ' sonar profiles recorded to ' + self.recordPath)
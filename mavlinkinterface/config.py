@@ -0,0 +1,271 @@
+from collections import namedtuple      # For describing config options
+from configparser import ConfigParser   # For reading and writing the config file
+from os import replace                  # For replacing the config file in one step
+from os.path import exists              # For checking if config file exists
+from threading import Lock, Timer       # For delaying writes until changes stop
+
+from mavlinkinterface.logger import getLogger
+
+# type: the python type the option is parsed as (str, int, float or bool)
+# default: the value used when the option is missing or invalid
+# validate: <optional> function returning true if a value is allowed
+option = namedtuple('option', ['type', 'default', 'validate'])
+
+
+def positive(value) -> bool:
+    return value > 0
+
+
+def notNegative(value) -> bool:
+    return value >= 0
+
+
+# The options of each section, in the order they are written to the file.
+# Strings are written as they are, as comments for the option that follows them.
+schema = {
+    'version': {'version': option(str, '1.1', None)},
+    'mavlink': {'connectionString': option(str, 'udp:0.0.0.0:14550', None)},
+    'geodata': {'COMMENT_1': 'The pressure in pascals at the surface of the body of water.',
+                'COMMENT_1B': 'Sea Level is around 101325. Varies day by day',
+                'surfacePressure': option(float, 101325, positive),
+                'COMMENT_2': 'The density of the diving medium. Pure water is 1000',
+                'fluidDensity': option(float, 1000, positive)},
+    'messages': {'refreshrate': option(float, 0.04, positive),
+                 'controlRate': option(float, 0.1, positive),
+                 'COMMENT_1': 'json: sensor commands return JSON strings, native: they return named tuples of numbers',
+                 'returnMode': option(str, 'json', lambda v: v.lower() in ('json', 'native'))},
+    'hardware': {'sonarcount': option(int, 1, notNegative),
+                 'gps': option(bool, True, None)},
+    'link': {'COMMENT_1': 'Seconds without a heartbeat before the link is degraded, and before it is lost',
+             'degradedTimeout': option(float, 1.5, positive),
+             'lostTimeout': option(float, 3, positive),
+             'COMMENT_2': 'The fraction of messages lost over a second above which the link is degraded',
+             'maxLossRate': option(float, 0.1, positive),
+             'COMMENT_3': 'Seconds between TIMESYNC requests used to measure round trip time',
+             'pingInterval': option(float, 1, positive),
+             'COMMENT_4': 'nothing: only log a lost link, stop: also stop all commands and return controls to neutral',
+             'lossAction': option(str, 'nothing', lambda v: v.lower() in ('nothing', 'stop'))},
+    'sonar': {'COMMENT_1': 'The address of each Ping sonar, separated by commas, as host or host:port',
+              'address': option(str, '192.168.2.2', None),
+              'COMMENT_1B': 'The UDP port of sonars listed without one',
+              'port': option(int, 9090, positive),
+              'COMMENT_2': 'When True, the sonar sends distances continuously instead of when asked',
+              'streaming': option(bool, True, None),
+              'COMMENT_3': 'The oldest streamed reading (seconds) getAltitude will return',
+              'maxAge': option(float, 1, positive),
+              'historyLength': option(int, 100, positive),
+              'COMMENT_4': 'The number of echo profiles kept in memory, and the most samples kept from each',
+              'profileCapacity': option(int, 256, positive),
+              'profileSamples': option(int, 200, positive)},
+    'gps': {'COMMENT_1': 'The number of GPS fixes kept in the track, and the message their positions are taken from',
+            'trackLength': option(int, 3600, positive),
+            'trackSource': option(str, 'GPS_RAW_INT', lambda v: v in ('GPS_RAW_INT', 'GLOBAL_POSITION_INT')),
+            'COMMENT_2': 'The worst fix counted as good: lowest fix type (2: 2D, 3: 3D) and highest HDOP',
+            'minFixType': option(int, 3, notNegative),
+            'maxHdop': option(float, 5, positive),
+            'COMMENT_3': 'Seconds after which the last known good position is stale',
+            'maxAge': option(float, 2, positive)},
+    'depthControl': {'COMMENT_1': 'Gains of the dive PID controller, in percent throttle',
+                     'kp': option(float, 100, notNegative),
+                     'ki': option(float, 10, notNegative),
+                     'kd': option(float, 60, notNegative),
+                     'COMMENT_2': 'Distance from the target depth (m) that counts as arrived',
+                     'tolerance': option(float, 0.05, positive),
+                     'settleTime': option(float, 1, notNegative),
+                     'COMMENT_3': 'When True, control from the fused depth estimate at IMU rate instead of raw pressure',
+                     'useEstimator': option(bool, True, None)},
+    'depthEstimator': {'COMMENT_1': 'Noise of a depth reading from pressure (m) and of the vertical acceleration (m/s^2)',
+                       'pressureSigma': option(float, 0.02, positive),
+                       'accelSigma': option(float, 0.5, positive),
+                       'COMMENT_2': 'How quickly the accelerometer bias may change (m/s^2 per root second)',
+                       'biasSigma': option(float, 0.02, positive),
+                       'COMMENT_3': 'The IMU message accelerations are read from: RAW_IMU, SCALED_IMU or SCALED_IMU2',
+                       'imuMessage': option(str, 'RAW_IMU', lambda v: v in ('RAW_IMU', 'SCALED_IMU', 'SCALED_IMU2'))},
+    'headingControl': {'COMMENT_1': 'Desired turn rate (deg/s) per degree of heading error',
+                       'angleGain': option(float, 2, positive),
+                       'maxRate': option(float, 45, positive),
+                       'COMMENT_2': 'Percent throttle per deg/s of desired turn rate',
+                       'feedforward': option(float, 1, notNegative),
+                       'COMMENT_3': 'Gains of the turn rate PID controller, in percent throttle',
+                       'kp': option(float, 1.5, notNegative),
+                       'ki': option(float, 0.5, notNegative),
+                       'kd': option(float, 0, notNegative),
+                       'COMMENT_4': 'Heading error (degrees) that counts as arrived',
+                       'tolerance': option(float, 2, positive),
+                       'settleTime': option(float, 0.5, notNegative)},
+    'mission': {'COMMENT_1': 'The most items a mission may have, checked when adding survey patterns.',
+                'COMMENT_1B': 'ArduSub on a Pixhawk holds 718, boards storing missions on an SD card hold more',
+                'maxItems': option(int, 718, positive)},
+    'lights': {'COMMENT_1': 'servo: set the lights output PWM directly, buttons: step with buttons',
+               'backend': option(str, 'servo', lambda v: v.lower() in ('servo', 'buttons')),
+               'COMMENT_2': 'The servo output the lights are connected to, and its PWM range',
+               'channel': option(int, 9, positive),
+               'pwmMin': option(int, 1100, positive),
+               'pwmMax': option(int, 1900, positive)}
+}
+
+
+class configStore(object):
+    '''
+    The contents of the config file, parsed once into typed and validated values.
+
+    Values are read with get(section, option) or config[section][option], and changed with set(),
+    which updates the values in place, notifies listeners, and writes the file once changes stop
+    for writeDelay seconds. The file is written to a temporary file first, then renamed over the
+    old one, so it is never left half written.
+    '''
+
+    def __init__(self, path: str, writeDelay: float = 1):
+        '''
+        :param path: the path of the config file. It is created with the default values if needed.
+        :param writeDelay: seconds to wait after a change before writing the file
+        '''
+        self.path = path
+        self.writeDelay = writeDelay
+        self.__log = getLogger('Config')
+        self.__lock = Lock()
+        self.__timer = None
+        self.__listeners = {}   # section -> tuple of functions taking (option, value)
+        self.__parser = ConfigParser()
+        self.__values = {}
+
+        if exists(path):
+            self.__log.trace('importing configuration file from path: ' + path)
+            self.__parser.read(path)
+
+        version = schema['version']['version'].default
+        if 'version' not in self.__parser or self.__parser['version'].get('version') != version:
+            # Missing or out of date, start again from the default config options
+            self.__parser = ConfigParser()
+
+        # Parse every option, adding any the file does not have yet
+        changed = False
+        for section, options in schema.items():
+            if section not in self.__parser:
+                self.__parser[section] = {}
+            for name, opt in options.items():
+                if isinstance(opt, str):
+                    if name not in self.__parser[section]:
+                        self.__parser[section][name] = opt
+                    continue
+
+                if name not in self.__parser[section]:
+                    self.__parser[section][name] = self.__format(opt.default)
+                    changed = True
+                try:
+                    value = self.__parse(section, name, self.__parser[section][name])
+                except ValueError as e:
+                    self.__log.error(str(e) + ', using the default of ' + str(opt.default))
+                    value = opt.default
+                self.__values[(section, name)] = value
+
+        if changed:
+            self.flush(force=True)
+
+    def get(self, section: str, name: str):
+        '''Returns the typed value of an option'''
+        return self.__values[(section, name)]
+
+    def section(self, section: str) -> dict:
+        '''Returns the typed values of every option in a section, keyed by option name'''
+        return {name: self.__values[(section, name)]
+                for name, opt in schema[section].items() if not isinstance(opt, str)}
+
+    def set(self, section: str, name: str, value) -> None:
+        '''
+        Validates and stores a new value for an option, notifies the section's listeners,
+        and schedules the file to be written.
+        Raises KeyError for unknown options, and ValueError for values that are not allowed.
+        '''
+        if (section, name) not in self.__values:
+            raise KeyError('Unknown config option: ' + section + '.' + name)
+        value = self.__parse(section, name, value)
+
+        with self.__lock:
+            if self.__values[(section, name)] == value:
+                return
+            self.__values[(section, name)] = value
+            self.__parser[section][name] = self.__format(value)
+
+            # Restart the countdown, so a burst of changes is written once
+            if self.__timer is not None:
+                self.__timer.cancel()
+            self.__timer = Timer(self.writeDelay, self.flush)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+        self.__log.trace('Config option ' + section + '.' + name + ' set to ' + str(value))
+        for callback in self.__listeners.get(section, ()):
+            try:
+                callback(name, value)
+            except Exception:
+                self.__log.exception('Listener for config section ' + section + ' failed')
+
+    def flush(self, force: bool = False) -> None:
+        '''
+        Writes any changes waiting to be written to the file straight away
+
+        :param force: write the file even if nothing has changed
+        '''
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            elif not force:
+                return
+
+            tempPath = self.path + '.tmp'
+            with open(tempPath, 'w') as configFile:
+                self.__parser.write(configFile)
+            replace(tempPath, self.path)
+        self.__log.trace('Config written to ' + self.path)
+
+    def addListener(self, section: str, callback) -> None:
+        '''
+        Registers a function to be called whenever an option in the section changes
+
+        :param callback: function taking the option name and its new value
+        '''
+        with self.__lock:
+            self.__listeners[section] = self.__listeners.get(section, ()) + (callback,)
+
+    def removeListener(self, section: str, callback) -> None:
+        '''Removes a function previously registered with addListener'''
+        with self.__lock:
+            self.__listeners[section] = tuple(c for c in self.__listeners.get(section, ()) if c != callback)
+
+    # Dict-style access, kept so code written against the old ConfigParser still works
+    def __getitem__(self, section: str) -> dict:
+        if section not in schema:
+            raise KeyError(section)
+        return self.section(section)
+
+    def __contains__(self, section: str) -> bool:
+        return section in schema
+
+    def __parse(self, section: str, name: str, value):
+        '''Converts a value (either a string from the file or a python value) to the option's type and validates it'''
+        opt = schema[section][name]
+        try:
+            if opt.type is bool and isinstance(value, str):
+                if value.lower() not in ConfigParser.BOOLEAN_STATES:
+                    raise ValueError
+                value = ConfigParser.BOOLEAN_STATES[value.lower()]
+            elif opt.type is int and isinstance(value, str):
+                value = int(float(value))
+            else:
+                value = opt.type(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid value for ' + section + '.' + name + ': ' + repr(value)
+                             + ' (expected ' + opt.type.__name__ + ')')
+
+        if opt.validate is not None and not opt.validate(value):
+            raise ValueError('Value not allowed for ' + section + '.' + name + ': ' + repr(value))
+        return value
+
+    @staticmethod
+    def __format(value) -> str:
+        '''Converts a value to the string written to the file, keeping whole numbers free of a trailing .0'''
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
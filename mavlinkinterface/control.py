@@ -0,0 +1,353 @@
+from threading import Event, Lock     # For signalling completion to the commanding thread
+from time import monotonic             # For timing control updates
+from math import degrees               # For converting ATTITUDE readings
+
+from mavlinkinterface.logger import getLogger
+
+
+class pid(object):
+    '''A PID controller with output limits and integrator anti-windup'''
+
+    def __init__(self, kp: float, ki: float = 0, kd: float = 0, outputLimit: float = 100):
+        '''
+        :param kp: proportional gain
+        :param ki: integral gain
+        :param kd: derivative gain
+        :param outputLimit: the output is clamped to +/- this value
+        '''
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.outputLimit = outputLimit
+        self.reset()
+
+    def reset(self) -> None:
+        '''Clears the integrator and derivative history'''
+        self.integral = 0
+        self.lastError = None
+
+    def update(self, error: float, dt: float, rate: float = None) -> float:
+        '''
+        Returns the controller output for the given error
+
+        :param error: setpoint minus measurement
+        :param dt: seconds since the last update
+        :param rate: <optional> the rate of change of the error. When not given, it is estimated from successive errors
+        '''
+        if rate is None:
+            rate = 0 if (self.lastError is None or dt <= 0) else (error - self.lastError) / dt
+        self.lastError = error
+
+        unclamped = self.kp * error + self.ki * (self.integral + error * dt) + self.kd * rate
+        output = max(-self.outputLimit, min(self.outputLimit, unclamped))
+
+        # Only integrate while not saturated, or while the error is pulling the output back out of saturation
+        if output == unclamped or (error * unclamped) < 0:
+            self.integral += error * dt
+
+        return output
+
+
+class messageController(object):
+    '''
+    Base class for closed-loop controllers that run one control step on every arrival of a mavlink message,
+    rather than on a timer. Subclasses set messageType and axis, and implement _step.
+
+    The controller finishes when it is killed, when messages stop arriving, or when _step reports that it has
+    held the target within tolerance for settleTime seconds.
+    '''
+
+    axis = None     # The manual control axis driven by the controller
+
+    def __init__(self, mli, name: str, tolerance: float, settleTime: float):
+        self._mli = mli
+        self._log = getLogger(name)
+        self.__lock = Lock()
+        self.tolerance = tolerance
+        self.settleTime = settleTime
+
+        self.target = None
+        self.lastUpdate = None      # monotonic time of the last message
+        self.finished = Event()
+        self.finished.set()
+        self.settled = False
+        self.__kill = None
+        self.__messageType = None
+        self.__settledSince = None
+
+    @property
+    def messageType(self) -> str:
+        '''The mavlink message that drives the controller'''
+        raise NotImplementedError
+
+    def start(self, target: float, maxThrottle: float = 100, kill: Event = None) -> None:
+        '''
+        Starts controlling towards the given target
+
+        :param target: the setpoint to reach and hold
+        :param maxThrottle: the largest percent throttle the controller may use
+        :param kill: <optional> when set, the controller stops at the next message
+        '''
+        with self.__lock:
+            self._log.info(type(self).__name__ + ' started, target=' + str(target) + ' throttle=' + str(maxThrottle))
+            self.pid.reset()
+            self.pid.outputLimit = maxThrottle
+            self.target = target
+            self.lastUpdate = None
+            self.settled = False
+            self.__settledSince = None
+            self.__kill = kill
+            self._reset()
+            self.finished.clear()
+
+            self.__messageType = self.messageType
+            self._mli.addMessageListener(self.__messageType, self.handleMessage)
+
+    def stop(self) -> None:
+        '''Stops controlling and returns the controlled axis to neutral'''
+        with self.__lock:
+            self.finished.set()
+            if self.__messageType is not None:
+                self._mli.removeMessageListener(self.__messageType, self.handleMessage)
+                self.__messageType = None
+            self._mli.manualControlParams.reset(self.axis)
+
+    def configure(self, option: str, value: float) -> None:
+        '''
+        Changes a setting of the controller, taking effect from the next message.
+        Takes the same option names as the constructor.
+        '''
+        with self.__lock:
+            if option in ('kp', 'ki', 'kd'):
+                setattr(self.pid, option, value)
+            elif hasattr(self, option):
+                setattr(self, option, value)
+            else:
+                raise AttributeError(type(self).__name__ + ' has no setting ' + option)
+
+    def wait(self, messageTimeout: float = 2) -> bool:
+        '''
+        Blocks until the controller has finished.
+        Returns true if it settled at the target, false if it was killed or messages stopped arriving.
+
+        :param messageTimeout: give up if no message arrives for this many seconds
+        '''
+        while not self.finished.wait(timeout=messageTimeout):
+            lastUpdate = self.lastUpdate
+            if lastUpdate is None or monotonic() - lastUpdate > messageTimeout:
+                self._log.error('No ' + str(self.__messageType) + ' for ' + str(messageTimeout)
+                                + ' seconds, stopping ' + type(self).__name__)
+                self.finished.set()
+        return self.settled
+
+    def handleMessage(self, msg) -> None:
+        '''Runs one control step, called with each message as it arrives'''
+        with self.__lock:
+            if self.finished.is_set():
+                return
+            if self.__kill is not None and self.__kill.is_set():
+                self.finished.set()
+                return
+
+            now = monotonic()
+            dt = 0 if self.lastUpdate is None else now - self.lastUpdate
+            self.lastUpdate = now
+
+            atTarget = self._step(msg, dt)
+            if atTarget is None:
+                # Finished immediately, no settling needed
+                self.settled = True
+                self.finished.set()
+            elif atTarget:
+                if self.__settledSince is None:
+                    self.__settledSince = now
+                elif now - self.__settledSince >= self.settleTime:
+                    self.settled = True
+                    self.finished.set()
+            else:
+                self.__settledSince = None
+
+    def _reset(self) -> None:
+        '''Clears subclass state when the controller is started'''
+        pass
+
+    def _step(self, msg, dt: float) -> bool:
+        '''
+        Runs one control step and sets the controlled axis.
+        Returns true while within tolerance of the target, false otherwise, or None to finish immediately
+
+        :param msg: the message that triggered the step
+        :param dt: seconds since the previous message, 0 on the first one
+        '''
+        raise NotImplementedError
+
+
+class depthController(messageController):
+    '''
+    Closed-loop depth control.
+    The PID runs once on every external pressure message as it arrives, and sets the vertical thrust from its output.
+    The controller settles when it has held the target depth within tolerance, nearly motionless, for settleTime seconds.
+
+    With useEstimator, and IMU messages arriving, the PID runs on every IMU message instead, using the depth and
+    climb rate from the interface's depthEstimator.
+    '''
+
+    axis = 'z'
+    g = 9.8066  # m/s^2
+
+    def __init__(self,
+                 mli,
+                 kp: float = 100,
+                 ki: float = 10,
+                 kd: float = 60,
+                 tolerance: float = 0.05,
+                 settleTime: float = 1,
+                 useEstimator: bool = True):
+        '''
+        :param mli: the mavlinkInterface to control
+        :param kp: percent throttle per meter of depth error
+        :param ki: percent throttle per meter-second of accumulated depth error
+        :param kd: percent throttle per m/s of vertical velocity
+        :param tolerance: the distance from the target (in meters) considered to be at the target
+        :param settleTime: seconds the drone must stay at the target before the controller has settled
+        :param useEstimator: control from the fused depth estimate when it is available
+        '''
+        super().__init__(mli, 'Depth', tolerance, settleTime)
+        self.pid = pid(kp, ki, kd)
+        self.useEstimator = useEstimator
+        self.maxVelocity = 0.1      # m/s, the drone must be slower than this to be considered settled
+        self.depth = None
+        self.velocity = 0
+        self.__estimating = False   # Whether this run is driven by the depth estimator
+
+    @property
+    def messageType(self) -> str:
+        if self.__estimating:
+            return self._mli.depthEstimator.imuMessage
+        return self._mli.externalPressureMessage
+
+    @property
+    def targetDepth(self) -> float:
+        '''The depth being controlled towards in meters'''
+        return self.target
+
+    @property
+    def error(self) -> float:
+        '''The current tracking error in meters (target minus current depth), or None before the first reading'''
+        depth, target = self.depth, self.target
+        if depth is None or target is None:
+            return None
+        return target - depth
+
+    def _reset(self) -> None:
+        self.depth = None
+        self.velocity = 0
+
+        # Read the conversion constants once rather than on every message
+        self.__surfacePressure = self._mli.config.get('geodata', 'surfacePressure')
+        self.__fluidDensity = self._mli.config.get('geodata', 'fluidDensity')
+
+        # Only use the estimator if it is running on live IMU data
+        lastImu = self._mli.depthEstimator.lastImu
+        self.__estimating = (self.useEstimator and self._mli.depthEstimator.ready.is_set()
+                             and lastImu is not None and monotonic() - lastImu < 1)
+
+    def _step(self, msg, dt: float) -> bool:
+        if self.__estimating:
+            estimate = self._mli.depthEstimator.estimate()
+            depth = estimate.depth
+            self.velocity = estimate.climbRate
+        else:
+            depth = -(100 * msg.press_abs - self.__surfacePressure) / (self.__fluidDensity * self.g)
+            if self.depth is not None and dt > 0:
+                # Low-pass filter the differentiated depth, pressure readings are noisy
+                self.velocity += 0.5 * ((depth - self.depth) / dt - self.velocity)
+        self.depth = depth
+
+        error = self.target - depth
+        throttle = self.pid.update(error, dt, rate=-self.velocity)
+        self._mli.manualControlParams.update(z=int(500 + 5 * throttle))
+
+        # At the surface the drone cannot rise any further, so reaching it is enough
+        if self.target >= 0 and depth >= -self.tolerance:
+            return None
+
+        return abs(error) <= self.tolerance and abs(self.velocity) <= self.maxVelocity
+
+
+class headingController(messageController):
+    '''
+    Closed-loop heading control, run on every ATTITUDE message as it arrives.
+
+    The heading error (wrapped to +/-180 degrees) is turned into a desired turn rate, limited to maxRate.
+    The rotational thrust is that rate times the feedforward gain, plus a PID on the difference between the
+    desired rate and the measured yawspeed.
+    The controller settles when it has held the heading within tolerance, nearly motionless, for settleTime seconds.
+    '''
+
+    axis = 'r'
+    messageType = 'ATTITUDE'
+
+    def __init__(self,
+                 mli,
+                 angleGain: float = 2,
+                 maxRate: float = 45,
+                 feedforward: float = 1,
+                 kp: float = 1.5,
+                 ki: float = 0.5,
+                 kd: float = 0,
+                 tolerance: float = 2,
+                 settleTime: float = 0.5):
+        '''
+        :param mli: the mavlinkInterface to control
+        :param angleGain: desired turn rate in deg/s per degree of heading error
+        :param maxRate: the fastest desired turn rate in deg/s
+        :param feedforward: percent throttle per deg/s of desired turn rate
+        :param kp: percent throttle per deg/s of turn rate error
+        :param ki: percent throttle per degree of accumulated turn rate error
+        :param kd: percent throttle per deg/s^2 of turn rate error change
+        :param tolerance: the heading error (in degrees) considered to be at the target
+        :param settleTime: seconds the drone must stay at the target before the controller has settled
+        '''
+        super().__init__(mli, 'Heading', tolerance, settleTime)
+        self.pid = pid(kp, ki, kd)
+        self.angleGain = angleGain
+        self.maxRate = maxRate
+        self.feedforward = feedforward
+        self.maxSettledRate = 2     # deg/s, the drone must be turning slower than this to be considered settled
+        self.heading = None
+        self.rate = 0
+
+    @property
+    def targetHeading(self) -> float:
+        '''The heading being controlled towards in degrees'''
+        return self.target
+
+    @property
+    def error(self) -> float:
+        '''The current heading error in degrees from -180 to 180, or None before the first reading'''
+        heading, target = self.heading, self.target
+        if heading is None or target is None:
+            return None
+        return wrapAngle(target - heading)
+
+    def _reset(self) -> None:
+        self.heading = None
+        self.rate = 0
+
+    def _step(self, msg, dt: float) -> bool:
+        self.heading = degrees(msg.yaw) % 360
+        self.rate = degrees(msg.yawspeed)
+        error = wrapAngle(self.target - self.heading)
+
+        desiredRate = max(-self.maxRate, min(self.maxRate, self.angleGain * error))
+        throttle = self.feedforward * desiredRate + self.pid.update(desiredRate - self.rate, dt)
+        throttle = max(-self.pid.outputLimit, min(self.pid.outputLimit, throttle))
+        self._mli.manualControlParams.update(r=int(10 * throttle))
+
+        return abs(error) <= self.tolerance and abs(self.rate) <= self.maxSettledRate
+
+
+def wrapAngle(angle: float) -> float:
+    '''Wraps an angle in degrees to the range -180 to 180'''
+    return (angle + 180) % 360 - 180
@@ -0,0 +1,149 @@
+from collections import namedtuple     # For estimates
+from math import cos, sin, sqrt         # For rotating accelerations into the vertical
+from threading import Event, Lock       # For reading the estimate while the refresh thread updates it
+from time import monotonic              # For timing prediction steps
+
+from mavlinkinterface.logger import getLogger
+from mavlinkinterface.sensorData import g
+
+# depth: meters (negative underwater, as getDepth), climbRate: m/s (positive up),
+# depthSigma, climbRateSigma: one standard deviation of each, time: monotonic time of the last update
+depthEstimate = namedtuple('depthEstimate', ['depth', 'climbRate', 'depthSigma', 'climbRateSigma', 'time'])
+
+
+class depthEstimator(object):
+    '''
+    A Kalman filter estimating depth and climb rate from the external pressure sensor and the accelerometer.
+
+    The state is depth, climb rate and accelerometer bias. Each IMU message predicts the state forward using the
+    vertical acceleration (the accelerometer reading rotated by the latest ATTITUDE, less gravity), so the
+    estimate is updated at IMU rate. Each pressure message corrects it. Estimating the bias keeps an offset
+    accelerometer from making the climb rate drift between pressure readings.
+    '''
+
+    def __init__(self,
+                 mli,
+                 pressureSigma: float = 0.02,
+                 accelSigma: float = 0.5,
+                 biasSigma: float = 0.02,
+                 imuMessage: str = 'RAW_IMU'):
+        '''
+        :param mli: the mavlinkInterface whose messages are used
+        :param pressureSigma: the noise of a single depth reading from pressure, in meters
+        :param accelSigma: the noise of the vertical acceleration, in m/s^2
+        :param biasSigma: how quickly the accelerometer bias may wander, in m/s^2 per root second
+        :param imuMessage: the IMU message to read accelerations from, RAW_IMU, SCALED_IMU or SCALED_IMU2
+        '''
+        self._mli = mli
+        self.log = getLogger('Depth')
+        self.pressureSigma = pressureSigma
+        self.accelSigma = accelSigma
+        self.biasSigma = biasSigma
+        self.imuMessage = imuMessage
+
+        self.__lock = Lock()
+        self.ready = Event()    # Set once the first pressure reading has arrived
+        self.__x = [0.0, 0.0, 0.0]                  # depth, climb rate, accelerometer bias
+        self.__P = [[0.0] * 3 for i in range(3)]    # Covariance of the state
+        self.__time = None      # monotonic time the state was last predicted to
+        self.__accel = 0.0      # Latest upwards acceleration, held between IMU messages
+        self.__attitude = (0.0, 0.0)    # roll, pitch
+        self.lastImu = None     # monotonic time of the last IMU message
+
+    def configure(self, option: str, value) -> None:
+        '''Changes a setting, taking effect from the next message. Takes the same option names as the constructor.'''
+        if option == 'imuMessage' and value != self.imuMessage:
+            self.stop()
+            self.imuMessage = value
+            self.start()
+        elif hasattr(self, option):
+            setattr(self, option, value)
+        else:
+            raise AttributeError('depthEstimator has no setting ' + option)
+
+    def start(self) -> None:
+        '''Starts updating the estimate as messages arrive'''
+        self._mli.addMessageListener('ATTITUDE', self.handleAttitude)
+        self._mli.addMessageListener(self.imuMessage, self.handleImu)
+        self._mli.addMessageListener(self._mli.externalPressureMessage, self.handlePressure)
+
+    def stop(self) -> None:
+        '''Stops updating the estimate'''
+        self._mli.removeMessageListener('ATTITUDE', self.handleAttitude)
+        self._mli.removeMessageListener(self.imuMessage, self.handleImu)
+        self._mli.removeMessageListener(self._mli.externalPressureMessage, self.handlePressure)
+
+    def estimate(self) -> depthEstimate:
+        '''Returns the current estimate, or None before the first pressure reading'''
+        with self.__lock:
+            if not self.ready.is_set():
+                return None
+            x, P = self.__x, self.__P
+            return depthEstimate(x[0], x[1], sqrt(P[0][0]), sqrt(P[1][1]), self.__time)
+
+    def handleAttitude(self, msg) -> None:
+        self.__attitude = (msg.roll, msg.pitch)
+
+    def handleImu(self, msg) -> None:
+        '''Predicts the state forward, then holds the new acceleration until the next IMU message'''
+        roll, pitch = self.__attitude
+        # Specific force along the earth's down axis in m/s^2 (the IMU reports mG, about -1000 z when level)
+        down = (-sin(pitch) * msg.xacc
+                + sin(roll) * cos(pitch) * msg.yacc
+                + cos(roll) * cos(pitch) * msg.zacc) * g / 1000
+        with self.__lock:
+            self.__predict(monotonic())
+            self.__accel = -(down + g)
+            self.lastImu = self.__time
+
+    def handlePressure(self, msg) -> None:
+        '''Corrects the state with the depth measured by the pressure sensor'''
+        surfacePressure = self._mli.config.get('geodata', 'surfacePressure')
+        fluidDensity = self._mli.config.get('geodata', 'fluidDensity')
+        depth = -(100 * msg.press_abs - surfacePressure) / (fluidDensity * g)
+
+        with self.__lock:
+            if not self.ready.is_set():
+                # Start from the first reading, unsure of the climb rate and bias
+                self.__x = [depth, 0.0, 0.0]
+                self.__P = [[self.pressureSigma ** 2, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+                self.__time = monotonic()
+                self.ready.set()
+                return
+
+            self.__predict(monotonic())
+            x, P = self.__x, self.__P
+
+            # Only depth is measured, so the gain is the first column of P over the innovation variance
+            innovationVariance = P[0][0] + self.pressureSigma ** 2
+            gain = [P[i][0] / innovationVariance for i in range(3)]
+            innovation = depth - x[0]
+            self.__x = [x[i] + gain[i] * innovation for i in range(3)]
+            self.__P = [[P[i][j] - gain[i] * P[0][j] for j in range(3)] for i in range(3)]
+
+    def __predict(self, now: float) -> None:
+        '''Moves the state forward to now, assuming the held acceleration. Call with the lock held'''
+        if self.__time is None:
+            return
+        dt = now - self.__time
+        self.__time = now
+        if dt <= 0:
+            return
+
+        x, P = self.__x, self.__P
+        accel = self.__accel - x[2]
+        self.__x = [x[0] + x[1] * dt + accel * dt * dt / 2, x[1] + accel * dt, x[2]]
+
+        # P = F P F' + Q, where F = [[1, dt, -dt^2/2], [0, 1, -dt], [0, 0, 1]]
+        F = [[1, dt, -dt * dt / 2], [0, 1, -dt], [0, 0, 1]]
+        FP = [[sum(F[i][k] * P[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+        P = [[sum(FP[i][k] * F[j][k] for k in range(3)) for j in range(3)] for i in range(3)]
+
+        # Acceleration noise enters depth and climb rate together, bias noise as a random walk
+        q = self.accelSigma ** 2
+        P[0][0] += q * dt ** 4 / 4
+        P[0][1] += q * dt ** 3 / 2
+        P[1][0] += q * dt ** 3 / 2
+        P[1][1] += q * dt ** 2
+        P[2][2] += self.biasSigma ** 2 * dt
+        self.__P = P
@@ -0,0 +1,90 @@
+from queue import Queue, Empty          # For handing leaks to the response thread
+from threading import Event, Thread     # For the response thread
+from time import monotonic              # For de-duplicating messages and timing the hand-off
+
+from mavlinkinterface.logger import getLogger
+
+MAV_SYS_STATUS_SENSOR_LEAK = 2  # Bit of the extended SYS_STATUS sensor fields (MAV_SYS_STATUS_SENSOR_EXTENDED)
+
+
+class leakDetector(object):
+    '''
+    Detects leaks as STATUSTEXT and SYS_STATUS messages arrive, and hands each new leak to a response thread,
+    so the response starts as soon as the message is received and the refresh thread is never blocked by it.
+
+    A STATUSTEXT mentioning a leak counts as a leak, as does the leak sensor of SYS_STATUS becoming unhealthy.
+    The same STATUSTEXT (by sender, id and text) repeated within dedupeTime seconds is only counted once,
+    and leaks detected while a response is already running do not start another one.
+
+    handleStatusText and handleSysStatus must be called with every STATUSTEXT and SYS_STATUS message received.
+    '''
+
+    def __init__(self, respond, killEvent: Event, dedupeTime: float = 10):
+        '''
+        :param respond: function to call (on the response thread) when a leak is detected
+        :param killEvent: when set, the response thread stops
+        :param dedupeTime: seconds during which a repeated STATUSTEXT is ignored
+        '''
+        self.log = getLogger('Status', doPrint=True)
+        self.dedupeTime = dedupeTime
+        self.leaking = False    # Whether the SYS_STATUS leak sensor currently reports a leak
+        self.detections = []    # (monotonic time, reason) of each leak detected
+        self.__respond = respond
+        self.__seen = {}        # STATUSTEXT identity -> monotonic time last seen
+        self.__queue = Queue()
+
+        self.__thread = Thread(target=self.__run, args=(killEvent,))
+        self.__thread.daemon = True     # Kill on program end
+        self.__thread.start()
+
+    def handleStatusText(self, msg) -> None:
+        text = msg.text
+        if 'LEAK' not in text.upper():
+            return
+
+        now = monotonic()
+        identity = (msg.get_srcSystem(), msg.get_srcComponent(), getattr(msg, 'id', 0), text)
+        lastSeen = self.__seen.get(identity)
+        self.__seen[identity] = now
+        if lastSeen is not None and now - lastSeen < self.dedupeTime:
+            return  # A repeat of a leak already reported
+
+        self.__detected(now, 'STATUSTEXT: ' + text)
+
+    def handleSysStatus(self, msg) -> None:
+        # The extended fields are only sent over MAVLink 2
+        present = getattr(msg, 'onboard_control_sensors_present_extended', 0)
+        enabled = getattr(msg, 'onboard_control_sensors_enabled_extended', 0)
+        health = getattr(msg, 'onboard_control_sensors_health_extended', 0)
+        leaking = bool(present & enabled & MAV_SYS_STATUS_SENSOR_LEAK) and not health & MAV_SYS_STATUS_SENSOR_LEAK
+
+        # Only the change to unhealthy is a new leak
+        if leaking and not self.leaking:
+            self.__detected(monotonic(), 'SYS_STATUS leak sensor unhealthy')
+        self.leaking = leaking
+
+    def __detected(self, time: float, reason: str) -> None:
+        self.log.error('Leak Detected: ' + reason)     # Write the message to the log
+        self.detections.append((time, reason))
+        self.__queue.put((time, reason))
+
+    def __run(self, killEvent: Event) -> None:
+        '''Runs the response to each leak, skipping leaks detected while the last response was running'''
+        self.log.trace('Leak responder started')
+        while not killEvent.is_set():
+            try:
+                time, reason = self.__queue.get(timeout=1)
+            except Empty:
+                continue    # Check the kill event
+
+            self.log.trace('Leak response started ' + str(round((monotonic() - time) * 1000, 3))
+                           + ' ms after detection')
+            try:
+                self.__respond()
+            except Exception:
+                self.log.exception('Leak response failed')
+
+            # Anything detected while responding was the same leak
+            while not self.__queue.empty():
+                self.__queue.get_nowait()
+        self.log.trace('Leak responder stopping')
@@ -0,0 +1,240 @@
+from collections import namedtuple     # For link status
+from threading import Event, Lock, Thread   # For the monitor thread
+from time import monotonic, monotonic_ns    # For timing heartbeats and round trips
+
+from mavlinkinterface.logger import getLogger
+
+MAV_TYPE_GCS = 6    # Heartbeats from other ground stations are not the drone's
+
+# Link states, in order of health
+CONNECTING = 'connecting'   # No heartbeat from the drone yet
+OK = 'ok'
+DEGRADED = 'degraded'       # Heartbeats late, or many messages lost
+LOST = 'lost'               # No heartbeat for lostTimeout seconds
+
+# Messages received from, and lost by, one system/component
+sourceStats = namedtuple('sourceStats', ['received', 'lost'])
+
+# state: one of the link states above
+# heartbeatAge: seconds since the drone's last heartbeat (None before the first)
+# heartbeatInterval, heartbeatJitter: average seconds between heartbeats and the average deviation from it
+# maxHeartbeatInterval: the longest gap between heartbeats seen
+# received, lost: messages received and lost (by sequence number gaps) from every source
+# lossRate: the fraction of messages lost over the last second
+# dropRateComm, errorsComm: the drone's own count of dropped packets (percent) and communication errors (SYS_STATUS)
+# roundTripTime: seconds for the last TIMESYNC request to be answered (None until one is)
+# sources: sourceStats keyed by (system id, component id)
+linkStatus = namedtuple('linkStatus', ['state', 'heartbeatAge', 'heartbeatInterval', 'heartbeatJitter',
+                                       'maxHeartbeatInterval', 'received', 'lost', 'lossRate',
+                                       'dropRateComm', 'errorsComm', 'roundTripTime', 'sources'])
+
+
+class linkMonitor(object):
+    '''
+    Watches the health of the link to the drone: the timing of its heartbeats, messages lost (from gaps in
+    MAVLink sequence numbers, per system and component), the drone's own SYS_STATUS error counts, and the
+    round trip time of TIMESYNC requests.
+
+    A monitor thread checks the link several times a second. When the state changes, listeners are called with
+    (state, previousState), and when the link is lost, the lossAction is run:
+    "nothing" only logs it, "stop" stops all commands and returns manual control to neutral.
+
+    handleHeartbeat, handleSysStatus and handleTimesync must be called with each message of those types,
+    and messageHook must be in the connection's message_hooks, so it sees every message received.
+    '''
+
+    def __init__(self,
+                 ml,
+                 killEvent: Event,
+                 stop=None,
+                 degradedTimeout: float = 1.5,
+                 lostTimeout: float = 3,
+                 maxLossRate: float = 0.1,
+                 pingInterval: float = 1,
+                 lossAction: str = 'nothing'):
+        '''
+        :param ml: the mavlink connection to send TIMESYNC requests through
+        :param killEvent: when set, the monitor thread stops
+        :param stop: function stopping all commands, run by the "stop" loss action
+        :param degradedTimeout: seconds without a heartbeat before the link is degraded
+        :param lostTimeout: seconds without a heartbeat before the link is lost
+        :param maxLossRate: the fraction of messages lost over a second above which the link is degraded
+        :param pingInterval: seconds between TIMESYNC requests
+        :param lossAction: what to do when the link is lost, "nothing" or "stop"
+        '''
+        self.log = getLogger('Link')
+        self.__ml = ml
+        self.__stop = stop
+        self.degradedTimeout = degradedTimeout
+        self.lostTimeout = lostTimeout
+        self.maxLossRate = maxLossRate
+        self.pingInterval = pingInterval
+        self.lossAction = lossAction
+
+        self.__lock = Lock()
+        self.__listeners = ()   # Replaced rather than mutated, see addListener
+        self.state = CONNECTING
+
+        # Heartbeats
+        self.__lastHeartbeat = None
+        self.__interval = None
+        self.__jitter = 0.0
+        self.__maxInterval = 0.0
+
+        # Sequence numbers, keyed by (system, component)
+        self.__lastSeq = {}
+        self.__received = {}
+        self.__lost = {}
+        self.__window = (0, 0)  # received and lost at the start of the current second
+        self.__lossRate = 0.0
+
+        # SYS_STATUS and TIMESYNC
+        self.__dropRateComm = None
+        self.__errorsComm = None
+        self.__roundTripTime = None
+        self.__pings = {}       # ts1 sent -> monotonic time sent
+
+        self.__thread = Thread(target=self.__run, args=(killEvent,))
+        self.__thread.daemon = True     # Kill on program end
+        self.__thread.start()
+
+    def configure(self, option: str, value) -> None:
+        '''Changes a setting, taking effect from the next check. Takes the same option names as the constructor.'''
+        if not hasattr(self, option):
+            raise AttributeError('linkMonitor has no setting ' + option)
+        setattr(self, option, value)
+
+    def addListener(self, callback) -> None:
+        '''
+        Registers a function to be called (on the monitor thread) whenever the link state changes
+
+        :param callback: function taking the new state and the previous state
+        '''
+        with self.__lock:
+            self.__listeners = self.__listeners + (callback,)
+
+    def removeListener(self, callback) -> None:
+        '''Removes a function previously registered with addListener'''
+        with self.__lock:
+            self.__listeners = tuple(c for c in self.__listeners if c != callback)
+
+    def messageHook(self, mav, msg) -> None:
+        '''Counts messages received and lost from each source. Called by pymavlink with every message'''
+        if msg.get_msgId() < 0:
+            return  # Bad data, it has no valid sequence number
+        source = (msg.get_srcSystem(), msg.get_srcComponent())
+        seq = msg.get_seq()
+        last = self.__lastSeq.get(source)
+        self.__lastSeq[source] = seq
+        self.__received[source] = self.__received.get(source, 0) + 1
+        if last is not None:
+            gap = (seq - last - 1) % 256
+            if gap:
+                self.__lost[source] = self.__lost.get(source, 0) + gap
+
+    def handleHeartbeat(self, msg) -> None:
+        if msg.type == MAV_TYPE_GCS:
+            return  # Another ground station, not the drone
+        now = monotonic()
+        if self.__lastHeartbeat is not None:
+            interval = now - self.__lastHeartbeat
+            if self.__interval is None:
+                self.__interval = interval
+            else:
+                # Smoothed over roughly the last 10 heartbeats
+                self.__jitter += 0.1 * (abs(interval - self.__interval) - self.__jitter)
+                self.__interval += 0.1 * (interval - self.__interval)
+            self.__maxInterval = max(self.__maxInterval, interval)
+        self.__lastHeartbeat = now
+
+    def handleSysStatus(self, msg) -> None:
+        self.__dropRateComm = msg.drop_rate_comm / 100  # c% to %
+        self.__errorsComm = msg.errors_comm
+
+    def handleTimesync(self, msg) -> None:
+        if msg.tc1 == 0:
+            return  # A request from the drone, not a reply
+        sent = self.__pings.pop(msg.ts1, None)
+        if sent is not None:
+            self.__roundTripTime = monotonic() - sent
+
+    def status(self) -> linkStatus:
+        '''Returns the link state and metrics'''
+        now = monotonic()
+        lastHeartbeat = self.__lastHeartbeat
+        sources = {source: sourceStats(received, self.__lost.get(source, 0))
+                   for source, received in tuple(self.__received.items())}
+        return linkStatus(state=self.state,
+                          heartbeatAge=None if lastHeartbeat is None else now - lastHeartbeat,
+                          heartbeatInterval=self.__interval,
+                          heartbeatJitter=self.__jitter,
+                          maxHeartbeatInterval=self.__maxInterval,
+                          received=sum(s.received for s in sources.values()),
+                          lost=sum(s.lost for s in sources.values()),
+                          lossRate=self.__lossRate,
+                          dropRateComm=self.__dropRateComm,
+                          errorsComm=self.__errorsComm,
+                          roundTripTime=self.__roundTripTime,
+                          sources=sources)
+
+    def __ping(self, now: float) -> None:
+        '''Sends a TIMESYNC request, answered by the drone with the same ts1'''
+        ts1 = monotonic_ns()
+        # Forget requests that were never answered
+        self.__pings = {k: v for k, v in self.__pings.items() if now - v < self.lostTimeout}
+        self.__pings[ts1] = now
+        self.__ml.mav.timesync_send(0, ts1)
+
+    def __check(self, now: float) -> str:
+        '''Returns the link state as of now'''
+        if self.__lastHeartbeat is None:
+            return CONNECTING
+        age = now - self.__lastHeartbeat
+        if age > self.lostTimeout:
+            return LOST
+        if age > self.degradedTimeout or self.__lossRate > self.maxLossRate:
+            return DEGRADED
+        return OK
+
+    def __run(self, killEvent: Event) -> None:
+        self.log.trace('Link monitor started')
+        lastPing = lastWindow = monotonic()
+        while not killEvent.wait(timeout=0.25):
+            now = monotonic()
+
+            if now - lastWindow >= 1:
+                received, lost = sum(self.__received.values()), sum(self.__lost.values())
+                newReceived, newLost = received - self.__window[0], lost - self.__window[1]
+                self.__lossRate = newLost / (newReceived + newLost) if newReceived + newLost else 0.0
+                self.__window = (received, lost)
+                lastWindow = now
+
+            if self.__lastHeartbeat is not None and now - lastPing >= self.pingInterval:
+                try:
+                    self.__ping(now)
+                except Exception:
+                    self.log.exception('Failed to send TIMESYNC')
+                lastPing = now
+
+            state = self.__check(now)
+            if state != self.state:
+                self.__changed(state)
+        self.log.trace('Link monitor stopping')
+
+    def __changed(self, state: str) -> None:
+        previous, self.state = self.state, state
+        if state == LOST:
+            self.log.error('Link to the drone lost, no heartbeat for ' + str(self.lostTimeout) + ' seconds')
+            if self.lossAction.lower() == 'stop' and self.__stop is not None:
+                self.log.warn('Link loss action is stop, stopping all commands')
+                self.__stop()
+        elif state == DEGRADED:
+            self.log.warn('Link to the drone degraded, loss rate ' + str(round(self.__lossRate * 100, 1)) + '%')
+        else:
+            self.log.info('Link to the drone is ' + state + ' (was ' + previous + ')')
+
+        for callback in self.__listeners:
+            try:
+                callback(state, previous)
+            except Exception:
+                self.log.exception('Link state listener failed')
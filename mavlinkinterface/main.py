@@ -3,37 +3,57 @@ from pymavlink import mavutil           # For pretty much everything
 from threading import Thread            # For pretty much everything
 from threading import Event             # For killing threads
 from threading import Semaphore         # To prevent multiple movement commands at once
+from threading import Lock              # For registering message listeners
 from queue import Queue, Empty          # For queuing mode
 import json                             # For returning JSON-formatted strings
 from time import sleep                  # For waiting for heartbeat message validation
+from time import perf_counter           # For timing the startup phases
 from datetime import datetime           # For Initial log comment
-from configparser import ConfigParser   # For config file management
 from os.path import abspath             # For config file management
 from os.path import expanduser          # for config file management
-from os.path import exists              # For checking if config file exists
-from pymavlink.mavextra import mag_heading  # Pre-Built function to calculate heading
 import atexit                           # For keeping the queue executing while a script ends
 
 # Local Imports
 from mavlinkinterface.logger import getLogger           # For Logging
+from mavlinkinterface.config import configStore         # For config file management
+from mavlinkinterface.manualControl import manualControlState   # For sharing manual control between threads
+from mavlinkinterface.commandAck import commandAckTracker       # For confirming commands
+from mavlinkinterface.missionTransfer import missionTransfer    # For uploading and downloading missions
+from mavlinkinterface.missionMonitor import missionMonitor      # For starting missions and following them
+from mavlinkinterface.leakDetector import leakDetector          # For responding to leaks as they are reported
+from mavlinkinterface.linkMonitor import linkMonitor, linkStatus  # For watching the health of the link
+from mavlinkinterface.control import depthController            # For closed-loop depth control
+from mavlinkinterface.control import headingController          # For closed-loop heading control
+from mavlinkinterface.depthEstimator import depthEstimator, depthEstimate  # For fused depth and climb rate
+from mavlinkinterface.telemetry import derivedTelemetry        # For computing values once per message
+from mavlinkinterface.sensorData import sensorSnapshot, sensorAges  # For reading all sensors at once
+from mavlinkinterface.sensorData import altitudeData
+from mavlinkinterface.sensorData import batteryFromMessage, imuFromMessage, gpsFromMessage
+from mavlinkinterface.sensorData import pressureFromMessage, temperatureFromMessage, depthFromMessage
+from mavlinkinterface.sensorData import headingFromMessages
 import mavlinkinterface.commands as commands            # For calling commands
-# from mavlinkinterface.rthread import RThread            # For functions that have return values
+from mavlinkinterface.commands.passive.sonar import PING1D_DISTANCE_SIMPLE  # For reading streamed distances
+from mavlinkinterface.rthread import RThread            # For functions that have return values
 
 class mavlinkInterface(object):
     '''
     This is the main interface to Mavlink. All calls will be made through this object.
     '''
 
-    configVersion = '1.1'
-
     # Internal Commands
-    def __init__(self, execMode: str, sitl=False):
+    def __init__(self, execMode: str, sitl=False, waitForHeartbeat: bool = True, returnMode: str = None):
         '''
         Creates a new mavlinkInterface Object
 
         :param execMode: The Execution mode to use when not given as a parameter.
                          See docs/configuration/setDefaultexecMode for details.\n
+        :param waitForHeartbeat: When false, returns without waiting for the drone to be found.
+                                 Use waitForConnection before sending commands.
+        :param returnMode: 'json' or 'native', the format sensor commands return their data in.
+                           Defaults to the returnMode set in the config file.
         '''
+        startTime = perf_counter()
+        self.__startupProfile = {}      # Seconds taken by each startup phase, see getStartupProfile
 
         execMode = execMode.lower()
         if execMode not in ['synchronous', 'queue', 'ignore', 'override']:
@@ -46,37 +66,22 @@ class mavlinkInterface(object):
         self.__log.trace('###################### New Log ' + str(datetime.now()) + ' ######################')
         self.__log.trace('################################################################################')
 
-        # Import config values
-        self.config = ConfigParser()
+        # Import config values, creating the file or adding new options to it if needed
         self.configPath = abspath(expanduser('~/.mavlinkInterface.ini'))
-        if exists(self.configPath):
-            self.__log.trace('importing configuration file from path: ' + self.configPath)
-            self.config.read(self.configPath)
-
-        if (not exists(self.configPath)
-                or 'version' not in self.config
-                or self.config['version']['version'] != self.configVersion):
-
-            # Populate file with Default config options
-            self.config['version'] = {'version': self.configVersion}
-            self.config['mavlink'] = {'connectionString': 'udp:0.0.0.0:14550'}
-            self.config['geodata'] = {'COMMENT_1': 'The pressure in pascals at the surface of the body of water.',
-                                      'COMMENT_1B': 'Sea Level is around 101325. Varies day by day',
-                                      'surfacePressure': '101325',
-                                      'COMMENT_2': 'The density of the diving medium. Pure water is 1000',
-                                      'fluidDensity': '1000'}
-            self.config['messages'] = {'refreshrate': '0.04',
-                                       'controlRate': '.1'}
-            self.config['hardware'] = {'sonarcount': '1',
-                                       'gps': 'True'}
-            # Save file
-            self.config.write((open(self.configPath, 'w')))
+        self.config = configStore(self.configPath)
+        atexit.register(self.config.flush)  # Write any changes that are still waiting
+
+        phaseStart = self.__profilePhase('config', startTime)
+
+        self.setReturnMode(returnMode if returnMode is not None else self.config.get('messages', 'returnMode'))
 
         # Set class variables
         self.__log.trace('Setting class variables')
         self.execMode = execMode
         self.externalPressureMessage = 'SCALED_PRESSURE2'
 
+        self.manualControlKeepalive = 1     # Max seconds between manual_control messages when nothing changes
+
         self.leakResponseAction = 'surface'
         # Leak response action valid options:
         # "nothing": warns the user and takes note in the log, but takes no other action
@@ -93,27 +98,36 @@ class mavlinkInterface(object):
 
         # Create variables to contain mavlink message data
         self.messages = {}
+        self.__messagesLock = Lock()    # Held while updating messages, so several can be read consistently
+        self.__messageVersions = {}     # Incremented each time a message type arrives
+        self.__telemetry = derivedTelemetry(self.messages, getLogger('Telemetry'))
+
+        # Functions to call when a message arrives, keyed by message type
+        self.__messageListeners = {}
+        self.__listenerLock = Lock()
 
-        self.gpsEnabled = bool(self.config['hardware']['gps'])
+        self.gpsEnabled = self.config.get('hardware', 'gps')
+        self.__registerTelemetry()
 
         # Create Semaphore and Queue
         self.sem = Semaphore(1)
         self.q = Queue()
 
+        # Lights and sonars are set up on first use, see the lights and sonars properties
+        self.__lights = None
+        self.__sonar = None
+        self.__deviceLock = Lock()
+
         # Set up Mavlink
         self.__log.trace('Initializing MavLink Connection')
-        self.mavlinkConnection = mavutil.mavlink_connection(self.config['mavlink']['connectionString'])
-        self.mavlinkConnection.wait_heartbeat()                 # Start Heartbeat
-        self.mavlinkConnection.mav.request_data_stream_send(    # Request start of message stream
-            self.mavlinkConnection.target_system,
-            self.mavlinkConnection.target_component,
-            mavutil.mavlink.MAV_DATA_STREAM_ALL,
-            0x5,
-            1)
+        self.mavlinkConnection = mavutil.mavlink_connection(self.config.get('mavlink', 'connectionString'))
+        phaseStart = self.__profilePhase('connect', phaseStart)
+        self.__connectTime = phaseStart
 
         # Building Kill Events
         self.killEvent = Event()    # When set, will signal all attached tasks to stop
         self.currentTaskKillEvent = Event()     # When set, will kill the current task
+        self.connected = Event()    # Set when the first heartbeat from the drone arrives
 
         # Set messages to be read
         self.readMessages = ['SYS_STATUS',
@@ -122,7 +136,8 @@ class mavlinkInterface(object):
                              'SCALED_PRESSURE2',
                              'HEARTBEAT',
                              'ATTITUDE',
-                             'STATUSTEXT']
+                             'STATUSTEXT',
+                             'COMMAND_ACK']
         if self.gpsEnabled:
             self.readMessages.append('GPS_RAW_INT')              # Basic GPS
             self.readMessages.append('GLOBAL_POSITION_INT')      # Advanced GPS
@@ -133,6 +148,27 @@ class mavlinkInterface(object):
             self.readMessages.append('MISSION_CURRENT')          # For missions
             self.readMessages.append('EKF_STATUS_REPORT')        # For GPS and missions
 
+        # The refresher spots the drone's first heartbeat and requests the message stream,
+        # so the rest of the setup below runs while waiting for the drone
+        self.addMessageListener('HEARTBEAT', self.__firstHeartbeat)
+
+        # Track acknowledgements of sent commands
+        self.commandAcks = commandAckTracker(self.mavlinkConnection)
+        self.addMessageListener('COMMAND_ACK', self.commandAcks.handleMessage)
+        self.addMessageListener('HEARTBEAT', self.commandAcks.handleMessage)
+
+        # Answer the drone's mission requests, and request the next item of a download, as they arrive
+        self.missionTransfer = missionTransfer(self.mavlinkConnection)
+        for messageType in ('MISSION_REQUEST', 'MISSION_REQUEST_INT', 'MISSION_ACK',
+                            'MISSION_COUNT', 'MISSION_ITEM', 'MISSION_ITEM_INT'):
+            self.addMessageListener(messageType, self.missionTransfer.handleMessage)
+
+        # Follow the EKF and the running mission
+        self.missionMonitor = missionMonitor()
+        self.addMessageListener('EKF_STATUS_REPORT', self.missionMonitor.handleEkfStatus)
+        self.addMessageListener('MISSION_CURRENT', self.missionMonitor.handleMissionCurrent)
+        self.addMessageListener('MISSION_ITEM_REACHED', self.missionMonitor.handleItemReached)
+
         # start dataRefreshers
         self.recordedMessages = {
             'GPS_RAW_INT': 0,
@@ -148,21 +184,29 @@ class mavlinkInterface(object):
         self.heartbeatThread.start()
 
         # start Manual control process
-        self.manualControlParams = {
-            'x': 0,     # X-Axis thrust [Range: -1000-1000; Back=-1000, Forward=1000, 0 = No 'forward' thrust]
-            'y': 0,     # Y-Axis thrust [Range: -1000-1000; Left=-1000, Right=1000, 0 = No 'sideways' thrust]
-            'z': 500,   # Z-Axis thrust [Range: -1000-1000; Left=-1000, Up=1000, 500 = No vertical thrust]
-            'r': 0,     # Rotation [Range: -1000-1000; Left=-1000, Right=1000, 0 = No rotational thrust]
-            'b': 0      # A bitfield representing controller buttons pressed,(use 1 << btn# to activate button)
-        }
+        # x: X-Axis thrust [Range: -1000-1000; Back=-1000, Forward=1000, 0 = No 'forward' thrust]
+        # y: Y-Axis thrust [Range: -1000-1000; Left=-1000, Right=1000, 0 = No 'sideways' thrust]
+        # z: Z-Axis thrust [Range: -1000-1000; Left=-1000, Up=1000, 500 = No vertical thrust]
+        # r: Rotation [Range: -1000-1000; Left=-1000, Right=1000, 0 = No rotational thrust]
+        # b: A bitfield representing controller buttons pressed,(use 1 << btn# to activate button)
+        self.manualControlParams = manualControlState()
         self.manualControlThread = Thread(target=self.__manualControlMaintain, args=(self.killEvent,))
         self.manualControlThread.daemon = True  # Kill on program end
         self.manualControlThread.start()
 
-        # start leak detection
-        self.leakDetectorThread = Thread(target=self.__leakDetector, args=(self.killEvent,))
-        self.leakDetectorThread.daemon = True   # Kill on program end
-        self.leakDetectorThread.start()
+        # start link monitoring, fed by every message received
+        self.linkMonitor = linkMonitor(self.mavlinkConnection, self.killEvent, stop=self.__stopOnLinkLoss,
+                                       **self.config.section('link'))
+        self.mavlinkConnection.message_hooks.append(self.linkMonitor.messageHook)
+        self.addMessageListener('HEARTBEAT', self.linkMonitor.handleHeartbeat)
+        self.addMessageListener('SYS_STATUS', self.linkMonitor.handleSysStatus)
+        self.addMessageListener('TIMESYNC', self.linkMonitor.handleTimesync)
+        self.config.addListener('link', self.linkMonitor.configure)
+
+        # start leak detection, checked as each STATUSTEXT and SYS_STATUS message arrives
+        self.leakDetector = leakDetector(self.leakResponse, self.killEvent)
+        self.addMessageListener('STATUSTEXT', self.leakDetector.handleStatusText)
+        self.addMessageListener('SYS_STATUS', self.leakDetector.handleSysStatus)
 
         # Start Queue maintenance process
         self.queueThread = Thread(target=self.__queueManager, args=(self.killEvent,))
@@ -173,22 +217,32 @@ class mavlinkInterface(object):
         self.dataRecorderThread = Thread(target=self.__dataRecorder, args=(self.killEvent,))
         self.dataRecorderThread.daemon = True   # Kill on program end
         self.dataRecorderThread.start()
-
-        # Initiate light class
-        self.lights = commands.active.lights(self)
-
-        # Initiate sonar class
-        if int(self.config['hardware']['sonarcount']) > 0:
-            self.sonar = commands.passive.sonar()
+        phaseStart = self.__profilePhase('threads', phaseStart)
 
         if self.gpsEnabled:
             self.gps = commands.passive.gps(self)
 
+        # Fuse pressure and acceleration into depth and climb rate, updated as messages arrive
+        self.depthEstimator = depthEstimator(self, **self.config.section('depthEstimator'))
+        self.depthEstimator.start()
+        self.config.addListener('depthEstimator', self.depthEstimator.configure)
+
+        # Initiate depth and heading controllers
+        self.depthController = depthController(self, **self.config.section('depthControl'))
+        self.headingController = headingController(self, **self.config.section('headingControl'))
+
+        # Apply changes to the controller settings straight away
+        self.config.addListener('depthControl', self.depthController.configure)
+        self.config.addListener('headingControl', self.headingController.configure)
+        phaseStart = self.__profilePhase('controllers', phaseStart)
+
         # Validating heartbeat
-        self.__log.info('Waiting for heartbeat')
-        while 'HEARTBEAT' not in self.messages:
-            sleep(.1)
-        self.__log.info('Successfully connected to target.')
+        if waitForHeartbeat:
+            self.__log.info('Waiting for heartbeat')
+            self.connected.wait()
+            self.__log.info('Successfully connected to target.')
+            self.__profilePhase('waitForHeartbeat', phaseStart)
+        self.__profilePhase('total', startTime)
         self.__log.trace('__init__ end')
 
         atexit.register(self.waitQueue)
@@ -208,6 +262,43 @@ class mavlinkInterface(object):
         except (NameError, AttributeError):
             pass    # Initializer not finished, so no need to clean up after it
 
+    # Devices set up on first use
+    @property
+    def lights(self):
+        '''The lights controller, created (and the lights turned off) the first time it is used'''
+        with self.__deviceLock:
+            if self.__lights is None:
+                self.__lights = commands.active.lights(self)
+            return self.__lights
+
+    @property
+    def sonars(self):
+        '''
+        The sonar sensors listed in the config (up to sonarcount of them), as a sonarArray.
+        Created (and streaming started, if enabled) the first time they are used.
+        '''
+        with self.__deviceLock:
+            if self.__sonar is None:
+                addresses = []
+                for entry in self.config.get('sonar', 'address').split(','):
+                    host, sep, port = entry.strip().partition(':')
+                    addresses.append((host, int(port) if sep else self.config.get('sonar', 'port')))
+                count = self.config.get('hardware', 'sonarcount')
+                if count > len(addresses):
+                    self.__log.error('sonarcount is ' + str(count) + ' but only ' + str(len(addresses))
+                                     + ' sonar address(es) are configured')
+
+                self.__sonar = commands.passive.sonarArray(addresses[:count],
+                                                           historyLength=self.config.get('sonar', 'historyLength'))
+                if self.config.get('sonar', 'streaming'):
+                    self.__sonar.startStreaming()
+            return self.__sonar
+
+    @property
+    def sonar(self):
+        '''The first sonar sensor'''
+        return self.sonars[0]
+
     # Private functions
     def __getSemaphore(self, mode: str, target: Thread) -> bool:
         '''
@@ -230,14 +321,17 @@ class mavlinkInterface(object):
                     self.__log.error('Keyboard interrupt received, aborting command')
                     return False
 
+                self.currentTaskKillEvent.clear()
                 return True
 
             if mode == 'override':
                 self.__log.info('Override active, Killing existing task(s)')
                 self.stopAllTasks()
-                if not self.sem.acquire(blocking=False):    # If the current task did not properly release the semaphore
+                # Give the current task a moment to see the kill event and release the semaphore
+                if not self.sem.acquire(blocking=True, timeout=1):  # If the current task did not release it
                     self.sem.release()                      # Release it
                     self.sem.acquire()                      # Then re-take it
+                self.currentTaskKillEvent.clear()
                 return True     # Now that previous action has been killed, execute current action
             elif self.execMode == 'ignore':
                 self.__log.info('Using Ignore mode, command ignored')
@@ -247,8 +341,33 @@ class mavlinkInterface(object):
                 self.__log.info('Using queue Mode, Adding item to queue')
                 self.q.put(target)
                 return False    # The command will be executed by the QueueManager process
+
+        # No task is running now, so a stop meant for an earlier task (e.g. on link loss) must not end this one
+        self.currentTaskKillEvent.clear()
         return True     # If the semaphore was obtained on the first try
 
+    def __profilePhase(self, phase: str, start: float) -> float:
+        '''Records the seconds since start as the duration of a startup phase, and returns the current time'''
+        now = perf_counter()
+        self.__startupProfile[phase] = now - start
+        self.__log.trace('Startup phase ' + phase + ' took ' + str(round(now - start, 4)) + ' seconds')
+        return now
+
+    def __firstHeartbeat(self, msg) -> None:
+        '''Requests the message stream once the drone has been found, then stops listening'''
+        if msg.type == mavutil.mavlink.MAV_TYPE_GCS or self.connected.is_set():
+            return  # Another ground station, not the drone
+
+        self.mavlinkConnection.mav.request_data_stream_send(    # Request start of message stream
+            self.mavlinkConnection.target_system,
+            self.mavlinkConnection.target_component,
+            mavutil.mavlink.MAV_DATA_STREAM_ALL,
+            0x5,
+            1)
+        self.__profilePhase('heartbeat', self.__connectTime)
+        self.connected.set()
+        self.removeMessageListener('HEARTBEAT', self.__firstHeartbeat)
+
     def __updateMessage(self, killEvent: Event) -> None:
         '''
         This function automatically updates a variable to contain the contents of a mavlink message
@@ -271,25 +390,25 @@ class mavlinkInterface(object):
 
             # Timeout used so it has the chance to notice the stop flag when no data is present
             if msg:
-                self.messages[str(msg.get_type())] = {'message': msg, 'time': datetime.now()}
+                with self.__messagesLock:
+                    version = self.__messageVersions.get(msg.get_type(), 0) + 1
+                    self.__messageVersions[msg.get_type()] = version
+                    self.messages[str(msg.get_type())] = {'message': msg, 'time': datetime.now(), 'version': version}
+                    self.__telemetry.update(msg.get_type())
                 if msg.get_type() in self.recordedMessages and self.recordedMessages[msg.get_type()] == 0:
                     files[msg.get_type()].write(str(datetime.now()) + ', ' + str(msg.to_dict()) + '\n')
 
+                # Notify listeners
+                for callback in self.__messageListeners.get(msg.get_type(), ()):
+                    try:
+                        callback(msg)
+                    except Exception:
+                        log.exception('Listener for ' + msg.get_type() + ' failed')
+
         # when done, ensure that the buffer is written to the files
-        for file in files:
+        for file in files.values():
             file.flush()
 
-    def __leakDetector(self, killEvent: Event) -> None:
-        '''This function continuously checks for leaks, and upon detecting a leak, runs the desired action'''
-        log = getLogger('Status', doPrint=True)
-        log.trace('Leak Detector started')
-        while not killEvent.wait(timeout=1):
-            if 'STATUSTEXT' in self.messages and 'LEAK' in str(self.messages['STATUSTEXT']['message']).upper():
-                log.error('Leak Detected: ' + self.messages['STATUSTEXT']['message'])    # Write the message to the log
-                self.leakResponse()
-
-        log.trace('StatusMonitor Stopping')
-
     def __heartbeatSend(self,
                         type: int = 6,
                         autopilot: int = 8,
@@ -324,9 +443,9 @@ class mavlinkInterface(object):
             system_status,      # system_status
             mavlink_version)    # mavlink_version
 
-    def __manualControlSend(self) -> None:
+    def __manualControlSend(self, frame=None) -> None:
         '''
-        Sends a manual control message based on the dict self.manualControlParams
+        Sends a manual control message based on a snapshot of self.manualControlParams
 
         Detailed description of MANUAL_CONTROL Message
         Name: MANUAL_CONTROL ( #69 )
@@ -340,14 +459,19 @@ class mavlinkInterface(object):
         z	        int16_t	    Z-Axis thrust/Lift [Range: -1000-1000; Left=-1000, Up=1000, 500 = No thrust]
         r	        int16_t	    R-axis Thrust/Rotation [Range: -1000-1000; Left=-1000, Right=1000, 0 = No thrust]
         buttons	    uint16_t	A bitfield representing controller buttons pressed,(use 1 << btn# to activate button)
+
+        :param frame: the manualControlFrame to send, defaults to the current snapshot
         '''
+        if frame is None:
+            frame = self.manualControlParams.snapshot()
+
         self.mavlinkConnection.mav.manual_control_send(
             self.mavlinkConnection.target_system,
-            self.manualControlParams['x'],  # X-Axis thrust
-            self.manualControlParams['y'],  # Y-Axis thrust
-            self.manualControlParams['z'],  # Z-Axis thrust
-            self.manualControlParams['r'],  # R-Axis thrust
-            self.manualControlParams['b']   # Button bitmap
+            frame.x,    # X-Axis thrust
+            frame.y,    # Y-Axis thrust
+            frame.z,    # Z-Axis thrust
+            frame.r,    # R-Axis thrust
+            frame.b     # Button bitmap
         )
 
     def __heartbeatMaintain(self, killEvent: Event) -> None:
@@ -358,10 +482,19 @@ class mavlinkInterface(object):
         self.__log.trace('Heartbeat broadcast stopped')
 
     def __manualControlMaintain(self, killEvent: Event) -> None:
-        '''This function continuously sends the manual_control message'''
+        '''
+        This function continuously sends the manual_control message.
+        A frame is sent as soon as the control state changes (at most once per controlRate),
+        and unchanged frames are only repeated every manualControlKeepalive seconds.
+        '''
         self.__log.trace('Manual Control broadcast started')
-        while not killEvent.wait(timeout=(float(self.config['messages']['controlRate']))):
-            self.__manualControlSend()
+        version = None
+        while not killEvent.is_set():
+            frame = self.manualControlParams.waitForChange(version, timeout=self.manualControlKeepalive)
+            self.__manualControlSend(frame)
+            version = frame.version
+            if killEvent.wait(timeout=self.config.get('messages', 'controlRate')):
+                break
         self.__log.trace('Manual Control broadcast stopped')
 
     def __dataRecorder(self, killEvent: Event) -> None:
@@ -395,6 +528,7 @@ class mavlinkInterface(object):
                 if self.sem.acquire(blocking=True, timeout=1):
                     try:
                         t = self.q.get(block=False)
+                        self.currentTaskKillEvent.clear()
                         t.start()
                         t.join()
                     except Empty:
@@ -411,10 +545,101 @@ class mavlinkInterface(object):
         # Kills the currently running task and stops the drone
         self.currentTaskKillEvent.set()
 
+    def __stopOnLinkLoss(self) -> None:
+        '''
+        Stops all commands and returns manual control to neutral, so nothing resumes when the link returns.
+        Commands given after this run normally, as the kill event is cleared when the next command takes the semaphore
+        '''
+        self.stopAllTasks()
+        self.manualControlParams.reset()
+
+    def getLinkStatus(self) -> linkStatus:
+        '''
+        Returns the state of the link to the drone (connecting, ok, degraded or lost) with heartbeat timing,
+        message loss, the drone's communication error counts and round trip time,
+        as a JSON-formatted string or a linkStatus named tuple depending on the return mode
+        '''
+        status = self.linkMonitor.status()
+        if self.returnMode == 'native':
+            return status
+
+        returnData = status._asdict()
+        returnData['sources'] = {str(system) + ':' + str(component): stats._asdict()
+                                 for (system, component), stats in status.sources.items()}
+        return json.dumps(returnData)
+
     def log(self, message: str) -> None:
         '''This function writes a message to the program log'''
         self.__log.trace(message)
 
+    def __registerTelemetry(self) -> None:
+        '''Registers the values the sensor getters return, so they are computed as their messages arrive'''
+        external = (self.externalPressureMessage,)
+
+        def batteryJson(msg):
+            data = {}
+            data['voltage'] = msg.voltage_battery / 1000        # convert to volts
+            data['current'] = msg.current_battery
+            data['percent_remaining'] = msg.battery_remaining
+            return json.dumps(data)
+
+        def geodata():
+            return (self.config.get('geodata', 'surfacePressure'), self.config.get('geodata', 'fluidDensity'))
+
+        self.__telemetry.register('battery', ('SYS_STATUS',), batteryFromMessage)
+        self.__telemetry.register('batteryJson', ('SYS_STATUS',), batteryJson)
+        self.__telemetry.register('imu', ('RAW_IMU',), imuFromMessage)
+        self.__telemetry.register('pressureExternal', external, pressureFromMessage)
+        self.__telemetry.register('pressureInternal', ('SCALED_PRESSURE',), pressureFromMessage)
+        self.__telemetry.register('depth', external, depthFromMessage, geodata)
+        self.__telemetry.register('temperature', external, temperatureFromMessage)
+        self.__telemetry.register('heading', ('RAW_IMU', 'ATTITUDE'), headingFromMessages)
+        if self.gpsEnabled:
+            self.__telemetry.register('gps', ('GPS_RAW_INT',), gpsFromMessage)
+
+        # Depth depends on the geodata config, so recompute it when that changes
+        def geodataChanged(option, value):
+            with self.__messagesLock:
+                self.__telemetry.refresh('depth')
+        self.config.addListener('geodata', geodataChanged)
+
+    def __reading(self, name: str):
+        '''Returns the latest value of a derived reading, waiting up to a second for the first one'''
+        return self.__telemetry.wait(name, timeout=1).value
+
+    def addMessageListener(self, messageType: str, callback) -> None:
+        '''
+        Registers a function to be called with each message of the given type as it arrives.
+        Listeners are called on the message refresh thread, so they must return quickly.
+
+        :param messageType: the mavlink message name, e.g. 'ATTITUDE'. It is added to the read messages if needed.
+        :param callback: function taking the received message
+        '''
+        with self.__listenerLock:
+            # Replace rather than mutate, so the refresh thread can iterate without locking
+            self.__messageListeners[messageType] = self.__messageListeners.get(messageType, ()) + (callback,)
+            if messageType not in self.readMessages:
+                self.readMessages.append(messageType)
+
+    def removeMessageListener(self, messageType: str, callback) -> None:
+        '''Removes a function previously registered with addMessageListener'''
+        with self.__listenerLock:
+            listeners = self.__messageListeners.get(messageType, ())
+            self.__messageListeners[messageType] = tuple(c for c in listeners if c != callback)
+
+    def waitForConnection(self, timeout: float = None) -> bool:
+        '''
+        Blocks until the first heartbeat from the drone has arrived.
+        Returns true if the drone is connected, false if the timeout expired first.
+
+        :param timeout: <optional> the maximum number of seconds to wait
+        '''
+        return self.connected.wait(timeout=timeout)
+
+    def getStartupProfile(self) -> dict:
+        '''Returns the number of seconds taken by each phase of startup, keyed by phase name'''
+        return dict(self.__startupProfile)
+
     def waitQueue(self) -> None:
         '''
         This blocks until the current queue has finished executing.
@@ -436,7 +661,7 @@ class mavlinkInterface(object):
 
     def leakResponse(self) -> None:
         '''
-        This function is called upon encountering a leak.
+        This function is called upon encountering a leak, on the leak detector's response thread.
         '''
         self.__log.warn('Leak response triggered')
         print('Leak detected, performing appropriate action')
@@ -479,50 +704,56 @@ class mavlinkInterface(object):
                 else:
                     self.readMessages.remove('GLOBAL_POSITION_INT')
         elif sensor == 'sonar':
-            if int(self.config['hardware']['sonarcount']) > 0:
-                if enable:
-                    self.sonar.disabled = False
-                else:
-                    self.sonar.disabled = True
+            if self.config.get('hardware', 'sonarcount') > 0:
+                for sonar in self.sonars:
+                    sonar.disabled = not enable
 
     # Active commands
-    def arm(self, execMode: str = None) -> None:
-        '''Enables the thrusters'''
+    def arm(self, execMode: str = None) -> int:
+        '''
+        Enables the thrusters
+        In synchronous mode, returns the MAV_RESULT once the vehicle acknowledges (None if it never does)
+        '''
 
         # Create thread object
-        t = Thread(target=commands.active.arm, args=(self.mavlinkConnection, self.sem))
+        t = RThread(target=commands.active.arm, args=(self.mavlinkConnection, self.sem, self.commandAcks))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):    # If sem was able to be acquired
             t.start()                     # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
-    def disarm(self, execMode: str = None) -> None:
-        '''Disables the thrusters'''
+    def disarm(self, execMode: str = None) -> int:
+        '''
+        Disables the thrusters
+        In synchronous mode, returns the MAV_RESULT once the vehicle acknowledges (None if it never does)
+        '''
 
-        t = Thread(target=commands.active.disarm, args=(self.mavlinkConnection, self.sem,))
+        t = RThread(target=commands.active.disarm, args=(self.mavlinkConnection, self.sem, self.commandAcks,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):    # If sem was able to be acquired
             t.start()                     # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
-    def setFlightMode(self, flightMode: str, execMode: str = None) -> None:
+    def setFlightMode(self, flightMode: str, execMode: str = None) -> int:
         '''
         Sets the flight mode of the drone.
         Valid modes are listed in docs/active/setFlightMode.md
+        In synchronous mode, returns the MAV_RESULT once the vehicle reports the new mode (None if it never does)
 
         Parameter Mode: The mode to use
         '''
-        t = Thread(target=commands.active.setFlightMode, args=(self.mavlinkConnection, self.sem, flightMode,))
+        t = RThread(target=commands.active.setFlightMode,
+                    args=(self.mavlinkConnection, self.sem, flightMode, self.commandAcks,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
             t.start()                 # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
     def move(self,
              direction: float,
@@ -566,15 +797,32 @@ class mavlinkInterface(object):
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
                 t.join()   # Wait when using synchronous mode
 
-    def dive(self, depth: float, throttle: int = 50, absolute: bool = False, execMode: str = None) -> None:
+    def dive(self, depth: float, throttle: int = 50, absolute: bool = False, execMode: str = None) -> bool:
         '''
-        Move vertically by a certain distance, or to a specific altitude
+        Move vertically by a certain distance, or to a specific altitude, using closed-loop depth control
+        In synchronous mode, returns true if the drone settled at the target depth
+
+        :param depth: Distance to dive or rise. Deeper is negative
+        :param throttle: Maximum percent throttle to use
+        :param absolute <optional>: When True, dives to the depth given relative to sea level
+        '''
+        t = RThread(target=commands.active.dive, args=(self, self.currentTaskKillEvent, depth, throttle, absolute,))
+
+        # Calculate action based on mode
+        if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
+            t.start()                 # Start the thread
+            if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
+                return t.join()   # Wait when using synchronous mode
+
+    def diveBasic(self, depth: float, throttle: int = 50, absolute: bool = False, execMode: str = None) -> None:
+        '''
+        Move vertically by a certain distance, or to a specific altitude, using a fixed throttle
 
         :param depth: Distance to dive or rise. Deeper is negative
         :param throttle: Percent throttle to use
         :param absolute <optional>: When True, dives to the depth given relative to sea level
         '''
-        t = Thread(target=commands.active.dive, args=(self, self.currentTaskKillEvent, depth, throttle, absolute,))
+        t = Thread(target=commands.active.diveBasic, args=(self, self.currentTaskKillEvent, depth, throttle, absolute,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
@@ -598,31 +846,33 @@ class mavlinkInterface(object):
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
                 t.join()   # Wait when using synchronous mode
 
-    def surface(self, execMode: str = None) -> None:
+    def surface(self, execMode: str = None) -> bool:
         '''
         Thrust upward at full power until reaching the surface
+        In synchronous mode, returns true if the surface was reached
         '''
-        t = Thread(target=commands.active.surface, args=(self, self.currentTaskKillEvent,))
+        t = RThread(target=commands.active.surface, args=(self, self.currentTaskKillEvent,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
             t.start()                 # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
-    def yaw(self, angle: float, absolute=False, execMode: str = None) -> None:
-        '''Rotates the drone around the Z-Axis
+    def yaw(self, angle: float, absolute=False, execMode: str = None) -> bool:
+        '''Rotates the drone around the Z-Axis using closed-loop heading control
+        In synchronous mode, returns true if the drone settled at the target heading
 
         angle: distance to rotate in degrees
         '''
-        t = Thread(target=commands.active.yaw,
-                   args=(self, self.currentTaskKillEvent, angle, absolute,))
+        t = RThread(target=commands.active.yaw,
+                    args=(self, self.currentTaskKillEvent, angle, absolute,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
             t.start()                 # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
     def yawBasic(self, angle: float, absolute=False, execMode: str = None) -> None:
         '''Rotates the drone around the Z-Axis
@@ -668,7 +918,8 @@ class mavlinkInterface(object):
 
         param brightness: the percentage of full brightness (rounded to the nearest step) to set the lights to
         '''
-        t = Thread(target=self.lights.set, args=(self, self.sem, brightness,))
+        # The lights are set up on first use, so look them up on the command thread rather than here
+        t = Thread(target=lambda: self.lights.set(self, self.sem, brightness))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
@@ -692,166 +943,213 @@ class mavlinkInterface(object):
                 t.join()   # Wait when using synchronous mode
 
     # Sensor reading commands
-    def getBatteryData(self) -> str:
-        '''Returns a JSON-formatted string containing battery data'''
-        self.__log.trace('Fetching battery data')
-
-        # Check message availability
-        if 'SYS_STATUS' not in self.messages:
-            self.__log.warn('SYS_STATUS message not available, waiting 1 sec')
-            sleep(1)
-
-        data = {}
-        data['voltage'] = self.messages['SYS_STATUS']['message'].voltage_battery / 1000        # convert to volts
-        data['current'] = self.messages['SYS_STATUS']['message'].current_battery
-        data['percent_remaining'] = self.messages['SYS_STATUS']['message'].battery_remaining
-        return json.dumps(data)
-
-    def getAccelerometerData(self) -> str:
-        '''Returns a Json-formatted string containing Accelerometer Data'''
-        self.__log.trace('Fetching Accelerometer Data')
-
-        # Checking message availability
-        if 'RAW_IMU' not in self.messages:
-            self.__log.warn('RAW_IMU message not available, waiting 1 sec')
-            sleep(1)
-
-        data = {}
-        data['X'] = self.messages['RAW_IMU']['message'].xacc
-        data['Y'] = self.messages['RAW_IMU']['message'].yacc
-        data['Z'] = self.messages['RAW_IMU']['message'].zacc
-        return json.dumps(data)
+    # Readings are computed as their messages arrive (see __registerTelemetry), so these are lookups
+    def getBatteryData(self):
+        '''
+        Returns the battery data, as a JSON-formatted string or a batteryData named tuple depending on the return mode
+        '''
+        if self.returnMode == 'native':
+            return self.__reading('battery')
+        return self.__reading('batteryJson')
 
-    def getGyroscopeData(self) -> str:
-        '''Returns a Json-formatted string containing Gyroscope Data'''
-        self.__log.trace('Fetching Gyro Data')
+    def getAccelerometerData(self):
+        '''
+        Returns the accelerometer data, as a JSON-formatted string or a vector3 named tuple depending on the return mode
+        '''
+        return self.__imuVector('accelerometer')
 
-        # Checking message availability
-        if not self.messages.__contains__('RAW_IMU'):
-            self.__log.warn('RAW_IMU message not available, waiting 1 sec')
-            sleep(1)
+    def getGyroscopeData(self):
+        '''
+        Returns the gyroscope data, as a JSON-formatted string or a vector3 named tuple depending on the return mode
+        '''
+        return self.__imuVector('gyroscope')
 
-        data = {}
-        data['X'] = self.messages['RAW_IMU']['message'].xgyro
-        data['Y'] = self.messages['RAW_IMU']['message'].ygyro
-        data['Z'] = self.messages['RAW_IMU']['message'].zgyro
-        return json.dumps(data)
+    def getMagnetometerData(self):
+        '''
+        Returns the magnetometer data, as a JSON-formatted string or a vector3 named tuple depending on the return mode
+        '''
+        return self.__imuVector('magnetometer')
 
-    def getMagnetometerData(self) -> str:
-        '''Returns a Json-formatted string containing Magnetometer Data'''
-        self.__log.trace('Fetching magnetometer Data')
-        if not self.messages.__contains__('RAW_IMU'):
-            self.__log.warn('RAW_IMU message not available, waiting 1 sec')
-            sleep(1)
+    def getIMUData(self):
+        '''
+        Returns the accelerometer, gyroscope and magnetometer data from the same RAW_IMU sample,
+        as a JSON-formatted string or an imuData named tuple depending on the return mode
+        '''
+        imu = self.__reading('imu')
+        if self.returnMode == 'native':
+            return imu
 
         data = {}
-        data['X'] = self.messages['RAW_IMU']['message'].xmag
-        data['Y'] = self.messages['RAW_IMU']['message'].ymag
-        data['Z'] = self.messages['RAW_IMU']['message'].zmag
+        data['Magnetometer'] = dict(zip(('X', 'Y', 'Z'), imu.magnetometer))
+        data['Accelerometer'] = dict(zip(('X', 'Y', 'Z'), imu.accelerometer))
+        data['Gyroscope'] = dict(zip(('X', 'Y', 'Z'), imu.gyroscope))
         return json.dumps(data)
 
-    def getIMUData(self) -> str:
-        '''Returns a Json-formatted string containing IMU Data'''
-        self.__log.trace('Fetching IMU Data')
-
-        data = {}
-        data['Magnetometer'] = json.loads(self.getMagnetometerData())
-        data['Accelerometer'] = json.loads(self.getAccelerometerData())
-        data['Gyroscope'] = json.loads(self.getGyroscopeData())
-        return json.dumps(data)
+    def __imuVector(self, sensor: str):
+        '''Returns one sensor of the latest IMU sample in the current return mode'''
+        vector = getattr(self.__reading('imu'), sensor)
+        if self.returnMode == 'native':
+            return vector
+        return json.dumps(dict(zip(('X', 'Y', 'Z'), vector)))
 
     def getPressureExternal(self) -> float:
         '''Returns the reading of the pressure sensor in Pascals'''
-
-        self.__log.trace('Fetching External Pressure')
-
-        # Check message availability
-        if self.externalPressureMessage not in self.messages:
-            sleep(1)
-
-        # Get the pressure data
-        pressure_data = self.messages[self.externalPressureMessage]['message']
-        self.__log.rdata(round(100 * float(pressure_data.press_abs), 2))
-        return round(100 * float(pressure_data.press_abs), 2)   # convert to Pascals before returning
+        return self.__reading('pressureExternal')
 
     def getPressureInternal(self) -> float:
         '''Returns the reading of the internal pressure sensor in Pascals'''
-
-        self.__log.trace('Fetching External Pressure')
-
-        # Check message availability
-        if 'SCALED_PRESSURE' not in self.messages:
-            sleep(1)
-
-        # Get the pressure data
-        pressure_data = self.messages['SCALED_PRESSURE']['message']
-        self.__log.rdata('getInternalPressure about to return ' + str(round(100 * float(pressure_data.press_abs), 2)))
-        return round(100 * float(pressure_data.press_abs), 2)   # convert to Pascals before returning
+        return self.__reading('pressureInternal')
 
     def getDepth(self) -> float:
         '''Returns the depth of the drone in meters as a float'''
-        self.__log.trace('Fetching Depth')
+        return self.__reading('depth')
+
+    def getDepthEstimate(self) -> depthEstimate:
+        '''
+        Returns the fused estimate of depth and climb rate (from pressure and acceleration) with their uncertainty,
+        as a JSON-formatted string or a depthEstimate named tuple depending on the return mode.
+        Raises a TimeoutError if no pressure reading arrives within a second.
+        '''
+        if not self.depthEstimator.ready.wait(timeout=1):
+            raise TimeoutError('No ' + self.externalPressureMessage + ' message has been received')
+        estimate = self.depthEstimator.estimate()
+        if self.returnMode == 'native':
+            return estimate
 
-        # Get variable values from config
-        surfacePressure = int(self.config['geodata']['surfacePressure'])    # pascals
-        fluidDensity = int(self.config['geodata']['fluidDensity'])          # kg/m^3
-        g = 9.8066                                                          # m/s^2
+        returnData = estimate._asdict()
+        del returnData['time']  # Monotonic, only meaningful within this process
+        return json.dumps(returnData)
 
-        # Calculate depth
-        depth = ((self.getPressureExternal() - surfacePressure) / (fluidDensity * g)) * -1
-        self.__log.trace('Depth = ' + str(depth))
-        return round(depth, 2)    # Meters
+    def getClimbRate(self) -> float:
+        '''
+        Returns the estimated vertical speed of the drone in m/s, positive when rising.
+        Raises a TimeoutError if no pressure reading arrives within a second.
+        '''
+        if not self.depthEstimator.ready.wait(timeout=1):
+            raise TimeoutError('No ' + self.externalPressureMessage + ' message has been received')
+        return self.depthEstimator.estimate().climbRate
 
     def getTemperature(self) -> float:
         '''
         Returns the reading of the Temperature sensor in degrees Celsius
         Note that the returned value is accurate only to the nearest degree
         '''
+        return self.__reading('temperature')
 
-        self.__log.trace('Fetching Temperature from pressure sensor')
-
-        # Check message availability
-        if self.externalPressureMessage not in self.messages:
-            self.__log.warn('Scaled Pressure message not available, Possible config issue.')
-            sleep(1)
-
-        # Get the pressure data
-        pressure_data = self.messages[self.externalPressureMessage]['message']
-        tempC = float(pressure_data.temperature) / 100.0
-        self.__log.trace('getTemperature returning ' + str(tempC))
-        return tempC
-
-    def getAltitude(self) -> str:
+    def getAltitude(self, sonar: int = 0):
         '''
-        Returns the distance between the sonar sensor and the ground in meters (incl. confidence)
+        Returns the distance between the sonar sensor and the ground in meters (incl. confidence),
+        as a JSON-formatted string or an altitudeData named tuple depending on the return mode.
         Raises an exception if no sonar sensors are enabled.
+        When streaming, returns the latest reading without waiting, or raises a TimeoutError if it is too old.
+
+        :param sonar: <optional> the index of the sonar to read, in the order they are listed in the config
         '''
         self.__log.trace('fetching height')
-        if int(self.config['hardware']['sonarcount']) == 0:
+        if self.config.get('hardware', 'sonarcount') == 0:
             # If there are no sonar sensors attached
             self.__log.trace('Sonar disabled in config, raising exception')
             raise ResourceWarning("This drone does not have an enabled sonar sensor.\n"
                                   + "If the drone does have a sonar sensor, set the 'sonarcount' entry in the config")
-        sonarData = json.loads(self.sonar.getMessage())
+        sonar = self.sonars[sonar]
+        if PING1D_DISTANCE_SIMPLE in sonar.streaming:
+            # Only waits if the first reading has not arrived yet, just after the sonar was created
+            maxAge = self.config.get('sonar', 'maxAge')
+            sonarData = sonar.getLatest(PING1D_DISTANCE_SIMPLE, maxAge=maxAge, wait=maxAge).data
+        else:
+            sonarData = sonar.getMessageData()
         if 'distance' not in sonarData:
-            self.__log.error('A distance field was not found in the JSON.'
+            self.__log.error('A distance field was not found in the sonar message.'
                              + ' This may be caused by another entity requesting and retrieving from the sensor')
             raise AttributeError("Distance not found in value returned from sonar sensor")
+        altitude = altitudeData(altitude=sonarData['distance'] / 1000, confidence=sonarData['confidence'])
+        if self.returnMode == 'native':
+            return altitude
+
         # Restructure the output before returning
         returnData = {
-            'altitude': str(float(sonarData['distance']) / 1000),
-            'confidence': sonarData['confidence']
+            'altitude': str(altitude.altitude),
+            'confidence': str(altitude.confidence)
         }
         returnJson = json.dumps(returnData)
         self.__log.trace('getAltitude now returning ' + returnJson)
         return returnJson
 
+    def getSonarProfile(self, sonar: int = 0):
+        '''
+        Returns the newest echo profile from a sonar, as a JSON-formatted string or a sonarProfile named tuple
+        (with the samples as a numpy uint8 array) depending on the return mode.
+        The first call starts capturing profiles into the sonar's waterfall (MLI.sonars[sonar].profiles).
+
+        :param sonar: <optional> the index of the sonar to read, in the order they are listed in the config
+        '''
+        self.__log.trace('fetching sonar profile')
+        if self.config.get('hardware', 'sonarcount') == 0:
+            self.__log.trace('Sonar disabled in config, raising exception')
+            raise ResourceWarning("This drone does not have an enabled sonar sensor.\n"
+                                  + "If the drone does have a sonar sensor, set the 'sonarcount' entry in the config")
+        sonar = self.sonars[sonar]
+        if sonar.profiles is None:
+            sonar.captureProfiles(capacity=self.config.get('sonar', 'profileCapacity'),
+                                  width=self.config.get('sonar', 'profileSamples'),
+                                  stream=self.config.get('sonar', 'streaming'))
+        maxAge = self.config.get('sonar', 'maxAge')
+        profile = sonar.getProfile(maxAge=maxAge, wait=maxAge)
+        if self.returnMode == 'native':
+            return profile
+
+        returnData = profile._asdict()
+        returnData['samples'] = profile.samples.tolist()
+        return json.dumps(returnData)
+
+    def getAllSensorData(self, asJson: bool = False) -> sensorSnapshot:
+        '''
+        Returns every sensor reading from a single consistent read of the received messages,
+        along with the age of each reading in seconds.
+        Readings that are not available (e.g. GPS when disabled) are None.
+
+        :param asJson: <optional> when true, returns the snapshot as a JSON-formatted string
+        '''
+
+        # Copy the readings under the lock, so none can be replaced part way through
+        with self.__messagesLock:
+            values = self.__telemetry.snapshot()
+        now = datetime.now()
+
+        def read(name):
+            return values[name].value if name in values else None
+
+        def age(name):
+            return (now - values[name].time).total_seconds() if name in values else None
+
+        snapshot = sensorSnapshot(
+            time=now,
+            battery=read('battery'),
+            imu=read('imu'),
+            pressureExternal=read('pressureExternal'),
+            pressureInternal=read('pressureInternal'),
+            depth=read('depth'),
+            temperature=read('temperature'),
+            heading=read('heading'),
+            gps=read('gps'),
+            ages=sensorAges(battery=age('battery'),
+                            imu=age('imu'),
+                            pressureExternal=age('pressureExternal'),
+                            pressureInternal=age('pressureInternal'),
+                            depth=age('depth'),
+                            temperature=age('temperature'),
+                            heading=age('heading'),
+                            gps=age('gps')))
+
+        if asJson:
+            return snapshot.toJson()
+        return snapshot
+
     def getHeading(self) -> float:
         '''
         Returns the current heading of the drone based on compass data
         '''
-        # mag_heading found in pymavlink.mavextra
-        return mag_heading(self.messages['RAW_IMU']['message'], self.messages['ATTITUDE']['message'])
+        return self.__reading('heading')
 
     # Configuration Commands
     def setSurfacePressure(self, pressure: float = None) -> None:
@@ -864,17 +1162,14 @@ class mavlinkInterface(object):
         if not pressure:
             pressure = self.getPressureExternal()
             self.__log.info('Pressure not given, using current pressure of ' + str(pressure)
-                            + '. Was ' + str(self.config['geodata']['surfacePressure']))
+                            + '. Was ' + str(self.config.get('geodata', 'surfacePressure')))
         else:
             self.__log.info('Setting surface pressure to ' + str(pressure)
-                            + '. Was ' + str(self.config['geodata']['surfacePressure']))
+                            + '. Was ' + str(self.config.get('geodata', 'surfacePressure')))
 
         pressure = round(pressure)  # Round to nearest int
 
-        self.config.set('geodata', 'surfacePressure', str(pressure))
-        # Write value to configFile
-        with open(self.configPath, 'w') as configFile:
-            self.config.write(configFile)
+        self.config.set('geodata', 'surfacePressure', pressure)    # Written to the config file shortly after
 
     def setFluidDensity(self, density: float = 1000) -> None:
         '''
@@ -885,12 +1180,9 @@ class mavlinkInterface(object):
         Freshwater is 1000, salt water is typically 1020-1030
         '''
         self.__log.info('Setting fluidDensity to ' + str(density)
-                        + '. Was ' + str(self.config['geodata']['fluidDensity']))
+                        + '. Was ' + str(self.config.get('geodata', 'fluidDensity')))
 
-        self.config.set('geodata', 'fluidDensity', str(density))
-        # Write value to configFile
-        with open(self.configPath, 'w') as configFile:
-            self.config.write(configFile)
+        self.config.set('geodata', 'fluidDensity', density)    # Written to the config file shortly after
 
     def setDefaultExecMode(self, mode: str) -> None:
         '''
@@ -925,6 +1217,20 @@ class mavlinkInterface(object):
         self.execMode = mode
         self.__log.debug('Execution mode successfully set to ' + mode)
 
+    def setReturnMode(self, mode: str) -> None:
+        '''
+        Sets the format that sensor commands return their data in:
+
+        - 'json': JSON-formatted strings (the default)
+        - 'native': named tuples of numbers, which avoids converting to and from JSON
+        '''
+        mode = mode.lower()
+        if mode not in ['json', 'native']:
+            raise ValueError('The returnMode parameter must be one of the following: json, native')
+
+        self.__log.debug('Return mode set to ' + mode)
+        self.returnMode = mode
+
     def setLeakAction(self, action: str) -> None:
         '''
         Sets the leak response action. Valid values:
@@ -943,7 +1249,7 @@ class mavlinkInterface(object):
                 rate: float = 20,
                 direction: bool = 1,
                 relative: bool = 1,
-                execMode: str = None) -> None:
+                execMode: str = None) -> int:
         # THIS IS BROKEN TODO FIX
         '''Rotates the drone around the Z-Axis
 
@@ -951,21 +1257,23 @@ class mavlinkInterface(object):
         rate: rotational velocity in deg/s
         direction: 1 = Clockwise, -1 = CCW
         relative: (1) - zero is current bearing, (0) - zero is north
+        In synchronous mode, returns the MAV_RESULT of the yaw command (None if never acknowledged)
         '''
-        t = Thread(target=commands.active.yawBeta,
-                   args=(self.mavlinkConnection,
-                         self.sem,
-                         self.currentTaskKillEvent,
-                         angle,
-                         rate,
-                         direction,
-                         relative,))
+        t = RThread(target=commands.active.yawBeta,
+                    args=(self.mavlinkConnection,
+                          self.sem,
+                          self.currentTaskKillEvent,
+                          angle,
+                          rate,
+                          direction,
+                          relative,
+                          self.commandAcks,))
 
         # Calculate action based on mode
         if self.__getSemaphore(execMode, t):   # If sem was able to be acquired
             t.start()                 # Start the thread
             if(execMode == 'synchronous' or (execMode is None and self.execMode == 'synchronous')):
-                t.join()   # Wait when using synchronous mode
+                return t.join()   # Wait when using synchronous mode
 
     def changeAltitude(self, rate, altitude, execMode: str = None) -> None:
         t = Thread(target=commands.active.changeAltitude, args=(self.mavlinkConnection, self.sem, rate, altitude,))
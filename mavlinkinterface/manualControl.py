@@ -0,0 +1,101 @@
+from collections import namedtuple     # For immutable frames
+from threading import Condition         # For publishing changes to the sender thread
+
+# An immutable MANUAL_CONTROL frame, see mavlinkInterface.__manualControlSend for field details
+manualControlFrame = namedtuple('manualControlFrame', ['x', 'y', 'z', 'r', 'b', 'version'])
+
+
+class manualControlState(object):
+    '''
+    Holds the manual control axes and buttons shared between command threads.
+
+    Every change publishes a new immutable manualControlFrame with an incremented version,
+    so readers always see a complete frame and never a mix of old and new axes.
+    '''
+
+    fields = ('x', 'y', 'z', 'r', 'b')
+    neutral = {'x': 0, 'y': 0, 'z': 500, 'r': 0, 'b': 0}
+
+    def __init__(self):
+        self.__changed = Condition()
+        self.__frame = manualControlFrame(version=0, **self.neutral)
+
+    def snapshot(self) -> manualControlFrame:
+        '''Returns the current frame. Frames are immutable, so no locking is needed to read one.'''
+        return self.__frame
+
+    @property
+    def version(self) -> int:
+        '''The version of the current frame, incremented on every change'''
+        return self.__frame.version
+
+    def update(self, **values) -> manualControlFrame:
+        '''
+        Atomically sets any number of axes (and/or the button bitfield) in one change
+
+        :param values: new values keyed by field name, e.g. update(x=500, y=-250)
+        '''
+        self.__validate(values)
+        with self.__changed:
+            frame = self.__frame
+            self.__frame = frame._replace(version=frame.version + 1, **values)
+            self.__changed.notify_all()
+            return self.__frame
+
+    def reset(self, *fields: str) -> manualControlFrame:
+        '''Returns the given fields (or all fields if none are given) to their neutral values'''
+        return self.update(**{f: self.neutral[f] for f in (fields or self.fields)})
+
+    def compareAndSwap(self, expected: manualControlFrame, **values) -> bool:
+        '''
+        Applies the given values only if the current frame is still the expected one.
+        Returns true if the values were applied, false if another thread changed the frame first.
+
+        :param expected: the frame the new values were calculated from
+        '''
+        self.__validate(values)
+        with self.__changed:
+            frame = self.__frame
+            if frame.version != expected.version:
+                return False
+            self.__frame = frame._replace(version=frame.version + 1, **values)
+            self.__changed.notify_all()
+            return True
+
+    def setButtons(self, mask: int) -> manualControlFrame:
+        '''Presses the buttons in the given bitmask without altering other buttons'''
+        while True:
+            frame = self.__frame
+            if self.compareAndSwap(frame, b=frame.b | mask):
+                return self.__frame
+
+    def clearButtons(self, mask: int) -> manualControlFrame:
+        '''Releases the buttons in the given bitmask without altering other buttons'''
+        while True:
+            frame = self.__frame
+            if self.compareAndSwap(frame, b=frame.b & ~mask):
+                return self.__frame
+
+    def waitForChange(self, version: int, timeout: float = None) -> manualControlFrame:
+        '''
+        Blocks until the frame version differs from the given version, or until the timeout expires.
+        Returns the current frame either way.
+        '''
+        with self.__changed:
+            self.__changed.wait_for(lambda: self.__frame.version != version, timeout)
+            return self.__frame
+
+    # Dict-style access, kept so code written against the old manualControlParams dict still works
+    def __getitem__(self, field: str) -> int:
+        if field not in self.fields:
+            raise KeyError(field)
+        return getattr(self.__frame, field)
+
+    def __setitem__(self, field: str, value: int) -> None:
+        self.update(**{field: value})
+
+    def __validate(self, values: dict) -> None:
+        for field in values:
+            if field not in self.fields:
+                raise KeyError('Invalid manual control field: ' + str(field)
+                               + '. Valid fields are: ' + str(self.fields))
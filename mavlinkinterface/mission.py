@@ -1,7 +1,8 @@
-from time import sleep
-from datetime import datetime
-from pymavlink import mavutil, mavwp
+from pymavlink import mavutil
 from mavlinkinterface.logger import getLogger
+from mavlinkinterface.missionTransfer import changedRanges
+from mavlinkinterface import survey
+from mavlinkinterface import missionFiles
 
 
 class mission(object):
@@ -19,7 +20,8 @@ class mission(object):
         # Keep pointer to main class
         self.__mli = mli
         self.__log = getLogger('Mission')
-        # Create pymavlink waypoint loader
+        # Create pymavlink waypoint loader, imported here as only scripts using missions need it
+        from pymavlink import mavwp
         self.wp = mavwp.MAVWPLoader()
 
         # Initialize message counter to 1
@@ -94,65 +96,241 @@ class mission(object):
 
         self.seq += 1   # seq number must be incremented after each added command
 
-    def upload(self) -> None:
-        '''Uploads the flight plan to the drone. This will overwrite any previous flight plans.'''
+    def addWaypoints(self, lat, lon, alt: float = 0) -> None:
+        '''Adds many stops to the mission plan at once, in order. Raises a ValueError if the mission would have more
+        items than the drone can hold (the mission.maxItems config option).
 
-        # remove previous missions
-        self.__mli.mavlinkConnection.waypoint_clear_all_send()
+        :param lat: the latitudes of the stops in decimal degrees, as a list or numpy array
+        :param lon: the longitudes of the stops in decimal degrees, as a list or numpy array
+        :param alt: the altitude of every stop in meters, relative to home (negative underwater)
+        '''
+        lat, lon = list(map(float, lat)), list(map(float, lon))
+        if len(lat) != len(lon):
+            raise ValueError('lat and lon must have the same length')
+        self.__checkSize(self.wp.count() + len(lat))
+
+        first = self.wp.count()
+        target = (self.__mli.mavlinkConnection.target_system, self.__mli.mavlinkConnection.target_component)
+        item = mavutil.mavlink.MAVLink_mission_item_message
+        command = mavutil.mavlink.MAV_CMD_NAV_WAYPOINT
+        # Built in one pass and added directly, as MAVWPLoader.add copies each item
+        self.wp.wpoints.extend([item(*target, seq, self.__frame, command, 0, 0, 0, 0, 0, 0, x, y, alt)
+                                for seq, x, y in zip(range(first, first + len(lat)), lat, lon)])
+        self.seq += len(lat)
+        self.__log.trace('Added ' + str(len(lat)) + ' waypoints to the mission')
+
+    def lawnmower(self, polygon, spacing: float, heading: float = 0, alt: float = 0) -> int:
+        '''Adds a lawnmower pattern covering a polygon: parallel lines spacing meters apart, run in alternating
+        directions. Returns the number of waypoints added.
+
+        :param polygon: the corners of the area to cover, as (lat, lon) pairs in decimal degrees
+        :param spacing: the distance between lines, in meters
+        :param heading: the direction of the lines, in degrees clockwise from north
+        :param alt: the altitude of every waypoint in meters, relative to home (negative underwater)
+        '''
+        lat, lon = survey.lawnmower(polygon, spacing, heading)
+        self.addWaypoints(lat, lon, alt)
+        return len(lat)
+
+    def grid(self, polygon, spacing: float, heading: float = 0, alt: float = 0) -> int:
+        '''Adds a grid pattern covering a polygon: a lawnmower pattern along the heading, then one across it.
+        Takes the same parameters as lawnmower, and returns the number of waypoints added.
+        '''
+        lat, lon = survey.grid(polygon, spacing, heading)
+        self.addWaypoints(lat, lon, alt)
+        return len(lat)
+
+    def spiral(self, lat: float, lon: float, radius: float, spacing: float,
+               pointSpacing: float = None, alt: float = 0) -> int:
+        '''Adds a spiral out from a center point, each turn spacing meters outside the last.
+        Returns the number of waypoints added.
+
+        :param lat: the latitude of the center in decimal degrees
+        :param lon: the longitude of the center in decimal degrees
+        :param radius: the distance from the center to the end of the spiral, in meters
+        :param spacing: the distance between turns, in meters
+        :param pointSpacing: <optional> the distance between waypoints along the spiral in meters, defaults to spacing
+        :param alt: the altitude of every waypoint in meters, relative to home (negative underwater)
+        '''
+        lats, lons = survey.spiral(lat, lon, radius, spacing, pointSpacing)
+        self.addWaypoints(lats, lons, alt)
+        return len(lats)
+
+    def transects(self, lat: float, lon: float, length: float, spacing: float, count: int,
+                  heading: float = 0, alt: float = 0) -> int:
+        '''Adds parallel transects, run in alternating directions, each to the right of the last.
+        Returns the number of waypoints added.
+
+        :param lat: the latitude of the start of the first transect in decimal degrees
+        :param lon: the longitude of the start of the first transect in decimal degrees
+        :param length: the length of each transect, in meters
+        :param spacing: the distance between transects, in meters
+        :param count: the number of transects
+        :param heading: the direction of the first transect, in degrees clockwise from north
+        :param alt: the altitude of every waypoint in meters, relative to home (negative underwater)
+        '''
+        lats, lons = survey.transects(lat, lon, length, spacing, count, heading)
+        self.addWaypoints(lats, lons, alt)
+        return len(lats)
+
+    def upload(self, progress=None, timeout: float = None, retries: int = None) -> bool:
+        '''Uploads the flight plan to the drone. This will overwrite any previous flight plans.
+        Returns true if the drone accepted the mission, false if it rejected it or stopped responding.
+
+        :param progress: <optional> function called with (items sent, total items) as the upload advances
+        :param timeout: <optional> seconds to wait for each request from the drone before resending
+        :param retries: <optional> number of times in a row to resend before giving up
+        '''
+        self.__log.trace('Uploading mission of ' + str(self.wp.count()) + ' items')
+        result = self.__mli.missionTransfer.upload(self.__items(), progress=progress, timeout=timeout, retries=retries)
+        return result == mavutil.mavlink.MAV_MISSION_ACCEPTED
+
+    def update(self, progress=None, timeout: float = None, retries: int = None) -> bool:
+        '''Uploads only the items that differ from the mission on the drone, as of the last upload or download.
+        Falls back to a full upload if the drone's mission is not known, or has a different number of items.
+        Returns true if the drone accepted every change, false if it rejected one or stopped responding.
+
+        :param progress: <optional> function called with (items sent, total items to send) as the upload advances
+        :param timeout: <optional> seconds to wait for each request from the drone before resending
+        :param retries: <optional> number of times in a row to resend before giving up
+        '''
+        items = self.__items()
+        onDrone = self.__mli.missionTransfer.onDrone.get(0)
+        if onDrone is None or len(onDrone) != len(items):
+            self.__log.trace('Mission on the drone unknown or of a different length, uploading all of it')
+            return self.upload(progress=progress, timeout=timeout, retries=retries)
+
+        ranges = self.diff()
+        total = sum(last - first + 1 for first, last in ranges)
+        self.__log.trace('Uploading ' + str(total) + ' changed mission items in ' + str(len(ranges)) + ' ranges')
+        sent = 0
+        for first, last in ranges:
+            def rangeProgress(done, count, sent=sent):
+                progress(sent + done, total)
+            result = self.__mli.missionTransfer.uploadPartial(items, first, last,
+                                                              progress=None if progress is None else rangeProgress,
+                                                              timeout=timeout, retries=retries)
+            if result != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+                return False
+            sent += last - first + 1
+        return True
+
+    def download(self, progress=None, timeout: float = None, retries: int = None) -> bool:
+        '''Replaces the items of this mission with the mission on the drone.
+        Returns true if the mission was downloaded, false if the drone refused or stopped responding.
+
+        :param progress: <optional> function called with (items received, total items) as the download advances
+        :param timeout: <optional> seconds to wait for each item from the drone before requesting it again
+        :param retries: <optional> number of times in a row to request again before giving up
+        '''
+        items = self.__mli.missionTransfer.download(progress=progress, timeout=timeout, retries=retries)
+        if items is None:
+            return False
+        self.wp.clear()
+        self.wp.add(items)
+        self.seq = self.wp.count() + 1
+        return True
 
-        # Notify drone of mission length
-        self.__mli.mavlinkConnection.waypoint_count_send(self.wp.count())
+    def save(self, path: str, fileFormat: str = None) -> None:
+        '''Saves the items of this mission to a file
 
-        missionSeq = -1     # for keeping track of messages
+        :param path: the file to write
+        :param fileFormat: <optional> plan (QGroundControl), wpl (QGC WPL 110 text) or binary (NumPy .npy).
+                           If not given, .plan files are plan, .npy files are binary and any other file is wpl
+        '''
+        missionFiles.write(path, self.__items(), fileFormat)
+        self.__log.trace('Saved ' + str(self.wp.count()) + ' mission items to ' + str(path))
+
+    def load(self, path: str, fileFormat: str = None) -> None:
+        '''Replaces the items of this mission with those in a file. Raises a ValueError if the file is invalid,
+        or has more items than the drone can hold.
+
+        :param path: the file to read
+        :param fileFormat: <optional> plan, wpl or binary, as for save
+        '''
+        items = missionFiles.read(path, self.__mli.mavlinkConnection.target_system,
+                                  self.__mli.mavlinkConnection.target_component, fileFormat)
+        self.__checkSize(len(items))
+        self.wp.clear()
+        self.wp.wpoints.extend(items)   # Added directly, as MAVWPLoader.add copies each item
+        self.seq = self.wp.count() + 1
+        self.__log.trace('Loaded ' + str(len(items)) + ' mission items from ' + str(path))
 
-        # for each mission:
-        for i in range(self.wp.count()):
+    def diff(self, other=None) -> list:
+        '''Returns the (first, last) item numbers (inclusive) of each run of items that differ from another mission.
+        If the missions have different lengths, the items past the end of the shorter one are different.
 
-            # Wait for acknowledgement
-            while 'MISSION_REQUEST' not in self.__mli.messages:
-                sleep(.1)
-            msg = self.__mli.messages['MISSION_REQUEST']['message']
-            while msg.seq == missionSeq:
-                sleep(.1)
-                msg = self.__mli.messages['MISSION_REQUEST']['message']
-            missionSeq = msg.seq
+        :param other: <optional> the mission to compare with, defaults to the mission on the drone
+                      as of the last upload or download (if it is not known, every item is different)
+        '''
+        items = self.__items()
+        if other is None:
+            otherItems = self.__mli.missionTransfer.onDrone.get(0, [])
+        else:
+            otherItems = [other.wp.wp(i) for i in range(other.wp.count())]
 
-            # Send command
-            self.__mli.mavlinkConnection.mav.send(self.wp.wp(msg.seq))
+        common = min(len(items), len(otherItems))
+        ranges = changedRanges(otherItems[:common], items[:common])
+        longest = max(len(items), len(otherItems))
+        if common < longest:
+            if ranges and ranges[-1][1] == common - 1:
+                ranges[-1] = (ranges[-1][0], longest - 1)
+            else:
+                ranges.append((common, longest - 1))
+        return ranges
 
-    def start(self, wait: bool = False) -> None:
-        '''Starts the mission that was most recently uploaded to the drone
+    def start(self, wait: bool = False, progress=None, ekfTimeout: float = 60, timeout: float = None) -> bool:
+        '''Starts the mission that was most recently uploaded to the drone, once its EKF has a position.
+        Returns true if the mission started (and with wait, completed), false if it did not.
 
         Note: The mission this starts may not be this mission.
+
+        :param wait: if true, blocks until the last item of the mission has been reached
+        :param progress: <optional> function called with the mission's progress (see getProgress) each time it changes.
+                         It is called as messages arrive, so it must return quickly
+        :param ekfTimeout: seconds to wait for the EKF to be ready before giving up
+        :param timeout: <optional> with wait, the most seconds to wait for the mission to complete
         '''
+        monitor = self.__mli.missionMonitor
 
         # Wait for EKF status report flag (the 128 bit) to be zero
         # https://mavlink.io/en/messages/ardupilotmega.html#EKF_STATUS_FLAGS
-        ekfFlags = self.__mli.messages['EKF_STATUS_REPORT']['message'].flags
-        mask = 1 << 7
-        while (ekfFlags & mask):
-            ekfFlags = self.__mli.messages['EKF_STATUS_REPORT']['message'].flags
+        if not monitor.waitForEkf(ekfTimeout):
+            self.__log.error('EKF not ready after ' + str(ekfTimeout) + ' seconds (flags '
+                             + str(monitor.ekfFlags) + '), mission not started')
+            return False
 
-        # Send mavlink message
-        self.__mli.mavlinkConnection.mav.command_long_send(
-            self.__mli.mavlinkConnection.target_system,
-            self.__mli.mavlinkConnection.target_component,
+        # Follow progress from before the mission starts, so the first item reached cannot be missed
+        monitor.begin(self.wp.count(), progress)
+        result = self.__mli.commandAcks.commandLong(
             mavutil.mavlink.MAV_CMD_MISSION_START,
-            0,  # Confirmation
-            0,  # param1: First mission item to execute
-            self.wp.count() - 1,  # param2: Last mission item to execute
-            0,  # param3: Meaningless
-            0,  # param4: Meaningless
-            0,  # param5: Meaningless
-            0,  # param6: Meaningless
-            0)  # param7: Meaningless
+            0,                      # param1: First mission item to execute
+            self.wp.count() - 1)    # param2: Last mission item to execute
+        if result != mavutil.mavlink.MAV_RESULT_ACCEPTED:
+            self.__log.error('Drone did not start the mission, result ' + str(result))
+            return False
+        self.__log.info('Mission started')
 
         if wait:
-            while 'MISSION_ITEM_REACHED' not in self.__mli.messages:
-                sleep(.1)
-            msg = self.__mli.messages['MISSION_ITEM_REACHED']['message']
-            timestamp = self.__mli.messages['MISSION_ITEM_REACHED']['time']
-            while msg.seq < (self.wp.count() - 1) or (datetime.now() - timestamp).total_seconds() > 5:
-                sleep(.5)
-                msg = self.__mli.messages['MISSION_ITEM_REACHED']['message']
-            print("mission complete")
+            if not monitor.wait(timeout):
+                self.__log.warn('Mission not complete after ' + str(timeout) + ' seconds')
+                return False
+        return True
+
+    def getProgress(self):
+        '''Returns the progress of the last mission started as a missionStatus named tuple, or None if none has been:
+        current item, items reached, total items, last item reached, seconds elapsed,
+        estimated seconds remaining (None until the first item is reached), and whether it is complete
+        '''
+        return self.__mli.missionMonitor.status()
+
+    def __checkSize(self, count: int) -> None:
+        '''Raises a ValueError if a mission of count items would be larger than the drone can hold'''
+        maxItems = self.__mli.config.get('mission', 'maxItems')
+        if count > maxItems:
+            raise ValueError('Mission would have ' + str(count) + ' items, but the drone can hold '
+                             + str(maxItems) + ' (see the mission.maxItems config option)')
+
+    def __items(self) -> list:
+        '''Returns the items of this mission, numbered from 0'''
+        return [self.wp.wp(i) for i in range(self.wp.count())]
@@ -0,0 +1,237 @@
+from functools import lru_cache         # For reloading unchanged files
+from json import dumps, load            # For QGroundControl plan files
+from math import isnan                  # For parameters QGroundControl leaves empty
+from os import stat                     # For spotting changed files
+from pymavlink import mavutil           # For building mission items
+
+from mavlinkinterface.missionTransfer import positionScale, sameItem
+
+# Mission files hold the items of a mission, numbered from 0, with the home position first.
+# Three formats are supported:
+#   plan: QGroundControl's JSON plan file. QGroundControl keeps the home position apart from the items, as
+#         plannedHomePosition. Any other item 0 (e.g. the DO_SET_HOME of a new mission) is kept with the items,
+#         and the file marked with homeInItems
+#   wpl: the "QGC WPL 110" text format, used by Mission Planner and MAVProxy, one tab separated item per line
+#   binary: a NumPy .npy file of missionDtype rows, the quickest to save and load
+
+WPL_HEADER = 'QGC WPL 110'
+MAV_AUTOPILOT_ARDUPILOTMEGA = 3     # The firmware type of plan files
+MAV_TYPE_SUBMARINE = 12             # The vehicle type of plan files
+
+
+def missionDtype():
+    '''The numpy dtype of one mission item in a binary mission file'''
+    import numpy as np
+    return np.dtype([('seq', '<u2'),
+                     ('frame', 'u1'),
+                     ('command', '<u2'),
+                     ('current', 'u1'),
+                     ('autocontinue', 'u1'),
+                     ('param1', '<f4'),
+                     ('param2', '<f4'),
+                     ('param3', '<f4'),
+                     ('param4', '<f4'),
+                     ('x', '<f8'),
+                     ('y', '<f8'),
+                     ('z', '<f4')])
+
+
+def formatOf(path: str) -> str:
+    '''Returns the format of a mission file from its extension: plan, binary, or otherwise wpl'''
+    name = str(path).lower()
+    if name.endswith('.plan'):
+        return 'plan'
+    if name.endswith('.npy'):
+        return 'binary'
+    return 'wpl'
+
+
+def makeItems(rows, targetSystem: int, targetComponent: int) -> list:
+    '''
+    Builds MISSION_ITEMs in one pass
+
+    :param rows: (seq, frame, command, current, autocontinue, param1, param2, param3, param4, x, y, z) of each item
+    '''
+    item = mavutil.mavlink.MAVLink_mission_item_message
+    return [item(targetSystem, targetComponent, *row) for row in rows]
+
+
+def read(path: str, targetSystem: int, targetComponent: int, fileFormat: str = None) -> list:
+    '''
+    Reads the items of a mission file, as MISSION_ITEMs numbered from 0. Raises a ValueError if the file is invalid.
+
+    :param path: the file to read
+    :param targetSystem, targetComponent: the drone the items are for
+    :param fileFormat: <optional> plan, wpl or binary, found from the extension of path if not given
+    '''
+    fileFormat = fileFormat or formatOf(path)
+    if fileFormat not in ('plan', 'wpl', 'binary'):
+        raise ValueError('Unknown mission file format: ' + str(fileFormat))
+    info = stat(path)
+    return makeItems(readRows(str(path), fileFormat, info.st_mtime_ns, info.st_size), targetSystem, targetComponent)
+
+
+@lru_cache(maxsize=8)
+def readRows(path: str, fileFormat: str, modified: int, size: int) -> tuple:
+    '''
+    Returns the (seq, frame, command, current, autocontinue, param1 to 4, x, y, z) of each item in a mission file.
+    Cached by modification time and size, so reading an unchanged file again only builds its items.
+    '''
+    readers = {'plan': readPlan, 'wpl': readWaypoints, 'binary': readBinary}
+    return tuple(readers[fileFormat](path))
+
+
+def write(path: str, items: list, fileFormat: str = None) -> None:
+    '''
+    Writes mission items to a file
+
+    :param path: the file to write
+    :param items: the MISSION_ITEMs of the mission, numbered from 0
+    :param fileFormat: <optional> plan, wpl or binary, found from the extension of path if not given
+    '''
+    writers = {'plan': writePlan, 'wpl': writeWaypoints, 'binary': writeBinary}
+    fileFormat = fileFormat or formatOf(path)
+    if fileFormat not in writers:
+        raise ValueError('Unknown mission file format: ' + str(fileFormat))
+    writers[fileFormat](path, items)
+
+
+def readWaypoints(path: str) -> list:
+    '''Reads the rows of a QGC WPL 110 file, a line at a time. Items are numbered in order, as files may skip numbers'''
+    rows = []
+    with open(path, 'r') as file:
+        if file.readline().strip() != WPL_HEADER:
+            raise ValueError(path + ' is not a ' + WPL_HEADER + ' file')
+        for number, line in enumerate(file, 2):
+            a = line.split()
+            if not a or a[0].startswith('#'):
+                continue
+            if len(a) != 12:
+                raise ValueError(path + ' line ' + str(number) + ': expected 12 values, found ' + str(len(a)))
+            rows.append((len(rows), int(a[2]), int(a[3]), int(a[1]), int(a[11]),
+                         float(a[4]), float(a[5]), float(a[6]), float(a[7]), float(a[8]), float(a[9]), float(a[10])))
+    if rows and rows[0][2] == 0:
+        # Mission Planner saves home as command 0
+        rows[0] = rows[0][:2] + (mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,) + rows[0][3:]
+    return rows
+
+
+def writeWaypoints(path: str, items: list) -> None:
+    '''Writes a QGC WPL 110 file, a line at a time'''
+    with open(path, 'w') as file:
+        file.write(WPL_HEADER + '\n')
+        file.writelines('%u\t%u\t%u\t%u\t%.8f\t%.8f\t%.8f\t%.8f\t%.17g\t%.17g\t%.6f\t%u\n'
+                        % (w.seq, w.current, w.frame, w.command, w.param1, w.param2, w.param3, w.param4,
+                           w.x, w.y, w.z, w.autocontinue) for w in items)
+
+
+def readPlan(path: str) -> list:
+    '''
+    Reads the rows of a QGroundControl plan file. The planned home position becomes item 0.
+    Complex items (e.g. surveys) are read as the simple items QGroundControl saved with them.
+    '''
+    with open(path, 'r') as file:
+        plan = load(file)
+    if plan.get('fileType') != 'Plan' or 'mission' not in plan:
+        raise ValueError(path + ' is not a QGroundControl plan file')
+    mission = plan['mission']
+
+    def simpleItems(items):
+        for item in items:
+            if item.get('type') == 'SimpleItem':
+                yield item
+            elif 'TransectStyleComplexItem' in item:
+                yield from simpleItems(item['TransectStyleComplexItem'].get('Items', ()))
+            else:
+                raise ValueError(path + ': cannot read ' + str(item.get('complexItemType')) + ' items')
+
+    def number(value):
+        return float('nan') if value is None else float(value)
+
+    if mission.get('homeInItems'):
+        rows, first = [], 0     # Item 0 was saved with the items
+    else:
+        home = mission.get('plannedHomePosition') or [0, 0, 0]
+        rows, first = [homeRow(float(home[0]), float(home[1]), float(home[2]))], 1
+    for seq, item in enumerate(simpleItems(mission.get('items', ())), first):
+        params = [number(p) for p in item['params']]
+        rows.append((seq, item['frame'], item['command'], 0, int(item.get('autoContinue', True)), *params))
+    return rows
+
+
+def homeRow(lat: float, lon: float, alt: float) -> tuple:
+    '''The row of the home item read from a plan file's plannedHomePosition'''
+    return (0, mavutil.mavlink.MAV_FRAME_GLOBAL, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1,
+            0.0, 0.0, 0.0, 0.0, lat, lon, alt)
+
+
+def plannedHome(items: list) -> list:
+    '''
+    Returns the planned home position of a plan file for items whose item 0 is not a plain home position:
+    the location DO_SET_HOME sets, or else the first global position in the mission
+    '''
+    if items[0].command == mavutil.mavlink.MAV_CMD_DO_SET_HOME and items[0].param1 == 0:
+        return [items[0].x, items[0].y, items[0].z]
+    for w in items:
+        if positionScale(w.frame) == 1e7 and (w.x, w.y) != (0, 0):
+            return [w.x, w.y, w.z]
+    return [0, 0, 0]    # The mission has no positions at all
+
+
+def writePlan(path: str, items: list) -> None:
+    '''
+    Writes a QGroundControl plan file. Item 0 is written as the planned home position if it is a plain home position
+    (as read from a plan file, or downloaded from the drone), and with the other items if not
+    '''
+    def param(value):
+        return None if isnan(value) else value     # JSON has no NaN, QGroundControl writes null
+
+    # Item 0 is only left out of the items if reading the planned home position back gives the same item
+    homeInItems = bool(items) and not sameItem(makeItems([homeRow(items[0].x, items[0].y, items[0].z)], 0, 0)[0],
+                                               items[0])
+    if not items:
+        home = [0, 0, 0]
+    elif homeInItems:
+        home = plannedHome(items)
+    else:
+        home = [items[0].x, items[0].y, items[0].z]
+    saved = items if homeInItems else items[1:]
+
+    plan = {'fileType': 'Plan',
+            'version': 1,
+            'groundStation': 'mavlinkinterface',
+            'mission': {'version': 2,
+                        'firmwareType': MAV_AUTOPILOT_ARDUPILOTMEGA,
+                        'vehicleType': MAV_TYPE_SUBMARINE,
+                        'plannedHomePosition': home,
+                        'homeInItems': homeInItems,
+                        'items': [{'type': 'SimpleItem',
+                                   'autoContinue': bool(w.autocontinue),
+                                   'command': w.command,
+                                   'doJumpId': jumpId,
+                                   'frame': w.frame,
+                                   'params': [param(w.param1), param(w.param2), param(w.param3), param(w.param4),
+                                              w.x, w.y, w.z]} for jumpId, w in enumerate(saved, 1)]},
+            'geoFence': {'circles': [], 'polygons': [], 'version': 2},
+            'rallyPoints': {'points': [], 'version': 2}}
+    with open(path, 'w') as file:
+        file.write(dumps(plan))     # dumps uses the C encoder, dump does not
+
+
+def readBinary(path: str) -> list:
+    '''Reads the rows of a binary mission file'''
+    import numpy as np
+    rows = np.load(path, allow_pickle=False)
+    if rows.dtype != missionDtype():
+        raise ValueError(path + ' is not a binary mission file')
+    return rows.tolist()
+
+
+def writeBinary(path: str, items: list) -> None:
+    '''Writes a binary mission file'''
+    import numpy as np
+    rows = np.array([(w.seq, w.frame, w.command, w.current, w.autocontinue, w.param1, w.param2, w.param3, w.param4,
+                      w.x, w.y, w.z) for w in items], dtype=missionDtype())
+    with open(path, 'wb') as file:  # np.save would add .npy to any other extension
+        np.save(file, rows, allow_pickle=False)
+
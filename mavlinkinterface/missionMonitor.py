@@ -0,0 +1,135 @@
+from collections import namedtuple     # For mission progress
+from threading import Event, Lock       # For waiting on the EKF and on the mission
+from time import monotonic              # For timing the mission
+
+from mavlinkinterface.logger import getLogger
+
+# current: the sequence number of the item being run (None until the drone reports it)
+# reached: the number of items reached, total: the number of items in the mission
+# lastReached: the sequence number of the last item reached (None before the first)
+# elapsed: seconds since the mission started, eta: estimated seconds until it completes (None before the first item
+# is reached), complete: true once the last item has been reached
+missionStatus = namedtuple('missionStatus', ['current', 'reached', 'total', 'lastReached', 'elapsed', 'eta',
+                                             'complete'])
+
+
+class missionMonitor(object):
+    '''
+    Follows the drone's EKF status and the progress of the running mission, from EKF_STATUS_REPORT,
+    MISSION_CURRENT and MISSION_ITEM_REACHED messages as they arrive, so starting a mission and waiting for it
+    to finish block on events instead of polling.
+
+    The ETA assumes the remaining items take as long each as the items reached so far.
+
+    handleEkfStatus, handleMissionCurrent and handleItemReached must be called with every EKF_STATUS_REPORT,
+    MISSION_CURRENT and MISSION_ITEM_REACHED message received.
+    '''
+
+    def __init__(self, ekfMask: int = 128):
+        '''
+        :param ekfMask: the EKF_STATUS_FLAGS that must all be clear before a mission can start.
+                        128 (EKF_CONST_POS_MODE) is set until the EKF has a position
+        '''
+        self.__log = getLogger('Mission')
+        self.ekfMask = ekfMask
+        self.ekfFlags = None        # Flags of the last EKF_STATUS_REPORT
+        self.ekfReady = Event()     # Set while none of the ekfMask flags are set
+
+        self.__lock = Lock()
+        self.__progress = None      # Function called with each change of status
+        self.__total = 0
+        self.__started = None       # monotonic time the mission started, None if none has been started
+        self.__current = None
+        self.__reached = set()
+        self.__lastReached = None
+        self.__reachedTime = None   # monotonic time the last item was reached
+        self.complete = Event()
+
+    def handleEkfStatus(self, msg) -> None:
+        self.ekfFlags = msg.flags
+        if msg.flags & self.ekfMask:
+            self.ekfReady.clear()
+        else:
+            self.ekfReady.set()
+
+    def waitForEkf(self, timeout: float = None) -> bool:
+        '''Blocks until the EKF is ready to run a mission. Returns false if the timeout expired first'''
+        return self.ekfReady.wait(timeout=timeout)
+
+    def begin(self, total: int, progress=None) -> None:
+        '''
+        Starts following a mission, forgetting the progress of any previous one
+
+        :param total: the number of items in the mission
+        :param progress: <optional> function called with the missionStatus each time it changes.
+                         It is called on the message refresh thread, so it must return quickly
+        '''
+        with self.__lock:
+            self.__progress = progress
+            self.__total = total
+            self.__started = monotonic()
+            self.__current = None
+            self.__reached = set()
+            self.__lastReached = None
+            self.__reachedTime = None
+            self.complete.clear()
+
+    def handleMissionCurrent(self, msg) -> None:
+        with self.__lock:
+            if self.__started is None or msg.seq == self.__current:
+                return
+            self.__current = msg.seq
+        self.__update()
+
+    def handleItemReached(self, msg) -> None:
+        with self.__lock:
+            if self.__started is None or msg.seq in self.__reached:
+                return
+            self.__reached.add(msg.seq)
+            self.__lastReached = msg.seq
+            self.__reachedTime = monotonic()
+            if msg.seq >= self.__total - 1:
+                self.__log.info('Mission complete after ' + str(round(self.__reachedTime - self.__started, 1))
+                                + ' seconds')
+                self.complete.set()
+        self.__update()
+
+    def status(self) -> missionStatus:
+        '''Returns the progress of the mission, or None if no mission has been started'''
+        with self.__lock:
+            return self.__status()
+
+    def wait(self, timeout: float = None) -> bool:
+        '''Blocks until the mission is complete. Returns false if the timeout expired first'''
+        return self.complete.wait(timeout=timeout)
+
+    def __status(self) -> missionStatus:
+        '''Call with the lock held'''
+        if self.__started is None:
+            return None
+        now = monotonic()
+        eta = None
+        if self.complete.is_set():
+            eta = 0.0
+        elif self.__lastReached is not None:
+            perItem = (self.__reachedTime - self.__started) / len(self.__reached)
+            remaining = self.__total - 1 - self.__lastReached
+            eta = max(perItem * remaining - (now - self.__reachedTime), 0.0)
+        return missionStatus(current=self.__current,
+                             reached=len(self.__reached),
+                             total=self.__total,
+                             lastReached=self.__lastReached,
+                             elapsed=now - self.__started,
+                             eta=eta,
+                             complete=self.complete.is_set())
+
+    def __update(self) -> None:
+        '''Passes the new status to the progress function'''
+        with self.__lock:
+            status = self.__status()
+            progress = self.__progress
+        if progress is not None:
+            try:
+                progress(status)
+            except Exception:
+                self.__log.exception('Mission progress function failed')
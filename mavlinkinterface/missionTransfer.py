@@ -0,0 +1,372 @@
+from copy import copy                   # For addressing items to the drone
+from math import isclose                # For comparing float32 parameters
+from pymavlink import mavutil           # For mission messages and result enumerations
+from threading import Event, Lock       # For waiting on the drone's requests
+from time import monotonic              # For timing the transfer
+
+from mavlinkinterface.logger import getLogger
+
+# Frames whose x and y are latitude and longitude, sent as degrees * 1e7 in MISSION_ITEM_INT
+GLOBAL_FRAMES = (0, 3, 5, 6, 10, 11)    # GLOBAL, GLOBAL_RELATIVE_ALT, GLOBAL_INT, GLOBAL_RELATIVE_ALT_INT,
+                                        # GLOBAL_TERRAIN_ALT, GLOBAL_TERRAIN_ALT_INT
+
+
+def positionScale(frame: int) -> float:
+    '''Returns the factor x and y are multiplied by in a MISSION_ITEM_INT of the given frame'''
+    return 1e7 if frame in GLOBAL_FRAMES else 1e4     # Local positions are sent in 0.1 mm
+
+
+def toItemInt(item):
+    '''Returns a MISSION_ITEM as the equivalent MISSION_ITEM_INT'''
+    scale = positionScale(item.frame)
+    return mavutil.mavlink.MAVLink_mission_item_int_message(
+        item.target_system,
+        item.target_component,
+        item.seq,
+        item.frame,
+        item.command,
+        item.current,
+        item.autocontinue,
+        item.param1,
+        item.param2,
+        item.param3,
+        item.param4,
+        int(round(item.x * scale)),
+        int(round(item.y * scale)),
+        item.z)
+
+
+def fromItemInt(item):
+    '''Returns a MISSION_ITEM_INT as the equivalent MISSION_ITEM'''
+    scale = positionScale(item.frame)
+    return mavutil.mavlink.MAVLink_mission_item_message(
+        item.target_system,
+        item.target_component,
+        item.seq,
+        item.frame,
+        item.command,
+        item.current,
+        item.autocontinue,
+        item.param1,
+        item.param2,
+        item.param3,
+        item.param4,
+        item.x / scale,
+        item.y / scale,
+        item.z)
+
+
+def sameItem(a, b) -> bool:
+    '''
+    Returns true if two MISSION_ITEMs give the drone the same instruction.
+    The sequence number and current flag are ignored, and values are compared at the precision they are sent with.
+    '''
+    if (a.frame, a.command, a.autocontinue) != (b.frame, b.command, b.autocontinue):
+        return False
+    scale = positionScale(a.frame)
+    if round(a.x * scale) != round(b.x * scale) or round(a.y * scale) != round(b.y * scale):
+        return False
+    # Parameters and z are float32 on the link
+    return all(isclose(p, q, rel_tol=1e-6, abs_tol=1e-6) for p, q in ((a.param1, b.param1), (a.param2, b.param2),
+                                                                       (a.param3, b.param3), (a.param4, b.param4),
+                                                                       (a.z, b.z)))
+
+
+def changedRanges(old: list, new: list) -> list:
+    '''
+    Returns the (first, last) sequence numbers, inclusive, of each run of items that differ between two
+    lists of MISSION_ITEMs of the same length
+    '''
+    ranges = []
+    first = None
+    for seq in range(len(new)):
+        if not sameItem(old[seq], new[seq]):
+            if first is None:
+                first = seq
+        elif first is not None:
+            ranges.append((first, seq - 1))
+            first = None
+    if first is not None:
+        ranges.append((first, len(new) - 1))
+    return ranges
+
+
+class missionTransfer(object):
+    '''
+    Runs the mission protocol with the drone, driven by its messages as they arrive.
+
+    To upload, the item count (or for a partial upload, the range of items) is sent, then each MISSION_REQUEST or
+    MISSION_REQUEST_INT is answered with the requested item as soon as it is received (on the message refresh
+    thread), until the drone sends its MISSION_ACK.
+    To download, the list is requested, then each item is requested as soon as the previous one arrives,
+    and the drone is sent a MISSION_ACK once it has arrived.
+
+    If the drone goes quiet for a timeout, the last message is sent again, and the transfer is cancelled once it
+    has been resent retries times in a row. Only one transfer runs at a time.
+
+    onDrone holds the drone's mission as of the last successful transfer, so changes to it can be found
+    without downloading it again.
+
+    handleMessage must be called with every MISSION_REQUEST, MISSION_REQUEST_INT, MISSION_ACK, MISSION_COUNT,
+    MISSION_ITEM and MISSION_ITEM_INT received.
+    '''
+
+    def __init__(self, ml, timeout: float = 1.5, retries: int = 5):
+        '''
+        :param ml: the mavlink connection to send mission messages through
+        :param timeout: default seconds to wait for the drone's next message before resending
+        :param retries: default number of times in a row to resend before giving up
+        '''
+        self.__ml = ml
+        self.__log = getLogger('Mission')
+        self.timeout = timeout
+        self.retries = retries
+
+        self.__transferLock = Lock()    # Held for the whole of a transfer
+        self.__lock = Lock()            # Held while the transfer state changes
+        self.__mode = None              # 'upload' or 'download' while a transfer is running
+        self.__missionType = 0
+        self.__items = None             # Items being uploaded, or downloaded so far
+        self.__range = (0, -1)          # First and last sequence numbers being uploaded
+        self.__done = set()             # Sequence numbers requested (uploads) or received (downloads) so far
+        self.__lastSent = None          # Function resending the last message sent
+        self.__result = None
+        self.__activity = Event()       # Set by each message from the drone
+        self.__finished = Event()       # Set when the transfer is complete
+
+        # The drone's mission as of the last successful transfer, keyed by mission type
+        self.onDrone = {}
+
+    def handleMessage(self, msg) -> None:
+        '''Answers a request or completes the transfer. Called with each mission message received'''
+        if msg.get_srcSystem() != self.__ml.target_system:
+            return
+        with self.__lock:
+            if self.__mode is None or getattr(msg, 'mission_type', 0) != self.__missionType:
+                return
+            msgType = msg.get_type()
+            if self.__mode == 'upload':
+                if msgType == 'MISSION_ACK':
+                    self.__result = msg.type
+                    self.__finished.set()
+                elif msgType in ('MISSION_REQUEST', 'MISSION_REQUEST_INT'):
+                    self.__answerRequest(msg)
+                else:
+                    return
+            else:
+                if msgType == 'MISSION_COUNT':
+                    self.__startDownload(msg.count)
+                elif msgType in ('MISSION_ITEM', 'MISSION_ITEM_INT'):
+                    self.__receiveItem(msg)
+                elif msgType == 'MISSION_ACK':
+                    self.__result = msg.type    # The drone refused to send its mission
+                    self.__finished.set()
+                else:
+                    return
+            self.__activity.set()
+
+    def upload(self,
+               items: list,
+               progress=None,
+               missionType: int = 0,
+               timeout: float = None,
+               retries: int = None) -> int:
+        '''
+        Uploads mission items to the drone, replacing its mission.
+        Returns the MAV_MISSION_RESULT from the drone's MISSION_ACK (0 when accepted),
+        or None if the drone stopped responding.
+
+        :param items: the MISSION_ITEM messages to upload, numbered from 0
+        :param progress: <optional> function called with (items sent, total items) as the upload advances
+        :param missionType: the MAV_MISSION_TYPE, 0 for the main mission
+        :param timeout: seconds to wait for the drone's next message, defaults to self.timeout
+        :param retries: number of times in a row to resend, defaults to self.retries
+        '''
+        def send():
+            self.__ml.mav.mission_count_send(self.__ml.target_system, self.__ml.target_component,
+                                             len(items), missionType)
+        return self.__upload(items, 0, len(items) - 1, send, progress, missionType, timeout, retries)
+
+    def uploadPartial(self,
+                      items: list,
+                      first: int,
+                      last: int,
+                      progress=None,
+                      missionType: int = 0,
+                      timeout: float = None,
+                      retries: int = None) -> int:
+        '''
+        Replaces items first to last (inclusive) of the drone's mission, leaving the rest as they are.
+        The drone's mission must already have at least last + 1 items.
+        Returns the MAV_MISSION_RESULT from the drone's MISSION_ACK (0 when accepted),
+        or None if the drone stopped responding.
+
+        :param items: the whole mission as MISSION_ITEM messages, of which only first to last are sent
+        :param first: the sequence number of the first item to replace
+        :param last: the sequence number of the last item to replace
+        The other parameters are the same as for upload.
+        '''
+        def send():
+            self.__ml.mav.mission_write_partial_list_send(self.__ml.target_system, self.__ml.target_component,
+                                                          first, last, missionType)
+        return self.__upload(items, first, last, send, progress, missionType, timeout, retries)
+
+    def download(self,
+                 progress=None,
+                 missionType: int = 0,
+                 timeout: float = None,
+                 retries: int = None) -> list:
+        '''
+        Downloads the drone's mission.
+        Returns its items as MISSION_ITEM messages, or None if the drone refused or stopped responding.
+
+        :param progress: <optional> function called with (items received, total items) as the download advances
+        The other parameters are the same as for upload.
+        '''
+        def send():
+            self.__ml.mav.mission_request_list_send(self.__ml.target_system, self.__ml.target_component,
+                                                    missionType)
+
+        with self.__transferLock:
+            self.__begin('download', None, (0, -1), send, missionType)
+            start = monotonic()
+            try:
+                completed = self.__wait('download', progress, missionType, timeout, retries)
+            finally:
+                with self.__lock:
+                    self.__mode = None
+            if not completed:
+                return None
+            if self.__result != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+                self.__log.error('Drone refused to send its mission, result ' + str(self.__result))
+                return None
+
+            self.onDrone[missionType] = list(self.__items)
+            if progress is not None:
+                progress(len(self.__items), len(self.__items))
+            self.__log.info('Downloaded ' + str(len(self.__items)) + ' mission items in '
+                            + str(round(monotonic() - start, 3)) + ' seconds')
+            return self.__items
+
+    def __begin(self, mode: str, items: list, seqRange: tuple, send, missionType: int) -> None:
+        '''Sets up a transfer and sends its first message. Set up before sending, so a fast reply cannot be missed'''
+        with self.__lock:
+            self.__mode = mode
+            self.__items = items
+            self.__range = seqRange
+            self.__missionType = missionType
+            self.__done = set()
+            self.__result = None
+            self.__activity.clear()
+            self.__finished.clear()
+            self.__lastSent = send
+            send()
+
+    def __upload(self, items: list, first: int, last: int, send, progress, missionType: int,
+                 timeout: float, retries: int) -> int:
+        with self.__transferLock:
+            self.__begin('upload', list(items), (first, last), send, missionType)
+            start = monotonic()
+            try:
+                completed = self.__wait('upload', progress, missionType, timeout, retries)
+            finally:
+                with self.__lock:
+                    self.__mode = None
+            if not completed:
+                return None
+
+            count = last - first + 1
+            if self.__result == mavutil.mavlink.MAV_MISSION_ACCEPTED:
+                if first == 0 and last == len(items) - 1:
+                    self.onDrone[missionType] = list(items)
+                elif missionType in self.onDrone:
+                    self.onDrone[missionType][first:last + 1] = items[first:last + 1]
+                if progress is not None:
+                    progress(count, count)
+                self.__log.info('Uploaded ' + str(count) + ' mission items in '
+                                + str(round(monotonic() - start, 3)) + ' seconds')
+            else:
+                self.__log.error('Drone rejected the mission with result ' + str(self.__result))
+            return self.__result
+
+    def __wait(self, name: str, progress, missionType: int, timeout: float, retries: int) -> bool:
+        '''
+        Waits for the running transfer to finish, resending the last message whenever the drone goes quiet.
+        Returns false, after cancelling the transfer, if the drone stopped responding.
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        if retries is None:
+            retries = self.retries
+
+        reported = -1
+        attempt = 0
+        while not self.__finished.is_set():
+            if self.__activity.wait(timeout=timeout):
+                self.__activity.clear()
+                attempt = 0
+            else:
+                attempt += 1
+                if attempt > retries:
+                    self.__log.error('Mission ' + name + ' timed out after ' + str(len(self.__done)) + ' items')
+                    self.__ml.mav.mission_ack_send(self.__ml.target_system, self.__ml.target_component,
+                                                   mavutil.mavlink.MAV_MISSION_OPERATION_CANCELLED, missionType)
+                    return False
+                self.__log.warn('No reply to mission ' + name + ', resending (attempt ' + str(attempt + 1) + ')')
+                with self.__lock:
+                    self.__lastSent()
+
+            if progress is not None and len(self.__done) != reported and not self.__finished.is_set():
+                reported = len(self.__done)
+                progress(reported, self.__range[1] - self.__range[0] + 1)
+        return True
+
+    def __answerRequest(self, msg) -> None:
+        '''Sends the item an upload request asks for. Call with the lock held'''
+        first, last = self.__range
+        if not first <= msg.seq <= last:
+            self.__log.warn('Drone requested mission item ' + str(msg.seq) + ', outside of '
+                            + str(first) + ' to ' + str(last))
+            return
+        # Items may have been downloaded, or made for another drone
+        item = copy(self.__items[msg.seq])
+        item.seq = msg.seq
+        item.target_system = self.__ml.target_system
+        item.target_component = self.__ml.target_component
+        if msg.get_type() == 'MISSION_REQUEST_INT':
+            item = toItemInt(item)
+        self.__done.add(msg.seq)
+        self.__lastSent = lambda: self.__ml.mav.send(item)
+        self.__lastSent()
+
+    def __startDownload(self, count: int) -> None:
+        '''Requests the first item of a download, once the drone has said how many there are. Call with the lock held'''
+        if self.__items is not None:
+            return  # A repeat of the count, as the list was requested again
+        self.__items = [None] * count
+        self.__range = (0, count - 1)
+        self.__requestNext()
+
+    def __receiveItem(self, msg) -> None:
+        '''Stores a downloaded item and requests the next one. Call with the lock held'''
+        if self.__items is None or not 0 <= msg.seq < len(self.__items) or self.__items[msg.seq] is not None:
+            return  # Not requested, or a repeat
+        self.__items[msg.seq] = fromItemInt(msg) if msg.get_type() == 'MISSION_ITEM_INT' else msg
+        self.__done.add(msg.seq)
+        self.__requestNext()
+
+    def __requestNext(self) -> None:
+        '''Requests the next item of a download, or acknowledges it once every item has arrived'''
+        seq = len(self.__done)
+        if seq < len(self.__items):
+            def send():
+                self.__ml.mav.mission_request_int_send(self.__ml.target_system, self.__ml.target_component,
+                                                       seq, self.__missionType)
+        else:
+            def send():
+                self.__ml.mav.mission_ack_send(self.__ml.target_system, self.__ml.target_component,
+                                               mavutil.mavlink.MAV_MISSION_ACCEPTED, self.__missionType)
+            self.__result = mavutil.mavlink.MAV_MISSION_ACCEPTED
+            self.__finished.set()
+        self.__lastSent = send
+        send()
@@ -0,0 +1,85 @@
+from collections import namedtuple     # For immutable sensor readings
+import json                             # For the JSON view of a snapshot
+
+g = 9.8066  # m/s^2
+
+# Readings built from mavlink messages. All fields are numbers (or None when the drone does not report them)
+vector3 = namedtuple('vector3', ['x', 'y', 'z'])
+batteryData = namedtuple('batteryData', ['voltage', 'current', 'percentRemaining'])     # V, A, %
+imuData = namedtuple('imuData', ['accelerometer', 'gyroscope', 'magnetometer'])        # mG, mrad/s, mgauss
+gpsData = namedtuple('gpsData', ['lat', 'lon', 'fixType', 'satellites'])               # decimal degrees
+altitudeData = namedtuple('altitudeData', ['altitude', 'confidence'])                  # m, %
+
+# The fields of a snapshot that hold sensor readings, in order
+snapshotFields = ['battery', 'imu', 'pressureExternal', 'pressureInternal', 'depth', 'temperature', 'heading', 'gps']
+
+# Seconds since the message each reading was taken from arrived, or None if it has not arrived
+sensorAges = namedtuple('sensorAges', snapshotFields)
+
+
+class sensorSnapshot(namedtuple('sensorSnapshot', ['time'] + snapshotFields + ['ages'])):
+    '''
+    Every sensor reading, taken from a single consistent read of the received messages.
+    Readings that are not available are None, see ages for how old each reading is.
+    '''
+
+    __slots__ = ()
+
+    def toDict(self) -> dict:
+        '''Returns the snapshot as nested dictionaries'''
+        def convert(value):
+            if hasattr(value, '_asdict'):
+                return {k: convert(v) for k, v in value._asdict().items()}
+            return value
+
+        data = convert(self)
+        data['time'] = self.time.isoformat()
+        return data
+
+    def toJson(self) -> str:
+        '''Returns the snapshot as a JSON-formatted string'''
+        return json.dumps(self.toDict())
+
+
+def batteryFromMessage(msg) -> batteryData:
+    '''Converts a SYS_STATUS message to battery data'''
+    return batteryData(voltage=msg.voltage_battery / 1000,                                      # mV to V
+                       current=None if msg.current_battery == -1 else msg.current_battery / 100,  # cA to A
+                       percentRemaining=None if msg.battery_remaining == -1 else msg.battery_remaining)
+
+
+def imuFromMessage(msg) -> imuData:
+    '''Converts a RAW_IMU message to IMU data, so all three sensors come from the same sample'''
+    return imuData(accelerometer=vector3(msg.xacc, msg.yacc, msg.zacc),
+                   gyroscope=vector3(msg.xgyro, msg.ygyro, msg.zgyro),
+                   magnetometer=vector3(msg.xmag, msg.ymag, msg.zmag))
+
+
+def gpsFromMessage(msg) -> gpsData:
+    '''Converts a GPS_RAW_INT message to GPS data. Coordinates are None without at least a 2D fix'''
+    hasFix = msg.fix_type >= 2
+    return gpsData(lat=msg.lat * 1e-7 if hasFix else None,
+                   lon=msg.lon * 1e-7 if hasFix else None,
+                   fixType=msg.fix_type,
+                   satellites=None if msg.satellites_visible == 255 else msg.satellites_visible)
+
+
+def pressureFromMessage(msg) -> float:
+    '''Returns the absolute pressure of a SCALED_PRESSURE message in pascals'''
+    return round(100 * float(msg.press_abs), 2)
+
+
+def temperatureFromMessage(msg) -> float:
+    '''Returns the temperature of a SCALED_PRESSURE message in degrees Celsius'''
+    return float(msg.temperature) / 100.0
+
+
+def headingFromMessages(rawImu, attitude) -> float:
+    '''Returns the compass heading in degrees from a RAW_IMU and an ATTITUDE message'''
+    from pymavlink.mavextra import mag_heading  # Pre-Built function to calculate heading, imported on first use
+    return mag_heading(rawImu, attitude)
+
+
+def depthFromMessage(msg, surfacePressure: float, fluidDensity: float) -> float:
+    '''Returns the depth in meters (negative underwater) from an external SCALED_PRESSURE message'''
+    return round(((pressureFromMessage(msg) - surfacePressure) / (fluidDensity * g)) * -1, 2)
@@ -0,0 +1,137 @@
+# Internal
+from mavlinkinterface.commands.passive.gpsTrack import EARTH_RADIUS
+
+# Survey patterns are built in a local frame of meters east and north of an origin, and converted back to
+# latitude and longitude. The frame is flat (equirectangular), which is accurate to well under a meter
+# over the few kilometers a survey covers.
+
+
+def toLocal(lat, lon, originLat: float, originLon: float):
+    '''
+    Returns (east, north) in meters from the origin, for points given in decimal degrees.
+    lat and lon may be numbers or numpy arrays.
+    '''
+    import numpy as np
+    north = np.radians(np.asarray(lat, dtype=float) - originLat) * EARTH_RADIUS
+    east = np.radians(np.asarray(lon, dtype=float) - originLon) * EARTH_RADIUS * np.cos(np.radians(originLat))
+    return east, north
+
+
+def toLatLon(east, north, originLat: float, originLon: float):
+    '''Returns (lat, lon) in decimal degrees, for points given in meters east and north of the origin'''
+    import numpy as np
+    lat = originLat + np.degrees(np.asarray(north, dtype=float) / EARTH_RADIUS)
+    lon = originLon + np.degrees(np.asarray(east, dtype=float) / (EARTH_RADIUS * np.cos(np.radians(originLat))))
+    return lat, lon
+
+
+def lawnmower(polygon, spacing: float, heading: float = 0):
+    '''
+    Returns the (lat, lon) arrays of the waypoints of a lawnmower pattern covering a polygon:
+    parallel lines spacing meters apart, run in alternating directions, each from one edge of the polygon to the other.
+    The first and last lines are half a spacing inside the polygon. A concave polygon is covered along each line
+    from where it first enters the polygon to where it last leaves.
+
+    :param polygon: the corners of the area to cover, as (lat, lon) pairs in decimal degrees
+    :param spacing: the distance between lines, in meters
+    :param heading: the direction of the lines, in degrees clockwise from north
+    '''
+    import numpy as np
+    corners = np.asarray(polygon, dtype=float)
+    if corners.ndim != 2 or corners.shape[0] < 3 or corners.shape[1] != 2:
+        raise ValueError('A polygon needs at least 3 (lat, lon) corners')
+    if spacing <= 0:
+        raise ValueError('Spacing must be positive')
+    originLat, originLon = corners.mean(axis=0)
+    east, north = toLocal(corners[:, 0], corners[:, 1], originLat, originLon)
+
+    # u runs along the lines, v across them
+    h = np.radians(heading)
+    u = east * np.sin(h) + north * np.cos(h)
+    v = east * np.cos(h) - north * np.sin(h)
+
+    # The lines, half a spacing in from each side (or one line across the middle of a narrow polygon)
+    width = v.max() - v.min()
+    count = max(int(np.floor(width / spacing)), 1)
+    lines = v.min() + (width - (count - 1) * spacing) / 2 + spacing * np.arange(count)
+
+    # Where every line crosses every edge, as a (lines, edges) array with nan where it does not
+    u1, v1, u2, v2 = u, v, np.roll(u, -1), np.roll(v, -1)
+    crosses = (((v1 <= lines[:, None]) & (lines[:, None] < v2))
+               | ((v2 <= lines[:, None]) & (lines[:, None] < v1)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (lines[:, None] - v1) / (v2 - v1)
+    crossings = np.where(crosses, u1 + t * (u2 - u1), np.nan)
+    found = crosses.any(axis=1)
+    crossings, lines = crossings[found], lines[found]
+    starts, ends = np.nanmin(crossings, axis=1), np.nanmax(crossings, axis=1)
+
+    # Every other line is run backwards
+    backwards = np.arange(len(lines)) % 2 == 1
+    starts, ends = np.where(backwards, ends, starts), np.where(backwards, starts, ends)
+    pathU = np.column_stack((starts, ends)).ravel()
+    pathV = np.repeat(lines, 2)
+
+    pathEast = pathU * np.sin(h) + pathV * np.cos(h)
+    pathNorth = pathU * np.cos(h) - pathV * np.sin(h)
+    return toLatLon(pathEast, pathNorth, originLat, originLon)
+
+
+def grid(polygon, spacing: float, heading: float = 0):
+    '''
+    Returns the (lat, lon) arrays of the waypoints of a grid pattern covering a polygon:
+    a lawnmower pattern along the heading, followed by one at right angles to it.
+    Takes the same parameters as lawnmower.
+    '''
+    import numpy as np
+    lat1, lon1 = lawnmower(polygon, spacing, heading)
+    lat2, lon2 = lawnmower(polygon, spacing, heading + 90)
+    return np.concatenate((lat1, lat2)), np.concatenate((lon1, lon2))
+
+
+def spiral(lat: float, lon: float, radius: float, spacing: float, pointSpacing: float = None):
+    '''
+    Returns the (lat, lon) arrays of the waypoints of a spiral out from a center point,
+    with each turn spacing meters outside the last.
+
+    :param lat, lon: the center of the spiral, in decimal degrees
+    :param radius: the distance from the center to the end of the spiral, in meters
+    :param spacing: the distance between turns, in meters
+    :param pointSpacing: <optional> the distance between waypoints along the spiral in meters, defaults to spacing
+    '''
+    import numpy as np
+    if radius <= 0 or spacing <= 0:
+        raise ValueError('Radius and spacing must be positive')
+    if pointSpacing is None:
+        pointSpacing = spacing
+
+    # r = b * angle. The length along the spiral to an angle is close to b * angle^2 / 2,
+    # so waypoints evenly spaced along it are at angles of sqrt(2 * length / b)
+    b = spacing / (2 * np.pi)
+    end = b * (radius / b) ** 2 / 2
+    angle = np.sqrt(2 * np.append(np.arange(0, end, pointSpacing), end) / b)
+    r = b * angle
+    return toLatLon(r * np.sin(angle), r * np.cos(angle), lat, lon)
+
+
+def transects(lat: float, lon: float, length: float, spacing: float, count: int, heading: float = 0):
+    '''
+    Returns the (lat, lon) arrays of the waypoints of parallel transects, run in alternating directions.
+
+    :param lat, lon: the start of the first transect, in decimal degrees
+    :param length: the length of each transect, in meters
+    :param spacing: the distance between transects, in meters. Each is to the right of the last
+    :param count: the number of transects
+    :param heading: the direction of the first transect, in degrees clockwise from north
+    '''
+    import numpy as np
+    if length <= 0 or count < 1:
+        raise ValueError('Transects need a positive length and count')
+    h = np.radians(heading)
+    offsets = spacing * np.arange(count)
+    backwards = np.arange(count) % 2 == 1
+    starts = np.where(backwards, length, 0.0)
+    ends = np.where(backwards, 0.0, length)
+    pathU = np.column_stack((starts, ends)).ravel()
+    pathV = np.repeat(offsets, 2)
+    return toLatLon(pathU * np.sin(h) + pathV * np.cos(h), pathU * np.cos(h) - pathV * np.sin(h), lat, lon)
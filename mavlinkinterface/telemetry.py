@@ -0,0 +1,104 @@
+from collections import namedtuple     # For derived values
+from threading import Condition         # For waiting on the first value
+
+# value: the derived value, time: the arrival time (datetime) of the oldest source message it was computed from,
+# version: incremented each time the value is recomputed
+derivedValue = namedtuple('derivedValue', ['value', 'time', 'version'])
+
+
+class derivedTelemetry(object):
+    '''
+    Values derived from mavlink messages, computed once on the message refresh thread when one of their
+    source messages arrives, rather than each time they are read. Reading a value is a dictionary lookup.
+
+    messages is the mavlinkInterface.messages dict, whose entries hold 'message', 'time' and 'version'.
+    update is called by the refresh thread after each message is stored, with the messages lock held,
+    so values and the messages they were computed from always match.
+    '''
+
+    def __init__(self, messages: dict, log):
+        self.__messages = messages
+        self.__log = log
+        self.__definitions = {}     # message type -> tuple of (name, sources, compute, args)
+        self.__values = {}          # name -> derivedValue, replaced (never changed) on each update
+        self.__arrived = Condition()
+
+    def register(self, name: str, sources: tuple, compute, args=None) -> None:
+        '''
+        Adds a value computed with compute(*sourceMessages, *args()) whenever one of its sources arrives,
+        once all of them have arrived. Registering a name again replaces it, from the next message.
+
+        :param name: a unique name for the value
+        :param sources: the names of the mavlink messages the value is derived from
+        :param compute: the function that derives the value
+        :param args: <optional> a function returning a tuple of extra inputs (e.g. config values),
+                     called each time the value is computed
+        '''
+        definition = (name, tuple(sources), compute, args)
+        definitions = dict(self.__definitions)
+        for source in definitions:
+            definitions[source] = tuple(d for d in definitions[source] if d[0] != name)
+        for source in sources:
+            definitions[source] = definitions.get(source, ()) + (definition,)
+        # Replace rather than mutate, so the refresh thread can iterate without locking
+        self.__definitions = definitions
+
+    def update(self, messageType: str) -> None:
+        '''Recomputes every value derived from a message type. Called by the refresh thread as each message arrives'''
+        definitions = self.__definitions.get(messageType)
+        if definitions:
+            for definition in definitions:
+                self.__compute(definition)
+
+    def refresh(self, name: str) -> None:
+        '''
+        Recomputes a value straight away, e.g. after a config value it depends on has changed.
+        Call with the messages lock held, as the refresh thread does.
+        '''
+        for definitions in self.__definitions.values():
+            for definition in definitions:
+                if definition[0] == name:
+                    self.__compute(definition)
+                    return
+
+    def get(self, name: str, default=None) -> derivedValue:
+        '''Returns the latest derivedValue of the given name, or default if it has not been computed yet'''
+        return self.__values.get(name, default)
+
+    def wait(self, name: str, timeout: float) -> derivedValue:
+        '''
+        Returns the latest derivedValue of the given name, waiting up to timeout seconds for the first one.
+        Raises a TimeoutError if it has still not been computed.
+        '''
+        value = self.__values.get(name)
+        if value is None:
+            with self.__arrived:
+                self.__arrived.wait_for(lambda: name in self.__values, timeout)
+            value = self.__values.get(name)
+            if value is None:
+                raise TimeoutError('No value for ' + name + ', its source messages have not been received')
+        return value
+
+    def snapshot(self) -> dict:
+        '''Returns every value, keyed by name. Take the messages lock first for values consistent with each other'''
+        return dict(self.__values)
+
+    def __compute(self, definition: tuple) -> None:
+        name, sources, compute, args = definition
+        try:
+            entries = [self.__messages[source] for source in sources]
+        except KeyError:
+            return  # Not every source has arrived yet
+
+        try:
+            value = compute(*(entry['message'] for entry in entries), *(args() if args else ()))
+        except Exception:
+            self.__log.exception('Failed to compute ' + name)
+            return
+
+        previous = self.__values.get(name)
+        self.__values[name] = derivedValue(value, min(entry['time'] for entry in entries),
+                                           1 if previous is None else previous.version + 1)
+        if previous is None:
+            with self.__arrived:
+                self.__arrived.notify_all()